@@ -11,7 +11,7 @@ from gym import spaces
 from ..printing import red, blue, yellow, green, cyan, purple
 from ..utils import blockedrange, offset_nzis_from_position
 from .objects import \
-    BreakoutObject, Ball, Paddle, Wall, \
+    BreakoutObject, Ball, Paddle, Wall, AcceleratorBrick, \
     PaddleShrinkingWall, WallOfPunishment, MoveableObject, MomentumObject
 from .constants import \
     _MAX_SPEED, ALLOW_BOUNCE_AGAINST_PHYSICS, CLASSIC_BACKGROUND_COLOR, \
@@ -49,6 +49,19 @@ class BreakoutEngine(gym.Env):
     metadata = {'render.modes': ['human', 'rgb_array']}
     reward_range = (-1, 1)
 
+    # Value of the occupancy grid in pixels not covered by any object
+    EMPTY_CELL = -1
+
+    # Columns of the entity matrix (see `return_state_as_entity_matrix`)
+    ENTITY_COLUMNS = BALL_COLUMN, PADDLE_COLUMN, WALL_COLUMN, BRICK_COLUMN, \
+        VOID_COLUMN = tuple(range(5))
+
+    # Attributes captured by `snapshot`, in addition to the game objects.
+    # Subclasses with more mutable attributes should extend this.
+    SNAPSHOT_ATTRIBUTES = ('num_lives', '_ball_movement_radius',
+                           'current_episode_frame', 'brick_hit_counter',
+                           'reward', 'done')
+
     ###########################################################################
     # Game setup
     ###########################################################################
@@ -84,6 +97,8 @@ class BreakoutEngine(gym.Env):
                  report_outer_walls_as_entities=False,
                  bottom_wall_of_punishment=True,
                  return_state_as_image=False,
+                 return_state_as_entity_matrix=False,
+                 report_debug_info=True,
                  ):
         """
         General Parameters
@@ -164,6 +179,14 @@ class BreakoutEngine(gym.Env):
         return_state_as_image : bool
             If True, the state returned as every step is the image of the game.
             Otherwise, it's a sparsified form of the image (states dictionary).
+        return_state_as_entity_matrix : bool
+            If True, the state returned at every step is the entity matrix
+            (see `build_entity_matrix`), maintained incrementally instead of
+            building the states dictionary.
+        report_debug_info : bool
+            If False, the debug_info returned at every step is empty instead
+            of holding the entity states, which are then not computed at all
+            unless they are the returned state.
         """
 
         self.width = width
@@ -185,6 +208,8 @@ class BreakoutEngine(gym.Env):
         self.report_outer_walls_as_entities = report_outer_walls_as_entities
         self.bottom_wall_of_punishment = bottom_wall_of_punishment
         self.return_state_as_image = return_state_as_image
+        self.return_state_as_entity_matrix = return_state_as_entity_matrix
+        self.report_debug_info = report_debug_info
         self.debugging = debugging
         self.reset_has_never_been_called = True
 
@@ -223,6 +248,8 @@ class BreakoutEngine(gym.Env):
             assert 0 <= abs(velocity[1]) <= _MAX_SPEED
 
         assert self.report_nzis_as_entities in ('all', 'edges', 'none')
+        assert not (self.return_state_as_image and
+                    self.return_state_as_entity_matrix)
         assert len(self.paddle_speed_distribution) == 2 * self.paddle_speed + 1
         assert np.isclose(np.sum(self.paddle_speed_distribution), 1.0)
         assert 0 <= self.bounce_stochasticity <= 1
@@ -304,6 +331,7 @@ class BreakoutEngine(gym.Env):
         self.layout()
         self.layout_sanity_check()
         self.randomize_paddle_position()
+        self.build_occupancy_grid()
         self.randomize_ball_position_and_velocity()
 
         # Build unique mapping of color -> ID at the beginning of the game
@@ -322,6 +350,9 @@ class BreakoutEngine(gym.Env):
         # Initially observed state
         if self.return_state_as_image:
             state = self._get_image()
+        elif self.return_state_as_entity_matrix:
+            self.build_entity_matrix()
+            state = self.entity_matrix.copy()
         else:
             state = self.get_entity_states()
 
@@ -398,6 +429,8 @@ class BreakoutEngine(gym.Env):
                 self.debugprint_line('destruction')
                 collided_object._destruction_effect(self)
 
+        self.sync_occupancy_grid(self.hit_objects)
+
         # Step 3: Update moving obstacles positions
         #######################################################################
         for obstacle in self.miscellaneous:
@@ -405,23 +438,22 @@ class BreakoutEngine(gym.Env):
                 ox, oy = obstacle.position
                 vx, vy = obstacle.velocity
 
-                new_nzis_pos = set(offset_nzis_from_position(
-                    obstacle.nzis, (ox + vx, oy + vy)))
-                new_nzis_neg = set(offset_nzis_from_position(
-                    obstacle.nzis, (ox - vx, oy - vy)))
-
-                occupied_positions = self.occupied_by(exclude=([obstacle] +
-                                                               self.balls))
+                new_nzis_pos = offset_nzis_from_position(
+                    obstacle.nzis, (ox + vx, oy + vy))
+                new_nzis_neg = offset_nzis_from_position(
+                    obstacle.nzis, (ox - vx, oy - vy))
 
                 # Excluding ball and paddle!
-                if not (new_nzis_pos & set(occupied_positions)):
+                if self.is_free_for(obstacle, new_nzis_pos):
                     obstacle.position = ox + vx, oy + vy
-                elif not (new_nzis_neg & set(occupied_positions)):
+                elif self.is_free_for(obstacle, new_nzis_neg):
                     obstacle.position = ox - vx, oy - vy
                     obstacle.velocity = -vx, -vy
                 else:
                     pass
 
+                self.update_occupancy(obstacle)
+
         # Step 4: Update paddle position
         #######################################################################
         self.update_paddle_position(action)
@@ -433,20 +465,29 @@ class BreakoutEngine(gym.Env):
                 self.debugprint_line('conditional event', event)
                 event.trigger(self)
 
+        self.sync_occupancy_grid()
+
         # Step 6: Cleanup and return
         #######################################################################
         self.current_episode_frame += 1
         self.end_game_manager()  # should set self.done!
         assert self.done is not None
 
-        debug_info = {
-            'entity_states':  self.get_entity_states(),
-        }
-
         if self.return_state_as_image:
             state = self._get_image()
+        elif self.return_state_as_entity_matrix:
+            self.sync_entity_matrix(self.hit_objects)
+            state = self.entity_matrix.copy()
         else:
-            state = debug_info['entity_states']
+            state = self.get_entity_states()
+
+        debug_info = {}
+        if self.report_debug_info:
+            if self.return_state_as_image or \
+               self.return_state_as_entity_matrix:
+                debug_info['entity_states'] = self.get_entity_states()
+            else:
+                debug_info['entity_states'] = state
 
         # Constrain reward to be in {-1, 0, 1}
         self.reward = np.clip(self.reward, -1, 1)
@@ -592,6 +633,192 @@ class BreakoutEngine(gym.Env):
         return {nzi for obj in objects for nzi in obj.offset_nzis
                 if obj not in exclude and obj.visible}
 
+    def build_occupancy_grid(self):
+        """
+        Build from scratch the occupancy grid, i.e., the (width, height) array
+        holding at each pixel the `object_id` of the tangible object covering
+        it, or EMPTY_CELL. Tangible objects are all the visible objects but
+        the balls. The grid is then kept up to date incrementally during
+        `step`, so that collision detection does not need to gather the pixels
+        of every object in the game at each time step.
+
+        Pixels covered by several objects (e.g. corners where border walls
+        meet) hold the id of one of them; the number of objects covering each
+        pixel is tracked separately in `self.n_occupants`, and the ids of all
+        of them in `self._shared_cells`.
+        """
+        self.occupancy = np.full((self.width, self.height), self.EMPTY_CELL,
+                                 dtype=np.int32)
+        self.n_occupants = np.zeros((self.width, self.height), dtype=np.uint8)
+
+        # object_id -> object, for all objects currently in the grid
+        self._grid_objects = {}
+        # object_id -> (offset_nzis written in the grid, their coordinates)
+        self._grid_footprints = {}
+        # (x, y) -> [object_id] for pixels covered by several objects
+        self._shared_cells = {}
+        # Bricks may be replaced altogether by layout-changing effects
+        self._grid_bricks = self.bricks
+
+        for obj in (self.walls + self.bricks + self.miscellaneous +
+                    [self.paddle]):
+            self.update_occupancy(obj)
+
+    def update_occupancy(self, obj, in_game=True):
+        """
+        Rewrite the pixels of an object in the occupancy grid if its position,
+        shape or visibility has changed since it was last written.
+
+        Parameters
+        ----------
+        obj : BreakoutObject
+            Tangible object, i.e., anything but a ball.
+        in_game : bool
+            Whether the object is still in the game. If False, the object is
+            removed from the grid.
+        """
+        object_id = obj.object_id
+
+        # Cached offset nzis are recomputed whenever the position or the nzis
+        # of the object change, so comparing them by identity is enough.
+        footprint = obj.offset_nzis if in_game and obj.visible else None
+
+        old_footprint, old_cells = \
+            self._grid_footprints.get(object_id, (None, None))
+        if footprint is old_footprint:
+            return
+
+        if old_footprint is not None:
+            self._clear_cells(object_id, old_cells)
+            del self._grid_footprints[object_id]
+            del self._grid_objects[object_id]
+
+        if footprint is None:
+            return
+
+        error_msg = "Objects in the game must have unique object IDs!"
+        assert object_id not in self._grid_objects, error_msg
+
+        cells = tuple(np.array(footprint).T)
+        occupants = self.occupancy[cells]
+        shared = self.n_occupants[cells] > 0
+
+        self.occupancy[cells] = np.where(shared, occupants, object_id)
+        self.n_occupants[cells] += 1
+
+        for x, y, other_id in zip(cells[0][shared], cells[1][shared],
+                                  occupants[shared]):
+            self._shared_cells.setdefault((int(x), int(y)),
+                                          [int(other_id)]).append(object_id)
+
+        self._grid_footprints[object_id] = (footprint, cells)
+        self._grid_objects[object_id] = obj
+
+    def _clear_cells(self, object_id, cells):
+        """
+        Helper method that removes an object from its pixels in the occupancy
+        grid, handing over pixels it shared to another object covering them.
+        """
+        occupants = self.occupancy[cells]
+        self.n_occupants[cells] -= 1
+        self.occupancy[cells] = np.where(occupants == object_id,
+                                         self.EMPTY_CELL, occupants)
+
+        shared = self.n_occupants[cells] > 0
+        for x, y in zip(cells[0][shared], cells[1][shared]):
+            other_ids = self._shared_cells[int(x), int(y)]
+            other_ids.remove(object_id)
+            self.occupancy[x, y] = other_ids[0]
+
+            if len(other_ids) == 1:
+                del self._shared_cells[int(x), int(y)]
+
+    def sync_occupancy_grid(self, changed_objects=()):
+        """
+        Bring the occupancy grid up to date after game objects may have been
+        changed, destroyed or replaced, e.g., by collision effects or
+        conditional events. The paddle is always checked.
+
+        Parameters
+        ----------
+        changed_objects : [BreakoutObject]
+            Objects (other than the paddle) that may have changed.
+        """
+        if self.bricks is not self._grid_bricks:
+            self.build_occupancy_grid()
+            return
+
+        for obj in changed_objects:
+            in_game = (obj in self.bricks or obj in self.miscellaneous or
+                       obj in self.walls)
+            self.update_occupancy(obj, in_game=in_game)
+
+        self.update_occupancy(self.paddle)
+
+    def is_occupied(self, position):
+        """
+        Is that pixel covered by a tangible object (see
+        `build_occupancy_grid`)?
+
+        Parameters
+        ----------
+        position : (int, int)
+
+        Returns
+        -------
+        bool
+        """
+        x, y = position
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return False
+        return self.occupancy[x, y] != self.EMPTY_CELL
+
+    def get_occupants(self, position):
+        """
+        Look up the tangible objects (see `build_occupancy_grid`) covering a
+        pixel in the occupancy grid.
+
+        Parameters
+        ----------
+        position : (int, int)
+
+        Returns
+        -------
+        [BreakoutObject]
+        """
+        if not self.is_occupied(position):
+            return []
+
+        x, y = position
+        if self.n_occupants[x, y] == 1:
+            return [self._grid_objects[int(self.occupancy[x, y])]]
+        else:
+            return [self._grid_objects[object_id]
+                    for object_id in self._shared_cells[int(x), int(y)]]
+
+    def is_free_for(self, obj, nzis):
+        """
+        Are these pixels free of tangible objects other than `obj`?
+
+        Parameters
+        ----------
+        obj : BreakoutObject
+        nzis : [(int, int)]
+            Pixel coordinates, e.g., offset nzis of obj after a move.
+
+        Returns
+        -------
+        bool
+        """
+        xs, ys = np.array(nzis).T
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        cells = xs[inside], ys[inside]
+
+        occupants = self.occupancy[cells]
+        return bool(np.all((occupants == self.EMPTY_CELL) |
+                           ((occupants == obj.object_id) &
+                            (self.n_occupants[cells] == 1))))
+
     @property
     def accessible_domain(self):
         """
@@ -726,19 +953,7 @@ class BreakoutEngine(gym.Env):
             proxy.
         """
         parsed_pixels = []
-
-        # Filter valid NZIs
-        if self.report_nzis_as_entities == 'all':
-            reported_nzis = breakout_object.offset_nzis
-        elif self.report_nzis_as_entities == 'edges':
-            reported_nzis = breakout_object.offset_edge_nzis
-        elif self.report_nzis_as_entities == 'none':
-            dr, dc = breakout_object.shape
-            r, c = breakout_object.position
-            reported_nzis = [(r + dr//2, c + dc//2)]
-        else:
-            raise ValueError("Invalid parameter: %s" %
-                             self.report_nzis_as_entities)
+        reported_nzis = self.get_reported_nzis(breakout_object)
 
         eid = breakout_object.entity_id
 
@@ -764,6 +979,32 @@ class BreakoutEngine(gym.Env):
 
         return parsed_pixels
 
+    def get_reported_nzis(self, breakout_object):
+        """
+        Pixels of an object that are reported as separate entities, depending
+        on `report_nzis_as_entities`.
+
+        Parameters
+        ----------
+        breakout_object : BreakoutObject
+
+        Returns
+        -------
+        [(int, int)]
+            Reported pixels in the (x, y) format.
+        """
+        if self.report_nzis_as_entities == 'all':
+            return breakout_object.offset_nzis
+        elif self.report_nzis_as_entities == 'edges':
+            return breakout_object.offset_edge_nzis
+        elif self.report_nzis_as_entities == 'none':
+            dr, dc = breakout_object.shape
+            r, c = breakout_object.position
+            return [(r + dr//2, c + dc//2)]
+        else:
+            raise ValueError("Invalid parameter: %s" %
+                             self.report_nzis_as_entities)
+
     def get_entity_states(self):
         """
         Entity states that we may resonably expect a computer vision system to
@@ -815,6 +1056,124 @@ class BreakoutEngine(gym.Env):
 
         return entity_states
 
+    def build_entity_matrix(self):
+        """
+        Build from scratch the entity matrix: the (height * width, 5) boolean
+        matrix with a row per pixel, in the row-major order of the (row,
+        column) coordinates of entity states (see `xy2rc`), and a column per
+        kind of object in ENTITY_COLUMNS. A bit is raised if some pixel of
+        that kind of object is reported as an entity at that position, and
+        the VOID_COLUMN bit is raised for pixels reporting no entity.
+        Miscellaneous objects are not reported.
+
+        The matrix is then kept up to date incrementally during `step`, which
+        is much faster than parsing the entity states dictionary.
+        """
+        n_pixels = self.width * self.height
+        self._entity_counts = np.zeros((n_pixels, self.VOID_COLUMN),
+                                       dtype=np.uint8)
+        self.entity_matrix = np.zeros((n_pixels, len(self.ENTITY_COLUMNS)),
+                                      dtype=bool)
+        self.entity_matrix[:, self.VOID_COLUMN] = True
+
+        # object_id -> (offset_nzis at last update, rows, column, object)
+        self._matrix_footprints = {}
+        # object_id -> ball, for balls currently in the matrix
+        self._matrix_balls = {}
+        self._matrix_bricks = self.bricks
+
+        for ball in self.balls:
+            self.update_entity_pixels(ball, self.BALL_COLUMN)
+        self.update_entity_pixels(self.paddle, self.PADDLE_COLUMN)
+        for wall in self.walls:
+            self.update_entity_pixels(wall, self.WALL_COLUMN)
+        for brick in self.bricks:
+            self.update_entity_pixels(brick, self.BRICK_COLUMN)
+
+    def update_entity_pixels(self, obj, column, in_game=True):
+        """
+        Rewrite the pixels reported by an object in the entity matrix if its
+        position or shape has changed since it was last written.
+
+        Parameters
+        ----------
+        obj : BreakoutObject
+        column : int
+            Column of the entity matrix for that kind of object.
+        in_game : bool
+            Whether the object is still in the game. If False, the object is
+            removed from the matrix.
+        """
+        object_id = obj.object_id
+
+        # See `update_occupancy` about comparing offset nzis by identity
+        footprint = obj.offset_nzis if in_game and obj.is_entity else None
+
+        old_footprint, old_rows, _, _ = \
+            self._matrix_footprints.get(object_id, (None, None, None, None))
+        if footprint is old_footprint:
+            return
+
+        changed_rows = []
+        if old_footprint is not None:
+            self._entity_counts[old_rows, column] -= 1
+            changed_rows.append(old_rows)
+            del self._matrix_footprints[object_id]
+            self._matrix_balls.pop(object_id, None)
+
+        if footprint is not None:
+            xs, ys = np.array(self.get_reported_nzis(obj)).T
+            rows = (self.height - 1 - ys) * self.width + xs
+            self._entity_counts[rows, column] += 1
+            changed_rows.append(rows)
+
+            self._matrix_footprints[object_id] = (footprint, rows, column, obj)
+            if column == self.BALL_COLUMN:
+                self._matrix_balls[object_id] = obj
+
+        rows = np.concatenate(changed_rows)
+        self.entity_matrix[rows, column] = self._entity_counts[rows, column] > 0
+        self.entity_matrix[rows, self.VOID_COLUMN] = \
+            ~self.entity_matrix[rows, :self.VOID_COLUMN].any(axis=1)
+
+    def sync_entity_matrix(self, changed_objects=()):
+        """
+        Bring the entity matrix up to date at the end of a time step. Balls
+        and the paddle are always checked, walls never change.
+
+        Parameters
+        ----------
+        changed_objects : [BreakoutObject]
+            Other objects that may have changed, e.g., hit bricks.
+        """
+        for obj in changed_objects:
+            entry = self._matrix_footprints.get(obj.object_id)
+            if entry is not None and entry[2] == self.BRICK_COLUMN:
+                self.update_entity_pixels(obj, self.BRICK_COLUMN,
+                                          in_game=obj in self.bricks)
+
+        # Bricks may be replaced altogether by layout-changing effects
+        if self.bricks is not self._matrix_bricks:
+            brick_ids = {brick.object_id for brick in self.bricks}
+            for object_id, (_, _, column, obj) in \
+                    list(self._matrix_footprints.items()):
+                if column == self.BRICK_COLUMN and object_id not in brick_ids:
+                    self.update_entity_pixels(obj, column, in_game=False)
+
+            for brick in self.bricks:
+                self.update_entity_pixels(brick, self.BRICK_COLUMN)
+            self._matrix_bricks = self.bricks
+
+        ball_ids = {ball.object_id for ball in self.balls}
+        for object_id, ball in list(self._matrix_balls.items()):
+            if object_id not in ball_ids:
+                self.update_entity_pixels(ball, self.BALL_COLUMN,
+                                          in_game=False)
+
+        for ball in self.balls:
+            self.update_entity_pixels(ball, self.BALL_COLUMN)
+        self.update_entity_pixels(self.paddle, self.PADDLE_COLUMN)
+
     ###########################################################################
     # Game dynamics
     ###########################################################################
@@ -870,14 +1229,11 @@ class BreakoutEngine(gym.Env):
         vx_after_paddle_bounce = \
             self.get_ball_vx_after_paddle_bounce(bx, by, vx, vy, action)
 
-        intangible = [obj for obj in self.walls
-                      if isinstance(obj, WallOfPunishment)] + self.balls
-        occupied_positions = self.occupied_by(exclude=intangible)
-
+        # Walls of punishment are invisible, hence not in the occupancy grid
         self.hit_objects |= self.get_collision_elements((bx + vx, by + vy))
 
         # [Emptiness]
-        if (bx + vx, by + vy) not in occupied_positions and \
+        if not self.is_occupied((bx + vx, by + vy)) and \
            vx_after_paddle_bounce is None:
 
             self.debugprint_line('ball physics', 0, vx_after_paddle_bounce)
@@ -902,13 +1258,13 @@ class BreakoutEngine(gym.Env):
             ball.velocity_index = self.velocity_to_index[(vx, vy)]
             ball.position = vx + bx, vy + by
 
-            if (vx + bx, vy + by) in occupied_positions:
+            if self.is_occupied((vx + bx, vy + by)):
                 vx *= -1
                 ball.velocity_index = self.velocity_to_index[(vx, vy)]
                 ball.position = vx + bx, vy + by
 
         # [Bounce, brick or wall]
-        elif (bx + vx, by) in occupied_positions:
+        elif self.is_occupied((bx + vx, by)):
             self.debugprint_line('ball physics', 2, vx_after_paddle_bounce)
 
             vx *= -1
@@ -918,7 +1274,7 @@ class BreakoutEngine(gym.Env):
             ball.position = vx + bx, vy + by
 
         # [Bounce, brick or wall]
-        elif (bx, by + vy) in occupied_positions:
+        elif self.is_occupied((bx, by + vy)):
             self.debugprint_line('ball physics', 3, vx_after_paddle_bounce)
 
             vy *= -1
@@ -937,7 +1293,7 @@ class BreakoutEngine(gym.Env):
         # Step B: Check where we landed, manage any higher-order collisions
         #######################################################################
         vx, vy = self.index_to_velocity[ball.velocity_index]
-        if tuple(ball.position) in occupied_positions:
+        if self.is_occupied(ball.position):
             self.debugprint_line('higher-order collision')
 
             # -----------------------------------------------------------------
@@ -1059,20 +1415,13 @@ class BreakoutEngine(gym.Env):
         """
         set_hit_objects = set()
 
-        for brick in self.bricks:
-            if brick.visible and brick.contains_position(ball_position):
-                if not is_indirect or brick.indirect_collision_effects:
-                    set_hit_objects |= {brick}
-
-        for wall in self.walls:
-            if wall.visible and wall.contains_position(ball_position):
-                if not is_indirect or wall.indirect_collision_effects:
-                    set_hit_objects |= {wall}
-
-        for misc in self.miscellaneous:
-            if misc.visible and misc.contains_position(ball_position):
-                if not is_indirect or misc.indirect_collision_effects:
-                    set_hit_objects |= {misc}
+        # Bricks, walls and miscellaneous objects are looked up in the
+        # occupancy grid, which holds only visible objects.
+        for obj in self.get_occupants(ball_position):
+            if obj is self.paddle:
+                continue
+            if not is_indirect or obj.indirect_collision_effects:
+                set_hit_objects |= {obj}
 
         return set_hit_objects
 
@@ -1294,9 +1643,11 @@ class BreakoutEngine(gym.Env):
                 ball.position = (x, y)
 
                 ###############################################################
-                occupied_positions = self.occupied_by(exclude={ball})
+                other_balls = [tuple(other.position) for other in self.balls
+                               if other is not ball and other.visible]
 
-                if tuple(ball.position) not in occupied_positions:
+                if not self.is_occupied(ball.position) and \
+                   tuple(ball.position) not in other_balls:
                     if self.debugging:
                         print (\
                             purple("Ball-paddle separation at collision:"), \
@@ -1304,6 +1655,130 @@ class BreakoutEngine(gym.Env):
                             purple("vertically when |v[y]| = %i" % _MAX_SPEED))
                     break
 
+    ###########################################################################
+    # State snapshots
+    ###########################################################################
+
+    def snapshot(self):
+        """
+        Capture the mutable state of the game: balls, paddle, bricks and
+        miscellaneous objects present in the game and their mutable
+        attributes, SNAPSHOT_ATTRIBUTES (lives, counters, ...), the state of
+        conditional events and the state of the random generators. Game
+        objects are referenced, not copied, so taking a snapshot is cheap.
+
+        Returns
+        -------
+        snapshot : dict
+            State to be passed to `restore`.
+        """
+        if self.reset_has_never_been_called:
+            raise ResetHasNeverBeenCalledError
+
+        return {
+            'attributes': {name: getattr(self, name)
+                           for name in self.SNAPSHOT_ATTRIBUTES
+                           if hasattr(self, name)},
+            'balls': [(ball, tuple(ball.position), ball.velocity_index)
+                      for ball in self.balls],
+            'lost_balls': [(ball, tuple(ball.position), ball.velocity_index)
+                           for ball in self.lost_balls],
+            'paddle': (self.paddle, tuple(self.paddle.position),
+                       self.paddle.nzis, self.paddle.visible),
+            'bricks': [(brick, brick.hitpoints, brick.visible, brick.color)
+                       for brick in self.bricks],
+            'miscellaneous': [(obj, tuple(obj.position),
+                               getattr(obj, 'velocity', None), obj.visible)
+                              for obj in self.miscellaneous],
+            'events': [copy.copy(event.__dict__)
+                       for event in self.conditional_events],
+            'trigger_counts': (AcceleratorBrick.trigger_counter,
+                               PaddleShrinkingWall.trigger_count),
+            'random_state': random.getstate(),
+            'np_random_state': np.random.get_state(),
+        }
+
+    def restore(self, snapshot):
+        """
+        Bring the game back to a state captured by `snapshot`. The occupancy
+        grid and the entity matrix are updated only for the objects that may
+        have changed.
+
+        Parameters
+        ----------
+        snapshot : dict
+            Return value of `snapshot`.
+        """
+        for name, value in snapshot['attributes'].items():
+            setattr(self, name, value)
+
+        self.balls = []
+        self.lost_balls = []
+        for balls, key in ((self.balls, 'balls'),
+                           (self.lost_balls, 'lost_balls')):
+            for ball, position, velocity_index in snapshot[key]:
+                ball.position = position
+                ball.velocity_index = velocity_index
+                balls.append(ball)
+
+        old_paddle = self.paddle
+        self.paddle, position, nzis, visible = snapshot['paddle']
+        self.paddle.position = position
+        self.paddle.visible = visible
+        if self.paddle.nzis is not nzis:
+            self.paddle.nzis = nzis
+
+        # Lists are mutated in place, since the occupancy grid and the entity
+        # matrix keep track of the brick list itself.
+        old_objects = self.bricks + self.miscellaneous
+
+        self.bricks[:] = [brick for brick, _, _, _ in snapshot['bricks']]
+        for brick, hitpoints, visible, color in snapshot['bricks']:
+            brick.hitpoints = hitpoints
+            brick.visible = visible
+            brick.color = color
+
+        self.miscellaneous[:] = [obj for obj, _, _, _
+                                 in snapshot['miscellaneous']]
+        for obj, position, velocity, visible in snapshot['miscellaneous']:
+            obj.position = position
+            obj.visible = visible
+            if velocity is not None:
+                obj.velocity = velocity
+
+        for event, state in zip(self.conditional_events, snapshot['events']):
+            event.__dict__.update(state)
+
+        AcceleratorBrick.trigger_counter, PaddleShrinkingWall.trigger_count = \
+            snapshot['trigger_counts']
+        random.setstate(snapshot['random_state'])
+        np.random.set_state(snapshot['np_random_state'])
+
+        # Update derived structures
+        #######################################################################
+        in_game = {id(obj) for obj in self.bricks + self.miscellaneous}
+        removed_objects = [obj for obj in old_objects
+                           if id(obj) not in in_game]
+        if old_paddle is not self.paddle:
+            removed_objects.append(old_paddle)
+
+        for obj in removed_objects:
+            self.update_occupancy(obj, in_game=False)
+        for obj in self.bricks + self.miscellaneous + [self.paddle]:
+            self.update_occupancy(obj)
+
+        if self.return_state_as_entity_matrix:
+            for obj in removed_objects:
+                if obj is old_paddle:
+                    self.update_entity_pixels(obj, self.PADDLE_COLUMN,
+                                              in_game=False)
+                else:
+                    self.update_entity_pixels(obj, self.BRICK_COLUMN,
+                                              in_game=False)
+            for brick in self.bricks:
+                self.update_entity_pixels(brick, self.BRICK_COLUMN)
+            self.sync_entity_matrix()
+
     ###########################################################################
     # Helper methods
     ###########################################################################
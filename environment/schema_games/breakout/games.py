@@ -296,6 +296,9 @@ class RandomTargetBreakout(StandardBreakout):
     """
     A single target appears and respawns each time it is hit.
     """
+    SNAPSHOT_ATTRIBUTES = StandardBreakout.SNAPSHOT_ATTRIBUTES + \
+        ('block_x', 'block_y')
+
     def __init__(self,
                  num_bricks=(2, 4),
                  *args, **kwargs):
@@ -0,0 +1,471 @@
+import random
+
+import numpy as np
+
+from .constants import _MAX_SPEED
+from .core import BreakoutEngine
+from .games import StandardBreakout
+
+
+###############################################################################
+# Batch of games
+###############################################################################
+
+class VectorBreakout(object):
+    """
+    Batch of StandardBreakout games stepped in lockstep. Instead of game
+    objects, the state of the games is held in arrays (ball positions and
+    velocities, paddle positions, masks of bricks still alive, lives), and
+    the physics of BreakoutEngine is applied to all games at once with array
+    operations. Observations are stacked entity matrices (see
+    `BreakoutEngine.build_entity_matrix`).
+
+    The static layout (walls, bricks, paddle shape) is taken from a template
+    StandardBreakout built with the same parameters. Only one ball per game is
+    supported. Since _MAX_SPEED == 1, the ball movement radius never changes
+    (accelerator bricks and BallAcceleratesEvent have no effect) and bounce
+    randomization cannot change the velocity of the ball unless bounces
+    against physics are allowed, so neither is simulated.
+    """
+    ACTIONS = NOOP, LEFT, RIGHT = BreakoutEngine.ACTIONS
+
+    def __init__(self, num_games, seed=None, **kwargs):
+        """
+        Parameters
+        ----------
+        num_games : int
+            Number of games in the batch.
+        seed : int or None
+            Seed of the random generator of the batch, used for ball respawns
+            and paddle moves.
+        kwargs : dict
+            Parameters of StandardBreakout. Entities have to be reported with
+            all their nzis.
+        """
+        error_msg = "VectorBreakout assumes _MAX_SPEED == 1"
+        assert _MAX_SPEED == 1, error_msg
+
+        kwargs = dict(kwargs, report_nzis_as_entities='all',
+                      return_state_as_entity_matrix=True,
+                      report_debug_info=False)
+        self.template = self._build_template(kwargs)
+        template = self.template
+
+        assert template.num_balls == 1
+        assert template.ball_movement_radius == 1
+        assert not template.allow_bounce_against_physics or \
+            template.bounce_stochasticity == 0
+
+        self.num_games = num_games
+        self.width = template.width
+        self.height = template.height
+        self.wall_thickness = template.wall_thickness
+        self.num_lives = template.reset_mutables['num_lives']
+        self.paddle_speed = template.paddle_speed
+        self.paddle_speed_distribution = template.paddle_speed_distribution
+        self.paddle_starting_position = template.paddle_starting_position
+        self.reward_upon_ball_loss = template.reward_upon_ball_loss
+        self.reward_upon_no_bricks_left = template.reward_upon_no_bricks_left
+        self.random_state = np.random.RandomState(seed)
+
+        # Static layout
+        #######################################################################
+        self.is_wall = np.zeros((self.width, self.height), dtype=bool)
+        for wall in template.walls:
+            if wall.visible:
+                for x, y in wall.offset_nzis:
+                    self.is_wall[x, y] = True
+
+        # Index of the brick covering each pixel, or -1
+        self.brick_at = np.full((self.width, self.height), -1, dtype=np.int32)
+        for brick_idx, brick in enumerate(template.bricks):
+            for x, y in brick.offset_nzis:
+                self.brick_at[x, y] = brick_idx
+
+        self.brick_positions = np.array([brick.position
+                                         for brick in template.bricks])
+        self.brick_rewards = np.array([brick.reward
+                                       for brick in template.bricks])
+        self.brick_bottoms = np.array([brick.position[1] + brick.nzis_min[1]
+                                       for brick in template.bricks])
+        self.brick_rows = np.array([self._get_rows(brick.offset_nzis)
+                                    for brick in template.bricks])
+
+        self.paddle_shape = np.array(template.paddle.shape)
+        self.paddle_nzis = np.array(template.paddle.nzis)
+        self.paddle_y = template.paddle.position[1]
+        self.paddle_bounce_speed = \
+            abs(template.get_paddle_response_function()[0])
+
+        self.wall_column = \
+            template.entity_matrix[:, BreakoutEngine.WALL_COLUMN].copy()
+
+        # Game states
+        #######################################################################
+        self.ball_positions = np.zeros((num_games, 2), dtype=np.int64)
+        self.ball_velocities = np.zeros((num_games, 2), dtype=np.int64)
+        self.paddle_positions = np.zeros((num_games, 2), dtype=np.int64)
+        self.bricks_alive = np.zeros((num_games, len(template.bricks)),
+                                     dtype=bool)
+        self.lives = np.zeros(num_games, dtype=np.int64)
+        self.brick_hit_counters = np.zeros(num_games, dtype=np.int64)
+        self.current_episode_frames = np.zeros(num_games, dtype=np.int64)
+
+    @staticmethod
+    def _build_template(kwargs):
+        """
+        Helper method that lays out a template game, leaving the global random
+        generators used by the engine untouched.
+        """
+        random_state = random.getstate()
+        np_random_state = np.random.get_state()
+        try:
+            template = StandardBreakout(**kwargs)
+            template.reset()
+        finally:
+            random.setstate(random_state)
+            np.random.set_state(np_random_state)
+        return template
+
+    def _get_rows(self, nzis):
+        """
+        Helper method that converts (x, y) pixels into entity matrix rows.
+        """
+        xs, ys = np.array(nzis).T
+        return (self.height - 1 - ys) * self.width + xs
+
+    ###########################################################################
+    # API methods
+    ###########################################################################
+
+    def reset(self, mask=None):
+        """
+        Starts new games.
+
+        Parameters
+        ----------
+        mask : numpy.ndarray([bool]) or None
+            Games to reset, all of them if None.
+
+        Returns
+        -------
+        entity_matrices : numpy.ndarray[:, :, :] (dtype=bool)
+            Stacked entity matrices of all the games.
+        """
+        mask = np.ones(self.num_games, dtype=bool) if mask is None else mask
+        n_reset = np.count_nonzero(mask)
+
+        self.bricks_alive[mask] = True
+        self.lives[mask] = self.num_lives
+        self.brick_hit_counters[mask] = 0
+        self.current_episode_frames[mask] = -1
+
+        low, high = self.get_accessible_domain()
+        if self.paddle_starting_position[0] is not None:
+            px = np.full(n_reset, self.paddle_starting_position[0])
+        else:
+            px = self.random_state.randint(low, high + 1, size=n_reset)
+        self.paddle_positions[mask] = np.stack(
+            (px, np.full(n_reset, self.paddle_y)), axis=1)
+
+        self.randomize_ball_positions_and_velocities(mask)
+
+        return self.get_entity_matrices()
+
+    def load_games(self, envs, indices=None):
+        """
+        Copies the current state of single games into the batch, e.g. to
+        evaluate plans from a game being played.
+
+        Parameters
+        ----------
+        envs : [StandardBreakout]
+            Games laid out with the same parameters as the template.
+        indices : [int] or None
+            Indices of the games in the batch to overwrite, the first
+            len(envs) ones if None.
+        """
+        indices = range(len(envs)) if indices is None else indices
+        brick_indices = {tuple(position): brick_idx for brick_idx, position
+                         in enumerate(self.brick_positions)}
+
+        for game_idx, env in zip(indices, envs):
+            assert len(env.balls) == 1
+            assert np.array_equal(env.paddle.shape, self.paddle_shape)
+            ball = env.balls[0]
+
+            self.ball_positions[game_idx] = ball.position
+            self.ball_velocities[game_idx] = \
+                env.index_to_velocity[ball.velocity_index]
+            self.paddle_positions[game_idx] = env.paddle.position
+
+            self.bricks_alive[game_idx] = False
+            for brick in env.bricks:
+                brick_idx = brick_indices[tuple(brick.position)]
+                self.bricks_alive[game_idx, brick_idx] = True
+
+            self.lives[game_idx] = env.num_lives
+            self.brick_hit_counters[game_idx] = env.brick_hit_counter
+            self.current_episode_frames[game_idx] = env.current_episode_frame
+
+    def step(self, actions):
+        """
+        Steps all the games, following BreakoutEngine._step.
+
+        Parameters
+        ----------
+        actions : numpy.ndarray([int])
+            Action of each game.
+
+        Returns
+        -------
+        entity_matrices : numpy.ndarray[:, :, :] (dtype=bool)
+            Stacked entity matrices of all the games.
+        rewards : numpy.ndarray([float])
+            Reward of each game, in {-1, 0, 1}.
+        dones : numpy.ndarray([bool])
+            Whether each game is over. Finished games have to be reset by the
+            caller.
+        """
+        actions = np.asarray(actions)
+        assert actions.shape == (self.num_games,)
+
+        rewards = np.zeros(self.num_games)
+
+        # Step 1: ball physics
+        hit_bricks = self._resolve_ball_physics(actions)
+
+        # Step 2: brick destruction
+        is_hit = hit_bricks >= 0
+        hit_games = np.flatnonzero(is_hit)
+        self.bricks_alive[hit_games, hit_bricks[is_hit]] = False
+        rewards[is_hit] += self.brick_rewards[hit_bricks[is_hit]]
+        self.brick_hit_counters[is_hit] += 1
+
+        # Step 4: paddle positions
+        self.update_paddle_positions(actions)
+
+        # Step 6: cleanup
+        self.current_episode_frames += 1
+        dones = self._end_game_manager(rewards)
+
+        return self.get_entity_matrices(), np.clip(rewards, -1, 1), dones
+
+    ###########################################################################
+    # Game dynamics
+    ###########################################################################
+
+    def get_accessible_domain(self):
+        """
+        Range of valid horizontal positions for the paddle.
+        """
+        return (self.wall_thickness,
+                self.width - self.wall_thickness - self.paddle_shape[0])
+
+    def _contains(self, positions, x, y, shape):
+        """
+        Helper method: are pixels (x, y) within rectangles of that shape?
+        """
+        return ((positions[:, 0] <= x) & (x < positions[:, 0] + shape[0]) &
+                (positions[:, 1] <= y) & (y < positions[:, 1] + shape[1]))
+
+    def _get_alive_brick(self, x, y):
+        """
+        Helper method that returns the index of the brick still alive at pixel
+        (x, y) of each game, or -1.
+        """
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        brick_idx = np.where(inside, self.brick_at[np.clip(x, 0, self.width-1),
+                                                   np.clip(y, 0, self.height-1)],
+                             -1)
+        is_alive = self.bricks_alive[np.arange(self.num_games),
+                                     np.maximum(brick_idx, 0)]
+        return np.where((brick_idx >= 0) & is_alive, brick_idx, -1)
+
+    def is_occupied(self, x, y):
+        """
+        Is pixel (x, y) of each game covered by a visible wall, a brick still
+        alive or the paddle? Counterpart of `BreakoutEngine.is_occupied`.
+
+        Parameters
+        ----------
+        x, y : numpy.ndarray([int])
+            Pixel of each game.
+
+        Returns
+        -------
+        numpy.ndarray([bool])
+        """
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        is_wall = inside & self.is_wall[np.clip(x, 0, self.width-1),
+                                        np.clip(y, 0, self.height-1)]
+        return (is_wall | (self._get_alive_brick(x, y) >= 0) |
+                self._contains(self.paddle_positions, x, y, self.paddle_shape))
+
+    def _resolve_ball_physics(self, actions):
+        """
+        Vectorized BreakoutEngine._resolve_ball_physics.
+
+        Returns
+        -------
+        hit_bricks : numpy.ndarray([int])
+            Index of the brick hit in each game, or -1.
+        """
+        bx, by = self.ball_positions.T
+        vx, vy = self.ball_velocities.T
+        r = 1  # ball movement radius
+
+        # Corner case: the ball starts in the paddle
+        in_paddle = self._contains(self.paddle_positions, bx, by,
+                                   self.paddle_shape)
+
+        # Step A: Update ball positions
+        #######################################################################
+        paddle_bounce = self._contains(self.paddle_positions, bx + vx, by + vy,
+                                       self.paddle_shape)
+        bounce_vx = np.where(actions == self.LEFT, -self.paddle_bounce_speed,
+                             np.where(actions == self.RIGHT,
+                                      self.paddle_bounce_speed,
+                                      np.where(vx > 0, 1, -1) *
+                                      self.paddle_bounce_speed))
+
+        hit_bricks = np.where(in_paddle, -1,
+                              self._get_alive_brick(bx + vx, by + vy))
+
+        is_empty = ~self.is_occupied(bx + vx, by + vy) & ~paddle_bounce
+        bounce_x = ~is_empty & ~paddle_bounce & self.is_occupied(bx + vx, by)
+        bounce_y = (~is_empty & ~paddle_bounce & ~bounce_x &
+                    self.is_occupied(bx, by + vy))
+
+        # [Bounce, paddle]
+        pvx = bounce_vx
+        pvy = -vy
+        pvy = np.where((np.abs(pvy) < r) & (np.abs(pvx) <= 1), r, pvy)
+        pvx = np.where(self.is_occupied(bx + pvx, by + pvy), -pvx, pvx)
+
+        # [Bounce, brick or wall] and [Emptiness]
+        new_vx = np.where(paddle_bounce, pvx,
+                          np.where(is_empty | bounce_y, vx, -vx))
+        new_vy = np.where(paddle_bounce, pvy,
+                          np.where(is_empty | bounce_x, vy, -vy))
+
+        # Step B: Check where we landed, manage any higher-order collisions
+        #######################################################################
+        # Indirect collisions only affect walls, which have no effects.
+        higher_order = self.is_occupied(bx + new_vx, by + new_vy)
+        new_vx = np.where(higher_order, -vx, new_vx)
+        new_vy = np.where(higher_order, -vy, new_vy)
+
+        new_vx = np.where(in_paddle, vx, new_vx)
+        new_vy = np.where(in_paddle, vy, new_vy)
+
+        self.ball_velocities = np.stack((new_vx, new_vy), axis=1)
+        self.ball_positions = self.ball_positions + self.ball_velocities
+
+        return hit_bricks
+
+    def update_paddle_positions(self, actions):
+        """
+        Vectorized BreakoutEngine.update_paddle_position.
+        """
+        speeds = np.arange(-self.paddle_speed, self.paddle_speed + 1)
+        dx = self.random_state.choice(speeds, size=self.num_games,
+                                      p=self.paddle_speed_distribution)
+        dx = np.where(actions == self.LEFT, -dx,
+                      np.where(actions == self.RIGHT, dx, 0))
+
+        low, high = self.get_accessible_domain()
+        self.paddle_positions[:, 0] = \
+            np.clip(self.paddle_positions[:, 0] + dx, low, high)
+
+    def _end_game_manager(self, rewards):
+        """
+        Vectorized BreakoutEngine.end_game_manager, mutates rewards.
+
+        Returns
+        -------
+        dones : numpy.ndarray([bool])
+        """
+        good_bricks = self.bricks_alive & (self.brick_rewards > 0)
+        won = ~good_bricks.any(axis=1)
+        rewards[won] += self.reward_upon_no_bricks_left
+
+        lost = self.ball_positions[:, 1] <= 0
+        rewards[lost] += self.reward_upon_ball_loss
+        self.lives[lost] -= 1
+        self.randomize_ball_positions_and_velocities(lost)
+
+        # As in the engine, losing a ball overrides winning
+        return np.where(lost, self.lives <= 0, won)
+
+    def randomize_ball_positions_and_velocities(self, mask):
+        """
+        Vectorized BreakoutEngine.randomize_ball_position_and_velocity.
+
+        Parameters
+        ----------
+        mask : numpy.ndarray([bool])
+            Games whose ball respawns.
+        """
+        games = np.flatnonzero(mask)
+
+        downward_velocities = np.array(
+            [v for v in self.template.index_to_velocity.values() if v[1] < 0])
+        choices = self.random_state.randint(len(downward_velocities),
+                                            size=len(games))
+        self.ball_velocities[games] = downward_velocities[choices]
+
+        top_y = self.height - 1 - self.wall_thickness
+        brick_bottoms = np.where(self.bricks_alive[games], self.brick_bottoms,
+                                 top_y)
+        maximum_ball_y = brick_bottoms.min(axis=1, initial=top_y)
+        ball_y = maximum_ball_y // 2
+
+        ball_offsets = np.arange(-2, 3)
+        while len(games):
+            ball_x = self.width // 2 + self.random_state.choice(ball_offsets,
+                                                                size=len(games))
+            self.ball_positions[games] = np.stack((ball_x, ball_y), axis=1)
+
+            occupied = self.is_occupied(*self.ball_positions.T)[games]
+            games, ball_y = games[occupied], ball_y[occupied]
+
+    ###########################################################################
+    # State reporting
+    ###########################################################################
+
+    def get_entity_matrices(self):
+        """
+        Entity matrices of all the games, equal to the ones maintained by
+        BreakoutEngine with `return_state_as_entity_matrix`.
+
+        Returns
+        -------
+        entity_matrices : numpy.ndarray[:, :, :] (dtype=bool)
+            Shaped (num_games, height * width, 5).
+        """
+        n_columns = len(BreakoutEngine.ENTITY_COLUMNS)
+        matrices = np.zeros((self.num_games, self.width * self.height,
+                             n_columns), dtype=bool)
+        matrices[:, :, BreakoutEngine.WALL_COLUMN] = self.wall_column
+
+        games, bricks = np.nonzero(self.bricks_alive)
+        matrices[games[:, np.newaxis], self.brick_rows[bricks],
+                 BreakoutEngine.BRICK_COLUMN] = True
+
+        paddle_nzis = (self.paddle_positions[:, np.newaxis, :] +
+                       self.paddle_nzis[np.newaxis, :, :])
+        paddle_rows = ((self.height - 1 - paddle_nzis[:, :, 1]) * self.width +
+                       paddle_nzis[:, :, 0])
+        matrices[np.arange(self.num_games)[:, np.newaxis], paddle_rows,
+                 BreakoutEngine.PADDLE_COLUMN] = True
+
+        ball_rows = ((self.height - 1 - self.ball_positions[:, 1]) *
+                     self.width + self.ball_positions[:, 0])
+        matrices[np.arange(self.num_games), ball_rows,
+                 BreakoutEngine.BALL_COLUMN] = True
+
+        matrices[:, :, BreakoutEngine.VOID_COLUMN] = \
+            ~matrices[:, :, :BreakoutEngine.VOID_COLUMN].any(axis=2)
+
+        return matrices
@@ -0,0 +1,189 @@
+import multiprocessing as mp
+import queue
+import traceback
+
+import numpy as np
+
+from model.constants import Constants as C
+from model.schema_learner import GreedySchemaLearner, count_mispredictions
+from model import bit_utils
+
+
+class AsyncSchemaLearner:
+    """
+    Runs GreedySchemaLearner in background process.
+    Has the same interface, but learn() only requests learning and returns immediately,
+    get_params() returns latest published snapshot of weights.
+    Failure of background process is raised by following calls.
+    """
+    TAKE_BATCH, SET_PARAMS, LEARN, STOP = range(4)
+    # background process checks if agent's process is alive this often while waiting for commands
+    PARENT_CHECK_PERIOD = 1
+
+    def __init__(self):
+        self._commands = mp.Queue()
+        self._snapshots = mp.Queue()
+
+        # daemonic processes are not allowed to have children
+        self._worker = mp.Process(target=_learning_loop,
+                                  args=(self._commands, self._snapshots),
+                                  daemon=not C.USE_PARALLEL_LEARNING)
+        self._worker.start()
+
+        empty_matrix = np.empty((C.SCHEMA_VEC_SIZE, 0), dtype=bool)
+        W_pos = [empty_matrix] * C.N_PREDICTABLE_ATTRIBUTES
+        W_neg = [empty_matrix] * C.N_PREDICTABLE_ATTRIBUTES
+        R = [empty_matrix]
+
+        # (version, W_pos, W_neg, R), replaced as a whole
+        self._snapshot = (0, W_pos, W_neg, R)
+        # (snapshot, its packed W_pos, W_neg, R), packed on first prediction by the snapshot
+        self._packed_snapshot = None
+        self._curr_iter = None
+        # exception background process failed with
+        self._error = None
+
+    @property
+    def params_version(self):
+        return self._snapshot[0]
+
+    def set_curr_iter(self, curr_iter):
+        self._curr_iter = curr_iter
+
+    def _check_worker(self):
+        """
+        Raises exception of background process if it is not alive
+        """
+        if self._error is None and not self._worker.is_alive():
+            self._fetch_snapshot()
+            self._error = RuntimeError('Learning process exited with code {}'.format(self._worker.exitcode))
+        if self._error is not None:
+            raise self._error
+
+    def set_params(self, W_pos, W_neg, R):
+        self._check_worker()
+        self._commands.put((self.SET_PARAMS, (W_pos, W_neg, R)))
+        self._snapshot = (self.params_version, W_pos, W_neg, R)
+
+    def take_batch(self, batch):
+        for part in batch:
+            assert part.dtype == bool
+
+        self._check_worker()
+        if batch.x.size:
+            # namedtuple nested into learner class can't be pickled
+            self._commands.put((self.TAKE_BATCH, tuple(batch)))
+
+    def learn(self):
+        self._check_worker()
+        self._commands.put((self.LEARN, self._curr_iter))
+
+    def _fetch_snapshot(self):
+        if self._error is not None:
+            raise self._error
+
+        snapshot = None
+        while True:
+            try:
+                snapshot = self._snapshots.get_nowait()
+            except queue.Empty:
+                break
+
+            if isinstance(snapshot, Exception):
+                self._error = snapshot
+                raise snapshot
+
+        if snapshot is not None:
+            self._snapshot = snapshot
+            print('Picked up learned params of version {}'.format(self.params_version))
+
+    def get_params(self):
+        self._fetch_snapshot()
+        _, W_pos, W_neg, R = self._snapshot
+        return list(W_pos), list(W_neg), list(R)
+
+    def count_mispredictions(self, batch):
+        """
+        Same as GreedySchemaLearner's one, but predicts by latest snapshot
+        """
+        self._fetch_snapshot()
+        if self._packed_snapshot is None or self._packed_snapshot[0] is not self._snapshot:
+            packed_params = [[bit_utils.pack_rows(matrix.T) for matrix in params] for params in self._snapshot[1:]]
+            self._packed_snapshot = (self._snapshot, packed_params)
+
+        return count_mispredictions(batch, *self._packed_snapshot[1])
+
+    def close(self):
+        """
+        Waits for requested learning to finish and stops background process
+        """
+        self._commands.put((self.STOP, None))
+        while self._worker.is_alive():
+            self._fetch_snapshot()
+            self._worker.join(timeout=0.1)
+        self._fetch_snapshot()
+
+
+def _learning_loop(commands, snapshots):
+    """
+    Exception is sent instead of snapshot, then the process exits
+    """
+    try:
+        _run_learning_loop(commands, snapshots)
+    except Exception:
+        # traceback of background process is kept in message, original exception may be not picklable
+        snapshots.put(RuntimeError('Learning process failed:\n{}'.format(traceback.format_exc())))
+
+
+def _run_learning_loop(commands, snapshots):
+    learner = GreedySchemaLearner()
+    try:
+        _handle_commands(learner, commands, snapshots)
+    finally:
+        learner.close()
+
+
+def _handle_commands(learner, commands, snapshots):
+    version = 0
+
+    while True:
+        # process isn't daemonic with parallel learning, so it stops by itself if agent's process is gone
+        try:
+            command = commands.get(timeout=AsyncSchemaLearner.PARENT_CHECK_PERIOD)
+        except queue.Empty:
+            if not mp.parent_process().is_alive():
+                return
+            continue
+
+        # requests accumulated during previous learn() are handled at once
+        pending = [command]
+        while True:
+            try:
+                pending.append(commands.get_nowait())
+            except queue.Empty:
+                break
+
+        is_learning_requested = False
+        is_stop_requested = False
+        for command, payload in pending:
+            if command == AsyncSchemaLearner.TAKE_BATCH:
+                learner.take_batch(GreedySchemaLearner.Batch(*payload))
+            elif command == AsyncSchemaLearner.SET_PARAMS:
+                learner.set_params(*payload)
+            elif command == AsyncSchemaLearner.LEARN:
+                learner.set_curr_iter(payload)
+                is_learning_requested = True
+            elif command == AsyncSchemaLearner.STOP:
+                is_stop_requested = True
+            else:
+                assert False
+
+        if is_learning_requested:
+            learner.learn()
+            version += 1
+            # queue pickles lazily, so detach matrices from learner's storage
+            W_pos, W_neg, R = [[matrix.copy() for matrix in params] for params in learner.get_params()]
+            snapshots.put((version, W_pos, W_neg, R))
+
+        if is_stop_requested:
+            return
@@ -0,0 +1,105 @@
+"""
+Bool matrices packed row-wise into uint64 words, e.g. 253 bits of sample take 4 words (32 bytes).
+Schema vector w is activated by sample x iff (w & ~x) == 0 in every word.
+"""
+import numpy as np
+
+
+WORD_N_BITS = 64
+# max number of word pairs processed at once
+CHUNK_SIZE = 2 ** 20
+
+
+def get_n_words(n_bits):
+    return (n_bits + WORD_N_BITS - 1) // WORD_N_BITS
+
+
+def pack_rows(matrix):
+    """
+    :param matrix: (n_rows x n_bits) bool
+    :return: (n_rows x n_words) uint64, padding bits are zero
+    """
+    n_rows, n_bits = matrix.shape
+    n_bytes = get_n_words(n_bits) * WORD_N_BITS // 8
+
+    packed = np.zeros((n_rows, n_bytes), dtype=np.uint8)
+    packed[:, :(n_bits + 7) // 8] = np.packbits(matrix, axis=1)
+    return packed.view(np.uint64)
+
+
+def unpack_rows(words, n_bits):
+    """
+    :param words: (n_rows x n_words) uint64
+    :return: (n_rows x n_bits) bool
+    """
+    bits = np.unpackbits(words.view(np.uint8), axis=1, count=n_bits)
+    return bits.view(bool)
+
+
+def _iter_chunks(n_rows, n_cols):
+    step = max(1, CHUNK_SIZE // max(n_cols, 1))
+    for begin in range(0, n_rows, step):
+        yield np.s_[begin: begin + step]
+
+
+def find_activations(x_words, schema_words):
+    """
+    :param x_words: (n_samples x n_words) packed samples
+    :param schema_words: (n_schemas x n_words) packed schema vectors
+    :return: (n_samples x n_schemas) bool, True if schema is activated by sample
+    """
+    activations = np.empty((len(x_words), len(schema_words)), dtype=bool)
+    for chunk in _iter_chunks(len(x_words), len(schema_words)):
+        missing = ~x_words[chunk, np.newaxis, :] & schema_words[np.newaxis, :, :]
+        activations[chunk] = ~missing.any(axis=2)
+    return activations
+
+
+def find_any_activation(x_words, schema_words):
+    """
+    :return: (n_samples) bool, True if any schema is activated by sample
+    """
+    is_activated = np.zeros(len(x_words), dtype=bool)
+    for chunk in _iter_chunks(len(x_words), len(schema_words)):
+        missing = ~x_words[chunk, np.newaxis, :] & schema_words[np.newaxis, :, :]
+        is_activated[chunk] = (~missing.any(axis=2)).any(axis=1)
+    return is_activated
+
+
+def find_near_activations(x_words, schema_words):
+    """
+    :return: (n_samples) bool, True if some schema misses exactly one bit of sample to be activated
+    """
+    is_near_activated = np.zeros(len(x_words), dtype=bool)
+    for chunk in _iter_chunks(len(x_words), len(schema_words)):
+        missing = ~x_words[chunk, np.newaxis, :] & schema_words[np.newaxis, :, :]
+        # zero words pass this check as well
+        is_single_bit = (missing & (missing - np.uint64(1))) == 0
+        n_nonzero_words = np.count_nonzero(missing, axis=2)
+        is_near_activated[chunk] = (is_single_bit.all(axis=2) & (n_nonzero_words == 1)).any(axis=1)
+    return is_near_activated
+
+
+def find_supersets(words):
+    """
+    :param words: (n_rows x n_words) packed rows
+    :return: (n_rows) bool, True if row contains all bits of other row,
+             only first one of equal rows is not marked
+    """
+    # is_subset[j, i]: bits of row i are subset of bits of row j
+    is_subset = find_activations(words, words)
+    np.fill_diagonal(is_subset, False)
+
+    is_strict_subset = is_subset & ~is_subset.T
+    is_earlier_duplicate = np.tril(is_subset & is_subset.T, k=-1)
+    return (is_strict_subset | is_earlier_duplicate).any(axis=1)
+
+
+def count_zero_bits(x_words, n_bits):
+    """
+    :return: (n_bits) number of samples having zero at each position
+    """
+    n_ones = np.zeros(n_bits, dtype=np.int64)
+    for chunk in _iter_chunks(len(x_words), n_bits):
+        n_ones += unpack_rows(x_words[chunk], n_bits).sum(axis=0)
+    return len(x_words) - n_ones
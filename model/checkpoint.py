@@ -0,0 +1,176 @@
+import json
+import os
+import re
+
+import numpy as np
+
+from model.constants import Constants as C
+from model import bit_utils
+
+
+class ParamsCheckpoint:
+    """
+    Versioned checkpoints of parameter matrices.
+    Every matrix is stored packed (see bit_utils) in its own .npy file, which is shared
+    by following versions while the matrix stays unchanged.
+    Version is committed by atomic rename of its manifest, written after all its files,
+    so crash during saving leaves previous versions intact.
+    Only files named by this class are removed, other files of the directory are left alone.
+    """
+    MANIFEST_PATTERN = re.compile(r'^params_(\d+)\.json$')
+    # <name>_<version>.npy
+    MATRIX_PATTERN = re.compile(r'^(.+)_(\d+)\.npy$')
+    TMP_SUFFIX = '.tmp'
+
+    def __init__(self, dir_name=None, n_kept_versions=None):
+        if dir_name is None:
+            dir_name = C.CHECKPOINT_DIR
+        if n_kept_versions is None:
+            n_kept_versions = C.N_KEPT_CHECKPOINTS
+        assert n_kept_versions >= 1
+        self._dir_name = dir_name
+        self._n_kept_versions = n_kept_versions
+
+        versions = self.get_versions()
+        self._last_version = versions[-1] if versions else 0
+
+        # name -> (version of ParamMatrix, file name) of matrices saved by this instance
+        self._saved = {}
+
+    def _get_path(self, file_name):
+        return os.path.join(self._dir_name, file_name)
+
+    @staticmethod
+    def _get_manifest_name(version):
+        return 'params_{}.json'.format(version)
+
+    def get_versions(self):
+        """
+        :returns sorted versions of committed checkpoints
+        """
+        if not os.path.isdir(self._dir_name):
+            return []
+
+        versions = []
+        for file_name in os.listdir(self._dir_name):
+            match = self.MANIFEST_PATTERN.match(file_name)
+            if match is not None:
+                versions.append(int(match.group(1)))
+        return sorted(versions)
+
+    def _read_manifest(self, version):
+        with open(self._get_path(self._get_manifest_name(version))) as file:
+            return json.load(file)
+
+    def _write_atomically(self, file_name, write):
+        path = self._get_path(file_name)
+        tmp_path = path + self.TMP_SUFFIX
+        with open(tmp_path, 'wb') as file:
+            write(file)
+        os.replace(tmp_path, path)
+
+    def save(self, named_params):
+        """
+        named_params: dict name -> ParamMatrix
+        :returns version of written checkpoint
+        """
+        os.makedirs(self._dir_name, exist_ok=True)
+        version = self._last_version + 1
+
+        matrices = {}
+        n_written = 0
+        for name, params in named_params.items():
+            saved = self._saved.get(name)
+            if saved is not None and saved[0] == params.version:
+                file_name = saved[1]
+            else:
+                file_name = '{}_{}.npy'.format(name, version)
+                packed = params.get_packed()
+                self._write_atomically(file_name, lambda file: np.save(file, packed, allow_pickle=False))
+                self._saved[name] = (params.version, file_name)
+                n_written += 1
+            matrices[name] = file_name
+
+        manifest = {
+            'version': version,
+            'n_bits': C.SCHEMA_VEC_SIZE,
+            'matrices': matrices,
+        }
+        self._write_atomically(self._get_manifest_name(version),
+                               lambda file: file.write(json.dumps(manifest).encode()))
+        self._last_version = version
+        self._remove_old_versions()
+
+        print('Saved params checkpoint {}, {} of {} matrices written.'.format(
+            version, n_written, len(named_params)))
+        return version
+
+    def _is_own_matrix_file(self, name, file_name):
+        match = self.MATRIX_PATTERN.match(file_name)
+        return match is not None and match.group(1) == name
+
+    def _remove_old_versions(self):
+        """
+        Removes evicted manifests, matrix files referenced only by them
+        and temporary files left by interrupted saves
+        """
+        versions = self.get_versions()
+        evicted_versions = versions[:-self._n_kept_versions]
+        kept_versions = versions[-self._n_kept_versions:]
+
+        referenced = set()
+        for version in kept_versions:
+            referenced.update(self._read_manifest(version)['matrices'].values())
+
+        for version in evicted_versions:
+            matrices = self._read_manifest(version)['matrices']
+            # manifest goes first, so its files are never missing
+            os.remove(self._get_path(self._get_manifest_name(version)))
+            for name, file_name in matrices.items():
+                path = self._get_path(file_name)
+                if file_name not in referenced and self._is_own_matrix_file(name, file_name) \
+                        and os.path.exists(path):
+                    os.remove(path)
+
+        for file_name in os.listdir(self._dir_name):
+            if not file_name.endswith(self.TMP_SUFFIX):
+                continue
+            base_name = file_name[:-len(self.TMP_SUFFIX)]
+            if self.MANIFEST_PATTERN.match(base_name) or self.MATRIX_PATTERN.match(base_name):
+                os.remove(self._get_path(file_name))
+
+    def load(self, version=None):
+        """
+        :param version: latest committed one if None
+        :returns dict name -> (SCHEMA_VEC_SIZE x n_vectors) bool matrix
+        """
+        if version is None:
+            versions = self.get_versions()
+            assert versions, 'no checkpoints in {}'.format(self._dir_name)
+            version = versions[-1]
+
+        manifest = self._read_manifest(version)
+        assert manifest['n_bits'] == C.SCHEMA_VEC_SIZE
+
+        named_matrices = {}
+        for name, file_name in manifest['matrices'].items():
+            packed = np.load(self._get_path(file_name), allow_pickle=False)
+            named_matrices[name] = bit_utils.unpack_rows(packed, manifest['n_bits']).T
+        return named_matrices
+
+    def load_legacy(self, names):
+        """
+        Loads dumps written before versioned checkpoints: unpacked matrix in <name>.npy for each name
+        :returns dict name -> (SCHEMA_VEC_SIZE x n_vectors) bool matrix
+        """
+        named_matrices = {}
+        for name in names:
+            path = self._get_path(name + '.npy')
+            assert os.path.exists(path), 'no params checkpoints or legacy dumps in {}'.format(self._dir_name)
+
+            matrix = np.load(path, allow_pickle=False)
+            assert matrix.dtype == bool
+            assert matrix.shape[0] == C.SCHEMA_VEC_SIZE, \
+                'legacy dump {} has {} bits, {} expected'.format(path, matrix.shape[0], C.SCHEMA_VEC_SIZE)
+            named_matrices[name] = matrix
+        return named_matrices
@@ -24,8 +24,21 @@ class Constants:
     # planning options are ('agent', 'hardcoded', 'random')
     PLANNING_TYPE = 'agent'
 
+    # 'periodic' learns every LEARNING_PERIOD steps,
+    # 'error' learns when LEARNING_ERROR_THRESHOLD samples mispredicted by current schemas are accumulated,
+    # not more often than every LEARNING_PERIOD steps, but at least every MAX_LEARNING_PERIOD steps
+    LEARNING_TRIGGER = 'error'  # 'periodic', 'error'
     LEARNING_PERIOD = 128
+    LEARNING_ERROR_THRESHOLD = 64
+    MAX_LEARNING_PERIOD = 1024
+    # drop copies of already passed samples with unchanged neighborhood, zero targets and zero reward
+    DO_FILTER_STATIC_SAMPLES = False
     LEARNING_SOLVER = 'cbc'  # 'cbc', 'gurobi'
+    # 'joint' learns several schemas per solve before greedy learning of remaining ones
+    LEARNING_MODE = 'greedy'  # 'greedy', 'joint'
+    # seconds of single learn() call split between schema sets by their mispredictions,
+    # schema sets out of time are continued first by the next call; None means no limit
+    LEARNING_TIME_BUDGET = 300
     USE_EMERGENCY_PLANNING = True
 
     VISUALIZE_STATE = True
@@ -36,6 +49,32 @@ class Constants:
 
     N_LEARNING_THREADS = 16
 
+    # distribute independent (schema_type, attr_idx) learning problems over processes,
+    # N_LEARNING_THREADS are split between them
+    USE_PARALLEL_LEARNING = False
+    N_LEARNING_PROCESSES = 4
+
+    # learn in background process, agent picks up new weights when they are ready
+    USE_ASYNC_LEARNING = False
+
+    # after learning remove schemas, whose preconditions include preconditions of other schema
+    DO_PRUNE_SUBSUMED_SCHEMAS = True
+
+    # max number of samples in replay, least informative ones are evicted beyond it
+    REPLAY_CAPACITY = 100000
+
+    # replay is kept in memory-mapped files of this directory and restored from it on start,
+    # None keeps replay in memory only
+    REPLAY_DIR = None
+
+    # learned params are checkpointed after every learn() into this directory,
+    # only last N_KEPT_CHECKPOINTS versions are kept
+    CHECKPOINT_DIR = 'dump'
+    N_KEPT_CHECKPOINTS = 5
+
+    # csv log with record per solver run, None disables it
+    SOLVE_LOG_PATH = 'logs/solves.csv'
+
     L = 1000
     NEIGHBORHOOD_RADIUS = 2
 
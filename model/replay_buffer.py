@@ -0,0 +1,322 @@
+from collections import namedtuple
+import json
+import os
+
+import numpy as np
+
+from model.constants import Constants as C
+from model import bit_utils
+
+
+Batch = namedtuple('Batch', ['x', 'y_creation', 'y_destruction', 'r'])
+
+
+class ReplayBuffer:
+    """
+    Append-only storage of unique samples.
+    Samples are stored packed into words (see bit_utils) and hashed by them,
+    so duplicate check costs O(1) per sample.
+
+    If dir_name is given, storage is memory-mapped files in it: samples stored there by previous runs
+    are picked up, and other processes can open the same directory read-only.
+    Files are only appended to, compaction writes kept samples into files of the next generation
+    and switches to them by meta, so crash at any point leaves either old or compacted replay.
+    """
+    INITIAL_CAPACITY = 1024
+    PART_NAMES = ('x', 'y_creation', 'y_destruction', 'r')
+    META_FILE_NAME = 'meta.json'
+
+    def __init__(self, dir_name=None, read_only=False):
+        self._dir_name = dir_name
+        self._read_only = read_only
+
+        self._size = 0
+        self._capacity = self.INITIAL_CAPACITY
+        self._n_words = bit_utils.get_n_words(C.SCHEMA_VEC_SIZE)
+        # incremented by every compaction of files
+        self._generation = 0
+
+        if dir_name is not None and os.path.exists(self._get_path(self.META_FILE_NAME)):
+            self._load_meta()
+        else:
+            assert not read_only, 'no replay to open in {}'.format(dir_name)
+            if dir_name is not None:
+                os.makedirs(dir_name, exist_ok=True)
+
+        if dir_name is not None and not read_only:
+            # files of interrupted compaction or not removed after finished one
+            self._remove_parts(self._generation + 1)
+            if self._generation:
+                self._remove_parts(self._generation - 1)
+
+        for name in self.PART_NAMES:
+            setattr(self, '_' + name, self._allocate(name))
+
+        if dir_name is not None and not read_only:
+            self._write_meta()
+
+        # packed sample -> its index in replay
+        self._index = {row.tobytes(): idx for idx, row in enumerate(self._x[:self._size])}
+
+    def _get_path(self, file_name):
+        return os.path.join(self._dir_name, file_name)
+
+    def _get_part_path(self, name, generation=None):
+        if generation is None:
+            generation = self._generation
+        # files of generation 0 are named as by replays written before compaction to new files
+        if generation == 0:
+            return self._get_path(name + '.dat')
+        return self._get_path('{}.{}.dat'.format(name, generation))
+
+    def _remove_parts(self, generation):
+        for name in self.PART_NAMES:
+            path = self._get_part_path(name, generation)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _get_part_layout(self, name):
+        """
+        :returns (shape of single sample's part, dtype)
+        """
+        if name == 'x':
+            return (self._n_words,), np.uint64
+        elif name in ('y_creation', 'y_destruction'):
+            return (C.N_PREDICTABLE_ATTRIBUTES,), bool
+        elif name == 'r':
+            return (), bool
+        else:
+            assert False
+
+    def _allocate(self, name, generation=None):
+        sample_shape, dtype = self._get_part_layout(name)
+        shape = (self._capacity,) + sample_shape
+        if self._dir_name is None:
+            return np.empty(shape, dtype=dtype)
+
+        path = self._get_part_path(name, generation)
+        if self._read_only:
+            return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+        # file only grows, samples already written stay in place
+        n_bytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        open(path, 'ab').close()
+        if os.path.getsize(path) < n_bytes:
+            os.truncate(path, n_bytes)
+        return np.memmap(path, dtype=dtype, mode='r+', shape=shape)
+
+    def _load_meta(self):
+        with open(self._get_path(self.META_FILE_NAME)) as file:
+            meta = json.load(file)
+
+        assert meta['n_words'] == self._n_words
+        assert meta['n_attributes'] == C.N_PREDICTABLE_ATTRIBUTES
+        self._size = meta['size']
+        self._capacity = meta['capacity']
+        self._generation = meta.get('generation', 0)
+
+    def _write_meta(self):
+        """
+        Written after samples are flushed, so meta never refers to missing ones
+        """
+        meta = {
+            'size': self._size,
+            'capacity': self._capacity,
+            'generation': self._generation,
+            'n_words': self._n_words,
+            'n_attributes': C.N_PREDICTABLE_ATTRIBUTES,
+        }
+        path = self._get_path(self.META_FILE_NAME)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(meta, file)
+        os.replace(tmp_path, path)
+
+    def _sync(self):
+        if self._dir_name is None:
+            return
+
+        for name in self.PART_NAMES:
+            getattr(self, '_' + name).flush()
+        self._write_meta()
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, sample):
+        return self._get_key(sample) in self._index
+
+    @staticmethod
+    def _get_key(sample):
+        return bit_utils.pack_rows(sample[np.newaxis, :]).tobytes()
+
+    def get_batch(self):
+        """
+        :returns batch with packed samples
+        """
+        return Batch(self._x[:self._size],
+                     self._y_creation[:self._size],
+                     self._y_destruction[:self._size],
+                     self._r[:self._size])
+
+    def compact(self, keep_mask):
+        """
+        Removes samples not in keep_mask, order of remaining ones is preserved.
+        Files in use are not modified, see class docstring.
+        """
+        assert keep_mask.shape == (self._size,)
+        kept_indices = np.nonzero(keep_mask)[0]
+        n_kept = kept_indices.size
+
+        assert not self._read_only
+        if self._dir_name is None:
+            for name in self.PART_NAMES:
+                data = getattr(self, '_' + name)
+                data[:n_kept] = data[kept_indices]
+            self._size = n_kept
+        else:
+            old_generation = self._generation
+            new_generation = old_generation + 1
+            self._remove_parts(new_generation)
+
+            for name in self.PART_NAMES:
+                data = self._allocate(name, new_generation)
+                data[:n_kept] = getattr(self, '_' + name)[kept_indices]
+                data.flush()
+                setattr(self, '_' + name, data)
+
+            self._generation = new_generation
+            self._size = n_kept
+            self._write_meta()
+            self._remove_parts(old_generation)
+
+        self._index = {row.tobytes(): idx for idx, row in enumerate(self._x[:n_kept])}
+
+    def _reserve(self, n_new_samples):
+        required_capacity = self._size + n_new_samples
+        if required_capacity <= self._capacity:
+            return
+
+        while self._capacity < required_capacity:
+            self._capacity *= 2
+
+        for name in self.PART_NAMES:
+            old_data = getattr(self, '_' + name)
+            data = self._allocate(name)
+            if self._dir_name is None:
+                data[:self._size] = old_data[:self._size]
+            setattr(self, '_' + name, data)
+
+    def add(self, batch):
+        """
+        Appends unseen samples of batch. Seen samples with zero reward
+        nullify reward of their copy in replay.
+        :returns (batch of appended unpacked samples, indices of replay samples with nullified reward)
+        """
+        assert not self._read_only
+        x_words = bit_utils.pack_rows(batch.x)
+        keys = [row.tobytes() for row in x_words]
+
+        new_indices = []
+        renewed_indices = []
+        new_rewards = []
+        for batch_idx, key in enumerate(keys):
+            replay_idx = self._index.get(key)
+            is_zero_reward = not batch.r[batch_idx]
+
+            if replay_idx is None:
+                self._index[key] = self._size + len(new_indices)
+                new_indices.append(batch_idx)
+                new_rewards.append(batch.r[batch_idx])
+            elif replay_idx >= self._size:
+                # duplicate inside of batch itself
+                if is_zero_reward:
+                    new_rewards[replay_idx - self._size] = False
+            elif is_zero_reward and self._r[replay_idx]:
+                self._r[replay_idx] = False
+                renewed_indices.append(replay_idx)
+
+        new_indices = np.array(new_indices, dtype=int)
+        new_batch = Batch(batch.x[new_indices],
+                          batch.y_creation[new_indices],
+                          batch.y_destruction[new_indices],
+                          np.array(new_rewards, dtype=bool))
+
+        n_new_samples = len(new_indices)
+        self._reserve(n_new_samples)
+        new_slice = np.s_[self._size: self._size + n_new_samples]
+        self._x[new_slice] = x_words[new_indices]
+        for storage, part in zip((self._y_creation, self._y_destruction, self._r), new_batch[1:]):
+            storage[new_slice] = part
+        self._size += n_new_samples
+        self._sync()
+
+        return new_batch, np.array(renewed_indices, dtype=int)
+
+
+class SampleBuffer:
+    """
+    Accumulates samples between learning calls without deduplicating them one batch at a time.
+    Storage is preallocated and overwritten again after every flush.
+    """
+    INITIAL_CAPACITY = 2 ** 16
+
+    def __init__(self):
+        self._size = 0
+        self._capacity = self.INITIAL_CAPACITY
+        self._n_words = bit_utils.get_n_words(C.SCHEMA_VEC_SIZE)
+        self._x = np.empty((self._capacity, self._n_words), dtype=np.uint64)
+        self._y_creation = np.empty((self._capacity, C.N_PREDICTABLE_ATTRIBUTES), dtype=bool)
+        self._y_destruction = np.empty((self._capacity, C.N_PREDICTABLE_ATTRIBUTES), dtype=bool)
+        self._r = np.empty(self._capacity, dtype=bool)
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, n_new_samples):
+        required_capacity = self._size + n_new_samples
+        if required_capacity <= self._capacity:
+            return
+
+        while self._capacity < required_capacity:
+            self._capacity *= 2
+
+        for name in ('_x', '_y_creation', '_y_destruction', '_r'):
+            old_data = getattr(self, name)
+            data = np.empty((self._capacity,) + old_data.shape[1:], dtype=old_data.dtype)
+            data[:self._size] = old_data[:self._size]
+            setattr(self, name, data)
+
+    def add(self, batch):
+        n_new_samples = len(batch.x)
+        self._reserve(n_new_samples)
+
+        new_slice = np.s_[self._size: self._size + n_new_samples]
+        self._x[new_slice] = bit_utils.pack_rows(batch.x)
+        for storage, part in zip((self._y_creation, self._y_destruction, self._r), batch[1:]):
+            storage[new_slice] = part
+        self._size += n_new_samples
+
+    def flush(self):
+        """
+        Empties buffer. Targets of first copy are kept for duplicate samples,
+        reward is zero if any copy has zero reward.
+        :returns batch of unique unpacked samples
+        """
+        x_words = self._x[:self._size]
+
+        first_indices = {}
+        inverse = np.empty(self._size, dtype=int)
+        for idx, row in enumerate(x_words):
+            inverse[idx] = first_indices.setdefault(row.tobytes(), idx)
+        unique_indices = np.fromiter(first_indices.values(), dtype=int, count=len(first_indices))
+
+        has_zero_reward = np.zeros(self._size, dtype=bool)
+        has_zero_reward[inverse[~self._r[:self._size]]] = True
+
+        batch = Batch(bit_utils.unpack_rows(x_words[unique_indices], C.SCHEMA_VEC_SIZE),
+                      self._y_creation[unique_indices],
+                      self._y_destruction[unique_indices],
+                      ~has_zero_reward[unique_indices])
+        self._size = 0
+        return batch
@@ -1,37 +1,72 @@
-from collections import namedtuple
-import os
+import gc
+import itertools
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import queue
 import time
+import traceback
 
 import numpy as np
 import mip.model as mip
 
+from model import bit_utils
+from model.checkpoint import ParamsCheckpoint
 from model.constants import Constants as C
+from model.replay_buffer import Batch, ReplayBuffer, SampleBuffer
+from model.solve_log import SolveLog
 from model.visualizer import Visualizer
 
 
+def _get_solver_name():
+    if C.LEARNING_SOLVER == 'cbc':
+        return mip.CBC
+    elif C.LEARNING_SOLVER == 'gurobi':
+        return mip.GUROBI
+    else:
+        assert False
+
+
+def count_mispredictions(batch, W_pos_words, W_neg_words, R_words):
+    """
+    W_pos_words, W_neg_words, R_words: lists of packed schemas (see bit_utils) in the order of get_params()
+    :returns number of samples of batch with some target predicted incorrectly by the schemas
+    """
+    x_words = bit_utils.pack_rows(batch.x)
+
+    is_mispredicted = np.zeros(len(batch.x), dtype=bool)
+    for schema_words, targets in ((W_pos_words, batch.y_creation), (W_neg_words, batch.y_destruction)):
+        for attr_idx, words in enumerate(schema_words):
+            is_mispredicted |= bit_utils.find_any_activation(x_words, words) != targets[:, attr_idx]
+
+    is_mispredicted |= bit_utils.find_any_activation(x_words, R_words[0]) != batch.r
+    return np.count_nonzero(is_mispredicted)
+
+
 class MipModel:
     """
     instantiated for single attr_idx
     """
     MAX_OPT_SECONDS = 60
 
-    def __init__(self):
-        if C.LEARNING_SOLVER == 'cbc':
-            solver = mip.CBC
-        elif C.LEARNING_SOLVER == 'gurobi':
-            solver = mip.GUROBI
-        else:
-            assert False
-
-        self._model = mip.Model(mip.MINIMIZE, solver_name=solver)
+    def __init__(self, n_threads=None):
+        """
+        n_threads: C.N_LEARNING_THREADS if None
+        """
+        self._model = mip.Model(mip.MINIMIZE, solver_name=_get_solver_name())
         self._model.verbose = 0
-        self._model.threads = C.N_LEARNING_THREADS
+        self._model.threads = C.N_LEARNING_THREADS if n_threads is None else n_threads
         # self._model.emphasis = 1  # feasibility
 
         self._w = [self._model.add_var(var_type='B') for _ in range(C.SCHEMA_VEC_SIZE)]
         self._constraints_buff = np.empty(0, dtype=object)
 
-    def add_to_constraints_buff(self, batch, unique_idx, replay_renewed_indices=None):
+        # statistics of last optimize() call, taken by pop_solve_stats()
+        self._solve_stats = None
+
+    def add_to_constraints_buff(self, batch, replay_renewed_indices=None):
+        """
+        batch: samples just appended to replay, constraints are kept in sync with replay indexing
+        """
         augmented_entities, target = batch
         batch_size = augmented_entities.shape[0]
 
@@ -40,8 +75,7 @@ class MipModel:
         new_constraints[~target] = [lc >= 1 for lc in lin_combs[~target]]
         new_constraints[target] = [lc == 0 for lc in lin_combs[target]]
 
-        concat_constraints = np.concatenate((self._constraints_buff, new_constraints), axis=0)
-        self._constraints_buff = concat_constraints[unique_idx]
+        self._constraints_buff = np.concatenate((self._constraints_buff, new_constraints), axis=0)
 
         if replay_renewed_indices is not None:
             for idx in replay_renewed_indices:
@@ -53,8 +87,46 @@ class MipModel:
                 assert constr.const == -1, constr.const
                 self._constraints_buff[idx] = constr
 
-    def optimize(self, objective_coefficients, zp_nl_mask, solved):
+    def compact_constraints_buff(self, keep_mask):
+        """
+        keep_mask: samples kept in replay after eviction
+        """
+        self._constraints_buff = self._constraints_buff[keep_mask]
+
+    def _save_solve_stats(self, status, constraints, build_time, solve_time):
+        """
+        Variables in equality constraints of positive samples are fixed to zero
+        """
+        fixed_vars = set()
+        for constraint in constraints:
+            if constraint.sense == '=':
+                fixed_vars.update(constraint.expr)
+
+        is_solved = status in (mip.OptimizationStatus.OPTIMAL, mip.OptimizationStatus.FEASIBLE)
+        self._solve_stats = {
+            'n_constraints': len(constraints),
+            'n_vars': len(self._w),
+            'n_fixed_vars': len(fixed_vars),
+            'status': status.name,
+            'objective': self._model.objective_value if is_solved else None,
+            'build_time': round(build_time, 4),
+            'solve_time': round(solve_time, 4),
+        }
+
+    def pop_solve_stats(self):
+        """
+        :returns statistics of last solve or None if there was no solve since previous call
+        """
+        stats = self._solve_stats
+        self._solve_stats = None
+        return stats
+
+    def optimize(self, objective_coefficients, zp_nl_mask, solved, start=None, max_seconds=MAX_OPT_SECONDS):
+        """
+        start: feasible binary schema vector to warm start solver from
+        """
         model = self._model
+        build_start_time = time.time()
 
         # add objective
         model.objective = mip.xsum(x_i * w_i for x_i, w_i in zip(objective_coefficients, self._w))
@@ -69,8 +141,13 @@ class MipModel:
         for constraint in constraints_to_add:
             model.add_constr(constraint)
 
+        model.start = [] if start is None else [(w_i, float(value)) for w_i, value in zip(self._w, start)]
+
         # optimize
-        status = model.optimize(max_seconds=self.MAX_OPT_SECONDS)
+        solve_start_time = time.time()
+        status = model.optimize(max_seconds=max_seconds)
+        self._save_solve_stats(status, constraints_to_add, solve_start_time - build_start_time,
+                               time.time() - solve_start_time)
 
         if status == mip.OptimizationStatus.OPTIMAL:
             print('Optimal solution cost {} found'.format(
@@ -91,42 +168,282 @@ class MipModel:
         return schema_vec
 
 
+class JointMipModel:
+    """
+    Set-cover formulation: up to N_SCHEMAS schemas are learned by single solve.
+    Each used schema must not be activated by any negative sample,
+    as many positive samples as possible must be covered.
+    Built from scratch on every solve, started from greedy grouping of positives.
+    """
+    N_SCHEMAS = 4
+    MAX_OPT_SECONDS = 10
+    # solver overruns time limit on bigger models, grouping is used as is then
+    MAX_N_CONSTRAINTS = 10000
+
+    def __init__(self, n_threads=None):
+        """
+        n_threads: C.N_LEARNING_THREADS if None
+        """
+        self._n_threads = C.N_LEARNING_THREADS if n_threads is None else n_threads
+        self._solve_stats = None
+
+    def pop_solve_stats(self):
+        """
+        :returns statistics of last solve or None if solver was not run
+        """
+        stats = self._solve_stats
+        self._solve_stats = None
+        return stats
+
+    def _find_groups(self, positives, negatives_lacks):
+        """
+        Greedy grouping of positives, whose common bits are not contained in any negative,
+        gives feasible solution to start from
+        :returns list of (common bits, indices of positives)
+        """
+        groups = []
+        for sample_idx, positive in enumerate(positives):
+            for group in groups:
+                common_bits = group[0] & positive
+                if (negatives_lacks & common_bits).any(axis=1).all():
+                    group[0] = common_bits
+                    group[1].append(sample_idx)
+                    break
+            else:
+                if len(groups) < self.N_SCHEMAS and (negatives_lacks & positive).any(axis=1).all():
+                    groups.append([positive.copy(), [sample_idx]])
+        return groups
+
+    def optimize(self, positives, negatives, max_seconds=MAX_OPT_SECONDS):
+        """
+        positives, negatives: unpacked samples
+        :returns list of (binary schema vector, mask of positives covered by it)
+        """
+        # schema having bit outside of all positives covers none of them
+        bits = np.nonzero(positives.any(axis=0))[0]
+        positives = positives[:, bits]
+        # negatives lacking the same bits give the same constraints
+        negatives_lacks = np.unique(~negatives[:, bits], axis=0)
+        # negative lacking superset of bits lacked by other one is excluded together with it
+        lacks_words = bit_utils.pack_rows(negatives_lacks)
+        negatives_lacks = negatives_lacks[~bit_utils.find_supersets(lacks_words)]
+
+        groups = self._find_groups(positives, negatives_lacks)
+        if sum(len(sample_indices) for _, sample_indices in groups) == len(positives):
+            print('Joint solve skipped, all {} positives are covered by grouping'.format(len(positives)))
+            return [self._make_solution(bits, common_bits, sample_indices, len(positives))
+                    for common_bits, sample_indices in groups]
+
+        n_constraints = self.N_SCHEMAS * (len(negatives_lacks) + np.count_nonzero(~positives))
+        if n_constraints > self.MAX_N_CONSTRAINTS:
+            print('Joint solve skipped, model is too big: {} constraints, {} of {} positives are covered by grouping'
+                  .format(n_constraints, sum(len(sample_indices) for _, sample_indices in groups), len(positives)))
+            return [self._make_solution(bits, common_bits, sample_indices, len(positives))
+                    for common_bits, sample_indices in groups]
+
+        build_start_time = time.time()
+        model = mip.Model(mip.MINIMIZE, solver_name=_get_solver_name())
+        model.verbose = 0
+        model.threads = self._n_threads
+
+        w = [[model.add_var(var_type='B') for _ in bits] for _ in range(self.N_SCHEMAS)]
+        is_used = [model.add_var(var_type='B') for _ in range(self.N_SCHEMAS)]
+        is_covered = [[model.add_var(var_type='B') for _ in range(self.N_SCHEMAS)] for _ in positives]
+
+        for schema_idx in range(self.N_SCHEMAS):
+            w_k = w[schema_idx]
+            for lacks in negatives_lacks:
+                model.add_constr(mip.xsum(w_k[i] for i in np.nonzero(lacks)[0]) >= is_used[schema_idx])
+
+            for sample_idx, positive in enumerate(positives):
+                cover_var = is_covered[sample_idx][schema_idx]
+                model.add_constr(cover_var <= is_used[schema_idx])
+
+                # per bit constraints give much tighter relaxation than aggregated one
+                for i in np.nonzero(~positive)[0]:
+                    model.add_constr(w_k[i] + cover_var <= 1)
+
+        for cover_vars in is_covered:
+            model.add_constr(mip.xsum(cover_vars) <= 1)
+
+        # schemas are interchangeable, fix their order to cut symmetric solutions:
+        # i-th positive can be covered only by one of first i + 1 schemas
+        for sample_idx, cover_vars in enumerate(is_covered[:self.N_SCHEMAS]):
+            for cover_var in cover_vars[sample_idx + 1:]:
+                model.add_constr(cover_var == 0)
+        for schema_idx in range(self.N_SCHEMAS - 1):
+            model.add_constr(is_used[schema_idx] >= is_used[schema_idx + 1])
+
+        model.objective = -mip.xsum(cover_var for cover_vars in is_covered for cover_var in cover_vars)
+
+        # groups satisfy symmetry constraints: k-th group is started by positive with index >= k,
+        # all variables are given, so solver doesn't need to complete the start
+        w_start = np.zeros((self.N_SCHEMAS, len(bits)), dtype=bool)
+        is_used_start = np.zeros(self.N_SCHEMAS, dtype=bool)
+        is_covered_start = np.zeros((len(positives), self.N_SCHEMAS), dtype=bool)
+        for schema_idx, (common_bits, sample_indices) in enumerate(groups):
+            w_start[schema_idx] = common_bits
+            is_used_start[schema_idx] = True
+            is_covered_start[sample_indices, schema_idx] = True
+
+        model.start = [(var, float(value)) for var, value in zip(
+            itertools.chain(itertools.chain.from_iterable(w), is_used, itertools.chain.from_iterable(is_covered)),
+            itertools.chain(w_start.ravel(), is_used_start, is_covered_start.ravel()))]
+
+        build_time = time.time() - build_start_time
+        solve_start_time = time.time()
+        status = model.optimize(max_seconds=max_seconds)
+        is_solved = status in (mip.OptimizationStatus.OPTIMAL, mip.OptimizationStatus.FEASIBLE)
+        self._solve_stats = {
+            'n_constraints': model.num_rows,
+            'n_vars': model.num_cols,
+            'status': status.name,
+            'objective': model.objective_value if is_solved else None,
+            'build_time': round(build_time, 4),
+            'solve_time': round(time.time() - solve_start_time, 4),
+        }
+        if not is_solved:
+            print('Joint solve status: {}, no solution found'.format(status))
+            return []
+        print('Joint solve status: {}, covered: {} of {}'.format(status, -model.objective_value, len(positives)))
+
+        solutions = []
+        for schema_idx in range(self.N_SCHEMAS):
+            sample_indices = [sample_idx for sample_idx, cover_vars in enumerate(is_covered)
+                              if cover_vars[schema_idx].x > 0.5]
+            if is_used[schema_idx].x > 0.5 and sample_indices:
+                schema_bits = np.array([w_ki.x > 0.5 for w_ki in w[schema_idx]])
+                solutions.append(self._make_solution(bits, schema_bits, sample_indices, len(positives)))
+        return solutions
+
+    @staticmethod
+    def _make_solution(bits, schema_bits, sample_indices, n_positives):
+        schema_vec = np.zeros(C.SCHEMA_VEC_SIZE, dtype=bool)
+        schema_vec[bits] = schema_bits
+        covered_mask = np.zeros(n_positives, dtype=bool)
+        covered_mask[sample_indices] = True
+        return schema_vec, covered_mask
+
+
 class ParamMatrix:
     """
-    Vectors are stored as columns
+    Vectors are stored as columns of preallocated slots.
+    Purged slots are only marked dead and reused by following additions,
+    storage is compacted when too many of them accumulate.
     """
+    # compact when dead slots make up this fraction of used ones
+    FRAGMENTATION_THRESHOLD = 0.25
+
     def __init__(self):
         self._VEC_SIZE = C.SCHEMA_VEC_SIZE
         self._CAPACITY = C.L
         self._data = np.ones((self._VEC_SIZE, self._CAPACITY), dtype=bool)
+        self._is_live = np.zeros(self._CAPACITY, dtype=bool)
+        self._free_slots = []
+        # slots beyond this one have never been used since last compaction
+        self._n_used_slots = 0
         self._n_vectors = 0
 
+        # incremented on every change of live vectors
+        self._version = 0
+        self._cached_version = None
+        self._cached_matrix = None
+        self._cached_packed = None
+
+    @property
+    def version(self):
+        return self._version
+
     @property
     def mult_me(self):
-        return self._data[:, :max(self._n_vectors, 1)]
+        if not self._n_vectors:
+            return np.ones((self._VEC_SIZE, 1), dtype=bool)
+        return self.get_matrix()
 
     def has_free_space(self):
         return self._n_vectors < self._CAPACITY
 
     def add_vector(self, vec):
-        if self._n_vectors < self._CAPACITY:
-            self._data[:, self._n_vectors] = vec
-            self._n_vectors += 1
+        if self._n_vectors >= self._CAPACITY:
+            return
+
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            slot = self._n_used_slots
+            self._n_used_slots += 1
+
+        self._data[:, slot] = vec
+        self._is_live[slot] = True
+        self._n_vectors += 1
+        self._version += 1
+
+    def _get_live_slots(self):
+        return np.nonzero(self._is_live[:self._n_used_slots])[0]
 
     def purge_vectors(self, vec_indices):
+        """
+        vec_indices: indices of columns in get_matrix()
+        """
         if not vec_indices.size:
             return
 
         assert ((vec_indices >= 0) & (vec_indices < self._n_vectors)).all()
-        n_purged = vec_indices.size
-        purged_matrix = np.delete(self._data, vec_indices, axis=1)
-        padding = np.ones((self._VEC_SIZE, n_purged), dtype=bool)
+        slots = self._get_live_slots()[vec_indices]
+
+        self._is_live[slots] = False
+        self._data[:, slots] = True
+        self._free_slots.extend(slots.tolist())
+        self._n_vectors -= slots.size
+        self._version += 1
+
+        if len(self._free_slots) > self.FRAGMENTATION_THRESHOLD * self._n_used_slots:
+            self.compact()
+
+    def compact(self):
+        """
+        Moves live vectors to leading slots keeping their order
+        """
+        if not self._free_slots:
+            return
+
+        live_slots = self._get_live_slots()
+        self._data[:, :self._n_vectors] = self._data[:, live_slots]
+        self._data[:, self._n_vectors:self._n_used_slots] = True
+        self._is_live[:self._n_vectors] = True
+        self._is_live[self._n_vectors:self._n_used_slots] = False
+
+        self._free_slots.clear()
+        self._n_used_slots = self._n_vectors
+
+    def _update_cache(self):
+        if self._cached_version == self._version:
+            return
+
+        if self._free_slots:
+            matrix = self._data[:, self._get_live_slots()]
+        else:
+            matrix = self._data[:, :self._n_vectors].copy()
 
-        self._data = np.hstack((purged_matrix, padding))
-        self._n_vectors -= n_purged
+        self._cached_matrix = matrix
+        self._cached_packed = None
+        self._cached_version = self._version
 
     def get_matrix(self):
-        return self._data[:, :self._n_vectors]
+        """
+        :returns contiguous (VEC_SIZE x n_vectors) matrix, it is not changed by following updates
+        """
+        self._update_cache()
+        return self._cached_matrix
+
+    def get_packed(self):
+        """
+        :returns vectors packed row-wise (see bit_utils)
+        """
+        self._update_cache()
+        if self._cached_packed is None:
+            self._cached_packed = bit_utils.pack_rows(self._cached_matrix.T)
+        return self._cached_packed
 
     def set_matrix(self, matrix):
         if matrix is None:
@@ -138,34 +455,100 @@ class ParamMatrix:
 
         self._data[:, :n_cols] = matrix
         self._data[:, n_cols:] = 1
+        self._is_live[:n_cols] = True
+        self._is_live[n_cols:] = False
+        self._free_slots.clear()
+        self._n_used_slots = n_cols
         self._n_vectors = n_cols
+        self._version += 1
 
 
 class GreedySchemaLearner:
-    Batch = namedtuple('Batch', ['x', 'y_creation', 'y_destruction', 'r'])
+    Batch = Batch
     CREATION_T, DESTRUCTION_T, REWARD_T = range(3)
     ATTR_SCHEMA_TYPES = (CREATION_T, DESTRUCTION_T)
+    # kinds of replay changes sent to learning processes
+    REPLAY_ADDED, REPLAY_COMPACTED = range(2)
+
+    # replay is shrunk to this fraction of REPLAY_CAPACITY, so eviction is not run on every learn()
+    EVICTION_RATIO = 0.75
+    # number of last deleted schemas of each schema set used to warm start solver
+    N_KEPT_DELETED_SCHEMAS = 64
+    # seed sample solver failed on is not used again for 2 ** (n_failures - 1) learn() calls,
+    # seed contradicting some negative sample - for the longest delay
+    MAX_SEED_RETRY_DELAY = 64
+    # max number of positive samples to be covered by single joint solve
+    N_JOINT_POSITIVES = 64
+    # solver gets at least this much time even if schema set is out of its budget
+    MIN_OPT_SECONDS = 1
+    # learning processes are checked this often while waiting for their results
+    WORKER_CHECK_PERIOD = 1
+    # learning process running its job this long after the job's deadline is considered hung
+    WORKER_HANG_SECONDS = 2 * MipModel.MAX_OPT_SECONDS
 
     @Visualizer.measure_time('Learner')
-    def __init__(self):
+    def __init__(self, n_learning_threads=None, replay_dir=None):
+        """
+        n_learning_threads: C.N_LEARNING_THREADS if None
+        replay_dir: C.REPLAY_DIR if None
+        """
+        if n_learning_threads is None:
+            n_learning_threads = C.N_LEARNING_THREADS
+        if replay_dir is None:
+            replay_dir = C.REPLAY_DIR
+
         self._params = [[ParamMatrix() for _ in range(C.N_PREDICTABLE_ATTRIBUTES)]
                         for _ in range(2)]
         self._R = ParamMatrix()
 
-        self._buff = []
-        self._replay = self.Batch(np.empty((0, C.SCHEMA_VEC_SIZE), dtype=bool),
-                                  np.empty((0, C.N_PREDICTABLE_ATTRIBUTES), dtype=bool),
-                                  np.empty((0, C.N_PREDICTABLE_ATTRIBUTES), dtype=bool),
-                                  np.empty(0, dtype=bool))
+        self._buff = SampleBuffer()
+        self._replay = ReplayBuffer(replay_dir)
+        self._checkpoint = ParamsCheckpoint()
+        self._solve_log = SolveLog(C.SOLVE_LOG_PATH)
 
-        self._attr_mip_models = [[MipModel() for _ in range(C.N_PREDICTABLE_ATTRIBUTES)]
+        self._n_learning_threads = n_learning_threads
+        self._attr_mip_models = [[MipModel(n_learning_threads) for _ in range(C.N_PREDICTABLE_ATTRIBUTES)]
                                  for _ in range(2)]
-        self._reward_mip_model = MipModel()
+        self._reward_mip_model = MipModel(n_learning_threads)
         self._solved = []
 
+        # (schema_type, attr_idx) -> mask of replay samples predicted by some schema,
+        # kept in sync with params incrementally
+        self._coverage = {}
+
+        # (schema_type, attr_idx) -> recently deleted schemas as columns
+        self._deleted_schemas = {}
+
+        # (schema_type, attr_idx) -> (number of failures, index of learn() call to retry from)
+        # for each replay sample used as seed
+        self._seed_failures = {}
+        self._n_learn_calls = 0
+
+        # time after which schema set being learned is left for next learn() call, None if there is no limit
+        self._deadline = None
+        # schema sets, whose learning was cut by time budget in previous learn() call
+        self._unfinished_jobs = set()
+
+        # processes for parallel learning as (process, task queue), created on first use
+        self._workers = None
+        self._worker_results = None
+        # (schema_type, attr_idx) -> (index of worker keeping its MipModel,
+        #                             number of replay changes applied to that model)
+        self._job_owners = {}
+        # replay changes not yet sent to some worker, first of them has index self._n_dropped_replay_changes
+        self._replay_changes = []
+        self._n_dropped_replay_changes = 0
+
         self._curr_iter = None
         self._visualizer = Visualizer(None, None, None)
 
+        if len(self._replay):
+            self._restore_constraints_buff()
+
+    def close(self):
+        self._solve_log.close()
+        self._stop_workers()
+
     def set_curr_iter(self, curr_iter):
         self._curr_iter = curr_iter
         self._visualizer.set_iter(curr_iter)
@@ -173,17 +556,25 @@ class GreedySchemaLearner:
     def set_params(self, W_pos, W_neg, R):
         for schema_type, params in zip(self.ATTR_SCHEMA_TYPES, (W_pos, W_neg)):
             for attr_idx in range(C.N_PREDICTABLE_ATTRIBUTES):
-                self._params[schema_type][attr_idx].set_matrix(params[attr_idx])
+                self._replace_schemas(schema_type, attr_idx, params[attr_idx])
 
-        self._R.set_matrix(R[0])
+        self._replace_schemas(self.REWARD_T, None, R[0])
+        self._coverage.clear()
 
-    def _handle_duplicates(self, batch, return_index=False):
-        augmented_entities, *rest = batch
-        samples, idx = np.unique(augmented_entities, axis=0, return_index=True)
-        out = self.Batch(samples, *[vec[idx] for vec in rest])
-        if return_index:
-            return out, idx
-        return out
+    def _replace_schemas(self, schema_type, attr_idx, matrix):
+        """
+        Schemas missing in new matrix are reported as deleted
+        """
+        if matrix is None:
+            return
+
+        params = self._get_param_matrix(schema_type, attr_idx)
+        new_keys = {row.tobytes() for row in bit_utils.pack_rows(matrix.T)}
+        old_schema_words = params.get_packed()
+        is_deleted = np.array([row.tobytes() not in new_keys for row in old_schema_words], dtype=bool)
+        self._solve_log.report_deletion(schema_type, attr_idx, old_schema_words[is_deleted])
+
+        params.set_matrix(matrix)
 
     def take_batch(self, batch):
         for part in batch:
@@ -191,83 +582,156 @@ class GreedySchemaLearner:
 
         if batch.x.size:
             assert np.all(batch.r == batch.r[0])
-            filtered_batch = self._handle_duplicates(batch)
-            self._buff.append(filtered_batch)
+            self._buff.add(batch)
 
     def _get_buff_batch(self):
-        out = None
-        if self._buff:
-            # sort buff to keep r = 0 entries
-            self._buff = sorted(self._buff, key=lambda b: b.r[0])
-
-            batch = self.Batch(*[np.concatenate(minibatches_part, axis=0)
-                                 for minibatches_part in zip(*self._buff)])
-
-            out = self._handle_duplicates(batch)
-            assert isinstance(out, self.Batch)
-            self._buff.clear()
+        if len(self._buff):
+            out = self._buff.flush()
+        else:
+            out = None
         return out
 
     def _add_to_replay_and_constraints_buff(self, batch):
-        batch_size = len(batch.x)
-        old_replay_size = len(self._replay.x)
-
-        # concatenate replay + batch
-        concat_batch = self.Batch(*[np.concatenate((a, b), axis=0)
-                                    for a, b in zip(self._replay, batch)])
-        # remove duplicates
-        self._replay, unique_idx = self._handle_duplicates(concat_batch, return_index=True)
-
-        concat_size = len(concat_batch.x)
-
-        # find r = 0 duplicates (they can only locate in batch)
-        duplicates_mask_concat = np.ones(concat_size, dtype=bool)
-        duplicates_mask_concat[unique_idx] = False
-        zero_reward_mask_concat = (concat_batch.r == 0)
-        reward_renew_indices = np.nonzero(duplicates_mask_concat & zero_reward_mask_concat)[0]
-        assert (reward_renew_indices >= old_replay_size).all()
-        samples_to_update = concat_batch.x[reward_renew_indices]
-
-        # update rewards to zero
-        replay_indices_to_update = []
-        for sample in samples_to_update:
-            new_replay_indices = np.nonzero((self._replay.x == sample).all(axis=1))[0]
-            assert len(new_replay_indices) == 1
-            new_replay_idx = new_replay_indices[0]
-            if self._replay.r[new_replay_idx] != 0:
-                self._replay.r[new_replay_idx] = 0
-                replay_indices_to_update.append(new_replay_idx)
-        n_updated_indices = len(replay_indices_to_update)
-        if n_updated_indices:
-            print('Nullified rewards of {} old samples.'.format(n_updated_indices))
-
-        # find non-duplicate indices in new batch (batch-based indexing)
-        batch_mask_of_concat = unique_idx >= old_replay_size
-        new_non_duplicate_indices = unique_idx[batch_mask_of_concat] - old_replay_size
-
-        # find indices that will index constraints_buff + new_batch_unique synchronously with replay
-        constraints_unique_idx = unique_idx.copy()
-        constraints_unique_idx[batch_mask_of_concat] = old_replay_size + np.arange(len(new_non_duplicate_indices))
-
-        for schema_type in self.ATTR_SCHEMA_TYPES:
-            for attr_idx in range(C.N_PREDICTABLE_ATTRIBUTES):
-                y = batch.y_creation if schema_type == self.CREATION_T else batch.y_destruction
-                attr_batch = (batch.x[new_non_duplicate_indices],
-                              y[new_non_duplicate_indices, attr_idx])
-                self._attr_mip_models[schema_type][attr_idx].add_to_constraints_buff(attr_batch, constraints_unique_idx)
+        new_batch, replay_renewed_indices = self._replay.add(batch)
 
-        reward_batch = (batch.x[new_non_duplicate_indices],
-                        batch.r[new_non_duplicate_indices])
-        self._reward_mip_model.add_to_constraints_buff(reward_batch, constraints_unique_idx,
-                                                       replay_renewed_indices=replay_indices_to_update)
+        n_renewed_indices = len(replay_renewed_indices)
+        if n_renewed_indices:
+            print('Nullified rewards of {} old samples.'.format(n_renewed_indices))
+
+        self._add_to_constraints_buff(new_batch, replay_renewed_indices)
+        self._record_replay_change(self.REPLAY_ADDED, (
+            self.Batch(bit_utils.pack_rows(new_batch.x), *new_batch[1:]), replay_renewed_indices))
+
+    def _restore_constraints_buff(self):
+        """
+        Builds constraints for samples of replay stored on disk by previous run
+        """
+        replay_batch = self._replay.get_batch()
+        augmented_entities = bit_utils.unpack_rows(replay_batch.x, C.SCHEMA_VEC_SIZE)
+        self._add_to_constraints_buff(self.Batch(augmented_entities, *replay_batch[1:]))
+        print('Restored replay of {} samples.'.format(len(self._replay)))
+
+    def _add_to_constraints_buff(self, new_batch, replay_renewed_indices=None, schema_sets=None):
+        """
+        schema_sets: (schema_type, attr_idx) of MipModels to update, all of them by default
+        """
+        if schema_sets is None:
+            schema_sets = self._gen_schema_sets()
+
+        for schema_type, attr_idx in schema_sets:
+            target = self._get_targets(new_batch, schema_type)
+            if attr_idx is not None:
+                target = target[:, attr_idx]
+            # only rewards are nullified
+            renewed_indices = replay_renewed_indices if schema_type == self.REWARD_T else None
+            self._get_mip_model(schema_type, attr_idx).add_to_constraints_buff(
+                (new_batch.x, target), replay_renewed_indices=renewed_indices)
+
+    def _compact_constraints_buff(self, keep_mask, schema_sets=None):
+        if schema_sets is None:
+            schema_sets = self._gen_schema_sets()
+
+        for schema_type, attr_idx in schema_sets:
+            self._get_mip_model(schema_type, attr_idx).compact_constraints_buff(keep_mask)
+
+    def _record_replay_change(self, kind, payload):
+        """
+        Changes are kept only while some worker keeps MipModel to be updated by them
+        """
+        if self._job_owners:
+            self._replay_changes.append((kind, payload))
 
     def _get_replay_batch(self):
-        if self._replay.x.size:
-            out = self._replay
+        if len(self._replay):
+            out = self._replay.get_batch()
         else:
             out = None
         return out
 
+    def _find_essential_samples(self, replay_batch):
+        """
+        Essential samples are positives not covered by schemas yet
+        and negatives, that would activate some schema lacking single precondition.
+        :returns (mask of positives of any learned schema set, mask of essential samples)
+        """
+        x = replay_batch.x
+        is_positive = np.zeros(len(x), dtype=bool)
+        is_essential = np.zeros(len(x), dtype=bool)
+
+        for schema_type, attr_idx in self._gen_learning_jobs():
+            target = self._get_targets(replay_batch, schema_type)
+            if attr_idx is not None:
+                target = target[:, attr_idx]
+            coverage = self._get_coverage(x, schema_type, attr_idx)
+            schema_words = self._get_param_matrix(schema_type, attr_idx).get_packed()
+
+            is_positive |= target
+            is_essential |= target & ~coverage
+
+            negative_indices = np.nonzero(~target & ~is_essential)[0]
+            is_essential[negative_indices] = bit_utils.find_near_activations(x[negative_indices], schema_words)
+
+        return is_positive, is_essential
+
+    @Visualizer.measure_time('replay eviction')
+    def _evict_replay_samples(self):
+        """
+        Evicts negatives far from all schemas first, then covered positives, then essential samples.
+        Older samples go first within the same group.
+        """
+        replay_batch = self._replay.get_batch()
+        replay_size = len(replay_batch.x)
+        n_evicted = replay_size - int(C.REPLAY_CAPACITY * self.EVICTION_RATIO)
+
+        is_positive, is_essential = self._find_essential_samples(replay_batch)
+        priority = np.where(is_essential, 2, is_positive.astype(int))
+
+        evicted_indices = np.lexsort((np.arange(replay_size), priority))[:n_evicted]
+        keep_mask = np.ones(replay_size, dtype=bool)
+        keep_mask[evicted_indices] = False
+
+        self._replay.compact(keep_mask)
+        self._compact_constraints_buff(keep_mask)
+        self._record_replay_change(self.REPLAY_COMPACTED, keep_mask)
+
+        for key, coverage in self._coverage.items():
+            self._coverage[key] = coverage[keep_mask[:len(coverage)]]
+        for key, seed_failures in self._seed_failures.items():
+            self._seed_failures[key] = tuple(part[keep_mask[:len(part)]] for part in seed_failures)
+
+        print('Evicted {} replay samples, {} of them essential, {} samples left.'.format(
+            n_evicted, np.count_nonzero(is_essential[evicted_indices]), len(self._replay)))
+
+    def _get_param_matrix(self, schema_type, attr_idx):
+        if schema_type in self.ATTR_SCHEMA_TYPES:
+            return self._params[schema_type][attr_idx]
+        elif schema_type == self.REWARD_T:
+            return self._R
+        else:
+            assert False
+
+    def _get_mip_model(self, schema_type, attr_idx):
+        if schema_type in self.ATTR_SCHEMA_TYPES:
+            return self._attr_mip_models[schema_type][attr_idx]
+        elif schema_type == self.REWARD_T:
+            return self._reward_mip_model
+        else:
+            assert False
+
+    def _get_targets(self, batch, schema_type):
+        """
+        :returns (batch_size x N_PREDICTABLE_ATTRIBUTES) matrix for attribute schemas,
+                 (batch_size) vector for reward schemas
+        """
+        if schema_type == self.CREATION_T:
+            return batch.y_creation
+        elif schema_type == self.DESTRUCTION_T:
+            return batch.y_destruction
+        elif schema_type == self.REWARD_T:
+            return batch.r
+        else:
+            assert False
+
     def _predict_attribute_delta(self, augmented_entities, attr_idx, attr_schema_type):
         assert augmented_entities.dtype == bool
         delta = ~(~augmented_entities @ self._params[attr_schema_type][attr_idx].mult_me)
@@ -278,87 +742,246 @@ class GreedySchemaLearner:
         reward_prediction = ~(~augmented_entities @ self._R.mult_me)
         return reward_prediction
 
+    def count_mispredictions(self, batch):
+        """
+        :returns number of samples of batch with some target predicted incorrectly by current schemas
+        """
+        W_pos_words, W_neg_words = [[params.get_packed() for params in self._params[schema_type]]
+                                    for schema_type in self.ATTR_SCHEMA_TYPES]
+        return count_mispredictions(batch, W_pos_words, W_neg_words, [self._R.get_packed()])
+
+    def _purge_schemas(self, schema_type, attr_idx, vec_indices):
+        params = self._get_param_matrix(schema_type, attr_idx)
+        purged_matrix = params.get_matrix()[:, vec_indices]
+        params.purge_vectors(vec_indices)
+
+        # removed copy of duplicate schema does not delete it
+        kept_keys = {row.tobytes() for row in params.get_packed()}
+        purged_schema_words = bit_utils.pack_rows(purged_matrix.T)
+        is_deleted = np.array([row.tobytes() not in kept_keys for row in purged_schema_words], dtype=bool)
+        self._solve_log.report_deletion(schema_type, attr_idx, purged_schema_words[is_deleted])
+
+        key = (schema_type, attr_idx)
+        deleted_schemas = self._deleted_schemas.get(key, np.empty((C.SCHEMA_VEC_SIZE, 0), dtype=bool))
+        deleted_schemas = np.hstack((deleted_schemas, purged_matrix))
+        self._deleted_schemas[key] = deleted_schemas[:, -self.N_KEPT_DELETED_SCHEMAS:]
+
+        # only samples predicted by purged schemas can lose coverage
+        coverage = self._coverage.get((schema_type, attr_idx))
+        if coverage is not None:
+            x = self._replay.get_batch().x[:len(coverage)]
+            affected_indices = np.nonzero(
+                coverage & bit_utils.find_any_activation(x, purged_schema_words))[0]
+            coverage[affected_indices] = self._predict_packed(x[affected_indices], schema_type, attr_idx)
+
+    def _gen_schema_sets(self):
+        """
+        :returns (schema_type, attr_idx) of every parameter matrix
+        """
+        schema_sets = [(schema_type, attr_idx)
+                       for schema_type in self.ATTR_SCHEMA_TYPES
+                       for attr_idx in range(C.N_PREDICTABLE_ATTRIBUTES)]
+        schema_sets.append((self.REWARD_T, None))
+        return schema_sets
+
+    @Visualizer.measure_time('incorrect schemas deletion')
     def _delete_incorrect_schemas(self, batch):
-        augmented_entities, target_creation, target_destruction, rewards = batch
-        for param_type in self.ATTR_SCHEMA_TYPES:
-            for attr_idx in range(C.N_PREDICTABLE_ATTRIBUTES):
-                target = target_creation if param_type == self.CREATION_T else target_destruction
+        """
+        All parameter matrices are stacked and checked against batch at once
+        """
+        schema_sets = self._gen_schema_sets()
+        x_words = bit_utils.pack_rows(batch.x)
+
+        # column of targets for each schema set
+        targets = np.column_stack([self._get_targets(batch, schema_type) if attr_idx is None
+                                   else self._get_targets(batch, schema_type)[:, attr_idx]
+                                   for schema_type, attr_idx in schema_sets])
+
+        schema_words = [self._get_param_matrix(schema_type, attr_idx).get_packed()
+                        for schema_type, attr_idx in schema_sets]
+        n_schemas = [len(words) for words in schema_words]
+        schema_set_indices = np.repeat(np.arange(len(schema_sets)), n_schemas)
+
+        # schema is incorrect, if it fires on some sample with false target
+        stacked_schema_words = np.concatenate(schema_words)
+        activations = bit_utils.find_activations(x_words, stacked_schema_words)
+        is_incorrect = (activations & ~targets[:, schema_set_indices]).any(axis=0)
+
+        n_incorrect_attr_schemas = 0
+        n_incorrect_reward_schemas = 0
+        offsets = np.cumsum([0] + n_schemas)
+        for (schema_type, attr_idx), begin, end in zip(schema_sets, offsets[:-1], offsets[1:]):
+            incorrect_schemas_indices = np.nonzero(is_incorrect[begin:end])[0]
+            if not incorrect_schemas_indices.size:
+                continue
+
+            self._purge_schemas(schema_type, attr_idx, incorrect_schemas_indices)
+            if schema_type == self.REWARD_T:
+                n_incorrect_reward_schemas += incorrect_schemas_indices.size
+                print('Deleted incorrect reward schemas: {}'.format(incorrect_schemas_indices.size))
+            else:
+                n_incorrect_attr_schemas += incorrect_schemas_indices.size
+                print('Deleted incorrect attr ({}) delta schemas: {} of {}'.format(
+                    schema_type, incorrect_schemas_indices.size, C.ENTITY_NAMES[attr_idx]))
+
+        # schemas learned by logged solves survived unless deleted by now
+        for schema_type, attr_idx in schema_sets:
+            self._solve_log.report_survival(schema_type, attr_idx)
 
-                attr_delta = self._predict_attribute_delta(augmented_entities, attr_idx,
-                                                           attr_schema_type=param_type)
-                # false positive predictions
-                mispredicted_samples_mask = attr_delta.any(axis=1) & ~target[:, attr_idx]
+        return n_incorrect_attr_schemas, n_incorrect_reward_schemas
 
-                incorrect_schemas_mask = attr_delta[mispredicted_samples_mask, :].any(axis=0)
-                incorrect_schemas_indices = np.nonzero(incorrect_schemas_mask)[0]
+    def _find_subsumed_schemas(self, params):
+        """
+        Schema is subsumed if other schema fires on every sample it fires on,
+        i.e. preconditions of the other one are subset of its own.
+        Only first one of exact duplicates is kept.
+        :returns indices of redundant vectors of params
+        """
+        return np.nonzero(bit_utils.find_supersets(params.get_packed()))[0]
 
-                assert incorrect_schemas_indices.ndim == 1
-                n_incorrect_attr_schemas = incorrect_schemas_indices.size
-                if n_incorrect_attr_schemas:
-                    self._params[param_type][attr_idx].purge_vectors(incorrect_schemas_indices)
-                    print('Deleted incorrect attr ({}) delta schemas: {} of {}'.format(
-                        param_type, n_incorrect_attr_schemas, C.ENTITY_NAMES[attr_idx]))
+    def _prune_subsumed_schemas(self):
+        schema_sets = self._gen_schema_sets()
 
-        # regarding reward
+        n_pruned = 0
+        for schema_type, attr_idx in schema_sets:
+            redundant_indices = self._find_subsumed_schemas(self._get_param_matrix(schema_type, attr_idx))
+            if redundant_indices.size:
+                self._purge_schemas(schema_type, attr_idx, redundant_indices)
+                n_pruned += redundant_indices.size
 
-        reward_prediction = self._predict_reward(augmented_entities)
+        widths = [self._get_param_matrix(schema_type, attr_idx).get_matrix().shape[1]
+                  for schema_type, attr_idx in schema_sets]
+        print('Pruned subsumed schemas: {}, resulting width: {} ({} total)'.format(
+            n_pruned, widths, sum(widths)))
+        return n_pruned
 
-        # false positive predictions
-        mispredicted_samples_mask = reward_prediction.any(axis=1) & ~rewards
+    def _narrow_schema(self, schema_vec, seed, negatives):
+        """
+        Adds seed's bits to schema until no negative activates it
+        seed: sample activating schema_vec, not contained in any negative
+        negatives: packed samples
+        """
+        schema_vec = schema_vec.copy()
+        while True:
+            schema_words = bit_utils.pack_rows(schema_vec[np.newaxis, :])
+            activated_mask = bit_utils.find_any_activation(negatives, schema_words)
+            if not activated_mask.any():
+                return schema_vec
+
+            # bit, which excludes the most of activated negatives
+            activated = bit_utils.unpack_rows(negatives[activated_mask], C.SCHEMA_VEC_SIZE)
+            n_excluded = (~activated & seed).sum(axis=0)
+            schema_vec[np.argmax(n_excluded)] = True
+
+    def _get_mip_start(self, seed_words, negatives, deleted_schemas, objective_coefficients):
+        """
+        Candidates are seed sample itself and deleted schemas activated by seed narrowed to exclude negatives
+        seed_words: packed seed sample
+        negatives: packed samples
+        :returns cheapest candidate or None, if no feasible solution exists
+        """
+        if not self._is_seed_feasible(seed_words, negatives):
+            return None
 
-        incorrect_schemas_mask = reward_prediction[mispredicted_samples_mask, :].any(axis=0)
-        incorrect_schemas_indices = np.nonzero(incorrect_schemas_mask)[0]
+        seed = bit_utils.unpack_rows(seed_words[np.newaxis, :], C.SCHEMA_VEC_SIZE)[0]
+        candidates = [seed]
+        if deleted_schemas is not None:
+            for schema_vec in deleted_schemas.T:
+                if not (schema_vec & ~seed).any():
+                    candidates.append(self._narrow_schema(schema_vec, seed, negatives))
 
-        assert incorrect_schemas_indices.ndim == 1
-        n_incorrect_reward_schemas = incorrect_schemas_indices.size
-        if n_incorrect_reward_schemas:
-            self._R.purge_vectors(incorrect_schemas_indices)
-            print('Deleted incorrect reward schemas: {}'.format(n_incorrect_reward_schemas))
+        costs = [np.dot(objective_coefficients, candidate) for candidate in candidates]
+        return candidates[int(np.argmin(costs))]
 
-        return n_incorrect_attr_schemas, n_incorrect_reward_schemas
+    @staticmethod
+    def _is_seed_feasible(seed_words, negatives):
+        """
+        Every schema activated by seed is activated by negative containing seed as well
+        """
+        return not bit_utils.find_any_activation(negatives, seed_words[np.newaxis, :]).any()
+
+    def _get_seed_failures(self, schema_type, attr_idx, n_samples):
+        key = (schema_type, attr_idx)
+        n_failures, retry_from = self._seed_failures.get(key, (np.zeros(0, dtype=int),
+                                                               np.zeros(0, dtype=np.int64)))
+        n_new_samples = n_samples - len(n_failures)
+        if n_new_samples > 0:
+            n_failures = np.concatenate((n_failures, np.zeros(n_new_samples, dtype=int)))
+            retry_from = np.concatenate((retry_from, np.zeros(n_new_samples, dtype=np.int64)))
+            self._seed_failures[key] = (n_failures, retry_from)
+        return n_failures, retry_from
+
+    def _record_seed_failure(self, seed_failures, idx, is_feasible):
+        n_failures, retry_from = seed_failures
+        n_failures[idx] += 1
+        if is_feasible:
+            delay = min(2 ** (n_failures[idx] - 1), self.MAX_SEED_RETRY_DELAY)
+        else:
+            delay = self.MAX_SEED_RETRY_DELAY
+        retry_from[idx] = self._n_learn_calls + delay
+
+    def _report_seed_quarantine(self, jobs):
+        n_quarantined = []
+        for schema_type, attr_idx in jobs:
+            n_failures, retry_from = self._get_seed_failures(schema_type, attr_idx, len(self._replay))
+            n_quarantined.append(np.count_nonzero(retry_from > self._n_learn_calls))
 
-    def _find_cluster(self, zp_pl_mask, zp_nl_mask, augmented_entities, target, attr_idx, opt_model):
+        print('Quarantined seed samples: {} ({} total)'.format(n_quarantined, sum(n_quarantined)))
+
+    def _find_cluster(self, zp_pl_mask, zp_nl_mask, augmented_entities, opt_model, deleted_schemas=None,
+                      seed_failures=None):
         """
-        augmented_entities: zero-predicted only
-        target: scalar vector
+        augmented_entities: packed samples of whole replay
+        deleted_schemas: recently deleted schemas of the same set, used for warm start
+        seed_failures: failure counters of the same set, seeds which failed are quarantined
         """
-        assert augmented_entities.dtype == np.int
-        assert target.dtype == np.int
+        negatives = augmented_entities[zp_nl_mask]
 
-        # find all entries, that can be potentially solved (have True labels)
-        candidates = augmented_entities[zp_pl_mask]
+        while True:
+            # find all entries, that can be potentially solved (have True labels)
+            zp_pl_indices = np.nonzero(zp_pl_mask)[0]
 
-        if not candidates.size:
-            return None
+            if not zp_pl_indices.size:
+                return None
 
-        print('finding cluster...    zp pos samples: {}'.format(candidates.shape[0]))
-        # print('augmented_entities: {}'.format(augmented_entities.shape[0]))
+            print('finding cluster...    zp pos samples: {}'.format(zp_pl_indices.size))
 
-        zp_pl_indices = np.nonzero(zp_pl_mask)[0]
+            # sample one entry and add it's idx to 'solved'
+            idx = np.random.choice(zp_pl_indices)
+            zp_pl_mask[idx] = False
+
+            # drawing another seed costs nothing compared to solver run
+            if self._is_seed_feasible(augmented_entities[idx], negatives):
+                break
+
+            print('Seed sample contradicts negative one, quarantined.')
+            if seed_failures is not None:
+                self._record_seed_failure(seed_failures, idx, is_feasible=False)
 
-        # sample one entry and add it's idx to 'solved'
-        idx = np.random.choice(zp_pl_indices)
         self._solved.append(idx)
 
         # resample candidates
-        zp_pl_mask[idx] = False
         zp_pl_indices = np.nonzero(zp_pl_mask)[0]
-        candidates = augmented_entities[zp_pl_mask]
+        candidates = augmented_entities[zp_pl_indices]
 
         # solve LP
-        objective_coefficients = (1 - candidates).sum(axis=0)
+        objective_coefficients = bit_utils.count_zero_bits(candidates, C.SCHEMA_VEC_SIZE)
+        start = self._get_mip_start(augmented_entities[idx], negatives, deleted_schemas, objective_coefficients)
         objective_coefficients = list(objective_coefficients)
 
-        new_schema_vector = opt_model.optimize(objective_coefficients, zp_nl_mask, self._solved)
+        new_schema_vector = opt_model.optimize(objective_coefficients, zp_nl_mask, self._solved, start=start,
+                                               max_seconds=self._get_opt_seconds(opt_model.MAX_OPT_SECONDS))
 
         if new_schema_vector is None:
             print('Cannot find cluster!')
+            if seed_failures is not None:
+                self._record_seed_failure(seed_failures, idx, is_feasible=True)
             return None
 
         # add all samples that are solved by just learned schema vector
         if candidates.size:
-            new_predicted_attribute = (1 - candidates) @ new_schema_vector
-            cluster_members_mask = np.isclose(new_predicted_attribute, 0, rtol=0, atol=C.ADDING_SCHEMA_TOLERANCE)
+            schema_words = bit_utils.pack_rows(self._binarize_schema(new_schema_vector)[np.newaxis, :])
+            cluster_members_mask = bit_utils.find_any_activation(candidates, schema_words)
             n_new_members = np.count_nonzero(cluster_members_mask)
 
             if n_new_members:
@@ -370,42 +993,86 @@ class GreedySchemaLearner:
     def _simplify_schema(self, zp_nl_mask, schema_vector, opt_model):
         objective_coefficients = [1] * len(schema_vector)
 
-        new_schema_vector = opt_model.optimize(objective_coefficients, zp_nl_mask, self._solved)
-        assert new_schema_vector is not None
+        # solution being simplified satisfies the same constraints
+        start = self._binarize_schema(schema_vector)
+        new_schema_vector = opt_model.optimize(objective_coefficients, zp_nl_mask, self._solved, start=start,
+                                               max_seconds=self._get_opt_seconds(opt_model.MAX_OPT_SECONDS))
+        if new_schema_vector is None:
+            # solver may run out of short budgeted time, the start is valid schema anyway
+            print('Simplification failed, schema is kept as found.')
+            return schema_vector
         return new_schema_vector
 
     def _binarize_schema(self, schema_vector):
         threshold = 0.5
         return schema_vector > threshold
 
-    def _generate_new_schema(self, augmented_entities, targets, attr_idx, schema_type):
-        if schema_type in self.ATTR_SCHEMA_TYPES:
-            target = targets[:, attr_idx].astype(np.int, copy=False)
-            prediction = self._predict_attribute_delta(augmented_entities, attr_idx, schema_type)
-            opt_model = self._attr_mip_models[schema_type][attr_idx]
-        elif schema_type == self.REWARD_T:
-            target = targets.astype(np.int, copy=False)
-            prediction = self._predict_reward(augmented_entities)
-            opt_model = self._reward_mip_model
-        else:
-            assert False
+    def _predict_packed(self, augmented_entities, schema_type, attr_idx):
+        """
+        augmented_entities: packed samples
+        :returns mask of samples, for which some schema predicts True
+        """
+        schema_words = self._get_param_matrix(schema_type, attr_idx).get_packed()
+        return bit_utils.find_any_activation(augmented_entities, schema_words)
+
+    def _get_coverage(self, augmented_entities, schema_type, attr_idx):
+        """
+        augmented_entities: packed samples of whole replay
+        :returns mask of samples, for which some schema predicts True,
+                 only samples appended since previous call are predicted
+        """
+        key = (schema_type, attr_idx)
+        coverage = self._coverage.get(key, np.empty(0, dtype=bool))
+
+        n_covered = len(coverage)
+        if n_covered < len(augmented_entities):
+            new_coverage = self._predict_packed(augmented_entities[n_covered:], schema_type, attr_idx)
+            coverage = np.concatenate((coverage, new_coverage))
+            self._coverage[key] = coverage
+        return coverage
+
+    def _log_solve(self, schema_type, attr_idx, phase, opt_model, replay_size):
+        solve_stats = opt_model.pop_solve_stats()
+        if solve_stats is not None:
+            self._solve_log.add_solve(learn_call=self._n_learn_calls, schema_type=schema_type, attr_idx=attr_idx,
+                                      phase=phase, replay_size=replay_size, **solve_stats)
+
+    def _add_schema(self, augmented_entities, schema_type, attr_idx, schema_vec):
+        self._get_param_matrix(schema_type, attr_idx).add_vector(schema_vec)
+        self._solve_log.assign_schema(schema_type, attr_idx, schema_vec)
+
+        coverage = self._get_coverage(augmented_entities, schema_type, attr_idx)
+        schema_words = bit_utils.pack_rows(schema_vec[np.newaxis, :])
+        coverage |= bit_utils.find_any_activation(augmented_entities, schema_words)
 
-        augmented_entities = augmented_entities.astype(np.int, copy=False)
+    def _generate_new_schema(self, augmented_entities, targets, attr_idx, schema_type):
+        """
+        augmented_entities: packed samples of whole replay
+        """
+        target = targets[:, attr_idx] if schema_type in self.ATTR_SCHEMA_TYPES else targets
+        opt_model = self._get_mip_model(schema_type, attr_idx)
 
         # sample only entries with zero-prediction
-        zp_mask = ~prediction.any(axis=1)
-        pl_mask = (target == 1)
+        zp_mask = ~self._get_coverage(augmented_entities, schema_type, attr_idx)
         # pos and neg labels' masks
-        zp_pl_mask = zp_mask & pl_mask
-        zp_nl_mask = zp_mask & ~pl_mask
+        zp_pl_mask = zp_mask & target
+        zp_nl_mask = zp_mask & ~target
 
-        new_schema_vector = self._find_cluster(zp_pl_mask, zp_nl_mask,
-                                               augmented_entities, target, attr_idx,
-                                               opt_model)
+        # skip quarantined seeds
+        seed_failures = self._get_seed_failures(schema_type, attr_idx, len(augmented_entities))
+        zp_pl_mask &= seed_failures[1] <= self._n_learn_calls
+
+        deleted_schemas = self._deleted_schemas.get((schema_type, attr_idx))
+        new_schema_vector = self._find_cluster(zp_pl_mask, zp_nl_mask, augmented_entities, opt_model,
+                                               deleted_schemas=deleted_schemas, seed_failures=seed_failures)
+        self._log_solve(schema_type, attr_idx, 'cluster', opt_model, len(augmented_entities))
         if new_schema_vector is None:
+            self._solve_log.discard_unassigned()
+            self._solved.clear()
             return None
 
         new_schema_vector = self._simplify_schema(zp_nl_mask, new_schema_vector, opt_model)
+        self._log_solve(schema_type, attr_idx, 'simplify', opt_model, len(augmented_entities))
         new_schema_vector = self._binarize_schema(new_schema_vector)
 
         self._solved.clear()
@@ -419,21 +1086,383 @@ class GreedySchemaLearner:
         return W_pos, W_neg, R
 
     def _dump_params(self):
-        dir_name = 'dump'
-        os.makedirs(dir_name, exist_ok=True)
+        named_params = {}
+        for schema_type, name in zip(self.ATTR_SCHEMA_TYPES, ('w_pos', 'w_neg')):
+            for attr_idx, params in enumerate(self._params[schema_type]):
+                named_params['{}_{}'.format(name, attr_idx)] = params
+        named_params['r_0'] = self._R
 
-        W_pos, W_neg, R = self.get_params()
-        names = ['w_pos', 'w_neg', 'r']
+        self._checkpoint.save(named_params)
 
-        for params, name in zip((W_pos, W_neg, R), names):
-            for idx, matrix in enumerate(params):
-                file_name = name + '_{}'.format(idx)
-                path = os.path.join(dir_name, file_name)
-                np.save(path, matrix, allow_pickle=False)
+    def _gen_learning_jobs(self):
+        """
+        :returns list of independent (schema_type, attr_idx) problems
+        """
+        jobs = []
+        if C.DO_LEARN_ATTRIBUTE_PARAMS:
+            jobs.extend((schema_type, attr_idx)
+                        for schema_type in self.ATTR_SCHEMA_TYPES
+                        for attr_idx in range(C.N_PREDICTABLE_ATTRIBUTES))
+        if C.DO_LEARN_REWARD_PARAMS:
+            jobs.append((self.REWARD_T, None))
+        return jobs
+
+    def _is_out_of_time(self):
+        return self._deadline is not None and time.time() >= self._deadline
+
+    def _get_opt_seconds(self, max_seconds):
+        """
+        :returns solver time limit not exceeding deadline of schema set being learned
+        """
+        if self._deadline is None:
+            return max_seconds
+        return max(min(max_seconds, self._deadline - time.time()), self.MIN_OPT_SECONDS)
+
+    def _count_mispredictions(self, replay_batch, schema_type, attr_idx):
+        """
+        Incorrect schemas are already deleted, so mispredictions are positives not covered by any schema.
+        Quarantined seeds are not counted, learning can't start from them.
+        """
+        target = self._get_targets(replay_batch, schema_type)
+        if attr_idx is not None:
+            target = target[:, attr_idx]
+        coverage = self._get_coverage(replay_batch.x, schema_type, attr_idx)
+        seed_failures = self._get_seed_failures(schema_type, attr_idx, len(replay_batch.x))
+        return np.count_nonzero(target & ~coverage & (seed_failures[1] <= self._n_learn_calls))
+
+    def _schedule_jobs(self, replay_batch, jobs):
+        """
+        Splits LEARNING_TIME_BUDGET between schema sets proportionally to their mispredictions.
+        Schema sets without mispredictions are skipped.
+        :returns list of (schema_type, attr_idx, time budget or None),
+                 jobs unfinished by previous call go first, then ones with more mispredictions
+        """
+        n_mispredictions = [self._count_mispredictions(replay_batch, schema_type, attr_idx)
+                            for schema_type, attr_idx in jobs]
+        print('Mispredicted samples: {}'.format(n_mispredictions))
+
+        n_total = sum(n_mispredictions)
+        schedule = []
+        for (schema_type, attr_idx), n_job_mispredictions in zip(jobs, n_mispredictions):
+            if not n_job_mispredictions:
+                continue
+            if C.LEARNING_TIME_BUDGET is None:
+                budget = None
+            else:
+                budget = C.LEARNING_TIME_BUDGET * n_job_mispredictions / n_total
+            schedule.append((schema_type, attr_idx, budget, n_job_mispredictions))
+
+        schedule.sort(key=lambda job: ((job[0], job[1]) not in self._unfinished_jobs, -job[3]))
+        return [job[:3] for job in schedule]
+
+    def _learn_scheduled(self, replay_batch, schedule):
+        """
+        Time left by schema set finished before its deadline is passed to the next one
+        """
+        self._unfinished_jobs.clear()
+        spare_time = 0
+        for schema_type, attr_idx, budget in schedule:
+            start_time = time.time()
+            self._deadline = None if budget is None else start_time + budget + spare_time
+
+            if not self._learn_schema_set(replay_batch, schema_type, attr_idx):
+                self._unfinished_jobs.add((schema_type, attr_idx))
+            if self._deadline is not None:
+                spare_time = max(self._deadline - time.time(), 0)
+        self._deadline = None
+
+    def _learn_jointly(self, replay_batch, schema_type, attr_idx):
+        """
+        Runs joint solves while they find schemas, remaining positives are left to greedy learning
+        """
+        augmented_entities = replay_batch.x
+        params = self._get_param_matrix(schema_type, attr_idx)
+        target = self._get_targets(replay_batch, schema_type)
+        if attr_idx is not None:
+            target = target[:, attr_idx]
+
+        while params.has_free_space() and not self._is_out_of_time():
+            zp_mask = ~self._get_coverage(augmented_entities, schema_type, attr_idx)
+            seed_failures = self._get_seed_failures(schema_type, attr_idx, len(augmented_entities))
+            zp_pl_mask = zp_mask & target & (seed_failures[1] <= self._n_learn_calls)
+
+            zp_pl_indices = np.nonzero(zp_pl_mask)[0]
+            if not zp_pl_indices.size:
+                break
+            if zp_pl_indices.size > self.N_JOINT_POSITIVES:
+                zp_pl_indices = np.random.choice(zp_pl_indices, self.N_JOINT_POSITIVES, replace=False)
+
+            zp_nl_mask = zp_mask & ~target
+            positives = bit_utils.unpack_rows(augmented_entities[zp_pl_indices], C.SCHEMA_VEC_SIZE)
+            negatives = bit_utils.unpack_rows(augmented_entities[zp_nl_mask], C.SCHEMA_VEC_SIZE)
+            joint_model = JointMipModel(self._n_learning_threads)
+            solutions = joint_model.optimize(positives, negatives,
+                                             max_seconds=self._get_opt_seconds(joint_model.MAX_OPT_SECONDS))
+            # survival is tracked by simplification solves of every found schema
+            self._log_solve(schema_type, attr_idx, 'joint', joint_model, len(augmented_entities))
+            self._solve_log.discard_unassigned()
+
+            if not solutions:
+                print('Joint solve found no schemas, falling back to greedy learning.')
+                break
+
+            print('Joint solve found {} schemas for {} zp pos samples'.format(len(solutions), zp_pl_indices.size))
+            opt_model = self._get_mip_model(schema_type, attr_idx)
+            for schema_vec, covered_mask in solutions:
+                if not params.has_free_space():
+                    break
+
+                # the simplest schema covering the same samples
+                self._solved.extend(zp_pl_indices[covered_mask])
+                schema_vec = self._simplify_schema(zp_nl_mask.copy(), schema_vec, opt_model)
+                self._log_solve(schema_type, attr_idx, 'simplify', opt_model, len(augmented_entities))
+                self._solved.clear()
+
+                self._add_schema(augmented_entities, schema_type, attr_idx, self._binarize_schema(schema_vec))
+
+    def _learn_schema_set(self, replay_batch, schema_type, attr_idx):
+        """
+        :returns False if learning was cut by deadline
+        """
+        params = self._get_param_matrix(schema_type, attr_idx)
+        targets = self._get_targets(replay_batch, schema_type)
+
+        if C.LEARNING_MODE == 'joint':
+            self._learn_jointly(replay_batch, schema_type, attr_idx)
+        else:
+            assert C.LEARNING_MODE == 'greedy'
+
+        while params.has_free_space():
+            if self._is_out_of_time():
+                print('Learning of schema set ({}, {}) is out of time, left for next call.'.format(
+                    schema_type, attr_idx))
+                return False
+
+            new_schema_vec = self._generate_new_schema(replay_batch.x, targets, attr_idx, schema_type)
+            if new_schema_vec is None:
+                break
+            self._add_schema(replay_batch.x, schema_type, attr_idx, new_schema_vec)
+        return True
+
+    def _sync_job_constraints_buff(self, replay_batch, schema_type, attr_idx, replay_changes):
+        """
+        Worker side of parallel learning: MipModel of the job is kept between learn() calls
+        and updated only by replay changes since the last job it ran
+        replay_changes: None if this worker has no up-to-date model of the job,
+                        constraints are rebuilt from the whole replay then
+        """
+        schema_sets = [(schema_type, attr_idx)]
+        if replay_changes is None:
+            opt_model = MipModel(self._n_learning_threads)
+            if schema_type in self.ATTR_SCHEMA_TYPES:
+                self._attr_mip_models[schema_type][attr_idx] = opt_model
+            else:
+                self._reward_mip_model = opt_model
+
+            # replaced model is referenced by cycles of its variables and constraints,
+            # collect it now, not when collection is triggered inside of solver call
+            gc.collect()
+
+            augmented_entities = bit_utils.unpack_rows(replay_batch.x, C.SCHEMA_VEC_SIZE)
+            self._add_to_constraints_buff(self.Batch(augmented_entities, *replay_batch[1:]), schema_sets=schema_sets)
+        else:
+            for kind, payload in replay_changes:
+                if kind == self.REPLAY_ADDED:
+                    new_batch, replay_renewed_indices = payload
+                    augmented_entities = bit_utils.unpack_rows(new_batch.x, C.SCHEMA_VEC_SIZE)
+                    self._add_to_constraints_buff(self.Batch(augmented_entities, *new_batch[1:]),
+                                                  replay_renewed_indices, schema_sets=schema_sets)
+                elif kind == self.REPLAY_COMPACTED:
+                    self._compact_constraints_buff(payload, schema_sets=schema_sets)
+                else:
+                    assert False
+
+        assert len(self._get_mip_model(schema_type, attr_idx)._constraints_buff) == len(replay_batch.x)
+
+    def _run_learning_job(self, replay_batch, schema_type, attr_idx, replay_changes, matrix, deleted_schemas,
+                          seed_failures, n_learn_calls, deadline):
+        self._sync_job_constraints_buff(replay_batch, schema_type, attr_idx, replay_changes)
+
+        self._replace_schemas(schema_type, attr_idx, matrix)
+        self._coverage.pop((schema_type, attr_idx), None)
+        self._deleted_schemas[(schema_type, attr_idx)] = deleted_schemas
+        self._seed_failures[(schema_type, attr_idx)] = seed_failures
+        self._n_learn_calls = n_learn_calls
+        self._deadline = deadline
+        is_finished = self._learn_schema_set(replay_batch, schema_type, attr_idx)
+        self._deadline = None
+
+        return (schema_type, attr_idx, self._get_param_matrix(schema_type, attr_idx).get_matrix(),
+                self._get_coverage(replay_batch.x, schema_type, attr_idx),
+                self._get_seed_failures(schema_type, attr_idx, len(replay_batch.x)), is_finished,
+                self._solve_log.export())
+
+    def _get_workers(self):
+        if self._workers is None:
+            # forked process would inherit solver state of this one and may hang in it,
+            # spawned one gets constants changed at runtime instead
+            context = mp.get_context('spawn')
+            constants = {name: value for name, value in vars(C).items() if name.isupper()}
+
+            n_threads = max(1, self._n_learning_threads // C.N_LEARNING_PROCESSES)
+            self._worker_results = context.Queue()
+            self._workers = []
+            for worker_idx in range(C.N_LEARNING_PROCESSES):
+                tasks = context.Queue()
+                process = context.Process(target=_learning_worker_loop,
+                                          args=(worker_idx, n_threads, constants, tasks, self._worker_results),
+                                          daemon=True)
+                process.start()
+                self._workers.append((process, tasks))
+        return self._workers
+
+    def _stop_workers(self):
+        if self._workers is not None:
+            for process, _ in self._workers:
+                process.terminate()
+                process.join()
+            self._workers = None
+            self._worker_results = None
+
+        # models kept by workers are lost
+        self._job_owners.clear()
+        self._replay_changes.clear()
+        self._n_dropped_replay_changes = 0
+
+    def _pick_job(self, worker_idx, pending_jobs):
+        """
+        Worker takes job, whose MipModel it keeps, then job without model, then job of other worker
+        """
+        def get_rank(job_idx):
+            schema_type, attr_idx, _ = pending_jobs[job_idx]
+            owner = self._job_owners.get((schema_type, attr_idx))
+            if owner is None:
+                return 1
+            return 0 if owner[0] == worker_idx else 2
+
+        return pending_jobs.pop(min(range(len(pending_jobs)), key=get_rank))
+
+    def _get_replay_changes(self, worker_idx, schema_type, attr_idx):
+        """
+        :returns replay changes to be applied to worker's MipModel of the job,
+                 None if worker has no up-to-date model of it
+        """
+        n_replay_changes = self._n_dropped_replay_changes + len(self._replay_changes)
+        owner = self._job_owners.get((schema_type, attr_idx))
+        self._job_owners[(schema_type, attr_idx)] = (worker_idx, n_replay_changes)
+
+        if owner is None or owner[0] != worker_idx:
+            return None
+        return self._replay_changes[owner[1] - self._n_dropped_replay_changes:]
+
+    def _drop_sent_replay_changes(self):
+        if not self._job_owners:
+            return
+        n_sent = min(n_applied for _, n_applied in self._job_owners.values())
+        del self._replay_changes[:n_sent - self._n_dropped_replay_changes]
+        self._n_dropped_replay_changes = n_sent
+
+    def _find_failed_worker(self, running_jobs):
+        """
+        running_jobs: worker index -> (schema_type, attr_idx, deadline) of job it runs
+        :returns (index, description) of worker, which exited or runs its job far beyond deadline, or None
+        """
+        for worker_idx, (process, _) in enumerate(self._workers):
+            if not process.is_alive():
+                return worker_idx, 'exited with code {}'.format(process.exitcode)
+
+            job = running_jobs.get(worker_idx)
+            if job is not None and job[2] is not None and time.time() > job[2] + self.WORKER_HANG_SECONDS:
+                return worker_idx, 'hung in job ({}, {})'.format(job[0], job[1])
+        return None
+
+    @Visualizer.measure_time('parallel learning')
+    def _learn_in_parallel(self, replay_batch, schedule):
+        """
+        Processes run schema sets concurrently, so each one may spend its budget
+        multiplied by number of processes, but not beyond the budget of whole call.
+        If some process fails, schema sets not learned yet are learned sequentially.
+        """
+        if C.LEARNING_TIME_BUDGET is None:
+            deadlines = [None] * len(schedule)
+        else:
+            start_time = time.time()
+            n_processes = min(C.N_LEARNING_PROCESSES, len(schedule))
+            deadlines = [start_time + min(budget * n_processes, C.LEARNING_TIME_BUDGET)
+                         for _, _, budget in schedule]
+
+        self._unfinished_jobs.clear()
+        workers = self._get_workers()
+        shm, layout = _share_batch(replay_batch)
+        pending_jobs = [(schema_type, attr_idx, deadline)
+                        for (schema_type, attr_idx, _), deadline in zip(schedule, deadlines)]
+        running_jobs = {}
+        failure = None
+        try:
+            idle_workers = list(range(len(workers)))
+
+            while pending_jobs or running_jobs:
+                while pending_jobs and idle_workers:
+                    worker_idx = idle_workers.pop(0)
+                    job = self._pick_job(worker_idx, pending_jobs)
+                    schema_type, attr_idx, deadline = job
+                    task = (shm.name, layout, schema_type, attr_idx,
+                            self._get_replay_changes(worker_idx, schema_type, attr_idx),
+                            self._get_param_matrix(schema_type, attr_idx).get_matrix(),
+                            self._deleted_schemas.get((schema_type, attr_idx)),
+                            self._get_seed_failures(schema_type, attr_idx, len(replay_batch.x)),
+                            self._n_learn_calls, deadline)
+                    workers[worker_idx][1].put(task)
+                    running_jobs[worker_idx] = job
+
+                try:
+                    worker_idx, result = self._worker_results.get(timeout=self.WORKER_CHECK_PERIOD)
+                except queue.Empty:
+                    failure = self._find_failed_worker(running_jobs)
+                    if failure is not None:
+                        break
+                    continue
+
+                idle_workers.append(worker_idx)
+                del running_jobs[worker_idx]
+                if isinstance(result, Exception):
+                    raise result
+
+                schema_type, attr_idx, matrix, coverage, seed_failures, is_finished, solve_log = result
+                self._replace_schemas(schema_type, attr_idx, matrix)
+                self._coverage[(schema_type, attr_idx)] = coverage
+                self._seed_failures[(schema_type, attr_idx)] = seed_failures
+                if not is_finished:
+                    self._unfinished_jobs.add((schema_type, attr_idx))
+                self._solve_log.merge(solve_log)
+        except BaseException:
+            # workers may be left in the middle of jobs
+            self._stop_workers()
+            raise
+        finally:
+            shm.close()
+            shm.unlink()
+
+        if failure is None:
+            self._drop_sent_replay_changes()
+            return
+
+        worker_idx, description = failure
+        print('Learning process {} {}, remaining schema sets are learned sequentially.'.format(
+            worker_idx, description))
+        self._stop_workers()
+
+        # constraints of this process are always up to date
+        remaining_jobs = set((schema_type, attr_idx)
+                             for schema_type, attr_idx, _ in pending_jobs + list(running_jobs.values()))
+        unfinished_jobs = set(self._unfinished_jobs)
+        self._learn_scheduled(replay_batch, [job for job in schedule if job[:2] in remaining_jobs])
+        self._unfinished_jobs |= unfinished_jobs
 
     @Visualizer.measure_time('learn()')
     def learn(self):
         print('Launching learning procedure...')
+        self._n_learn_calls += 1
 
         # get full batch from buffer
         buff_batch = self._get_buff_batch()
@@ -441,6 +1470,9 @@ class GreedySchemaLearner:
             self._add_to_replay_and_constraints_buff(buff_batch)
             self._delete_incorrect_schemas(buff_batch)
 
+            if len(self._replay) > C.REPLAY_CAPACITY:
+                self._evict_replay_samples()
+
         # get all data to learn on
         replay_batch = self._get_replay_batch()
         if replay_batch is None:
@@ -450,28 +1482,79 @@ class GreedySchemaLearner:
         # a, b = self._delete_incorrect_schemas(replay_batch)
         # assert a == 0 and b == 0
 
-        augmented_entities, targets_construction, targets_destruction, rewards = replay_batch
-
-        if C.DO_LEARN_ATTRIBUTE_PARAMS:
-            for schema_type in self.ATTR_SCHEMA_TYPES:
-                params = self._params[schema_type]
-                targets = targets_construction if schema_type == self.CREATION_T else targets_destruction
+        jobs = self._gen_learning_jobs()
+        schedule = self._schedule_jobs(replay_batch, jobs)
+        if C.USE_PARALLEL_LEARNING:
+            self._learn_in_parallel(replay_batch, schedule)
+        else:
+            # changes are not recorded for workers, which won't be used
+            self._stop_workers()
+            self._learn_scheduled(replay_batch, schedule)
 
-                for attr_idx in range(C.N_PREDICTABLE_ATTRIBUTES):
-                    while params[attr_idx].has_free_space():
-                        new_schema_vec = self._generate_new_schema(augmented_entities, targets, attr_idx, schema_type)
-                        if new_schema_vec is None:
-                            break
-                        params[attr_idx].add_vector(new_schema_vec)
+        self._report_seed_quarantine(jobs)
 
-        if C.DO_LEARN_REWARD_PARAMS:
-            while self._R.has_free_space():
-                new_schema_vec = self._generate_new_schema(augmented_entities, rewards, None, self.REWARD_T)
-                if new_schema_vec is None:
-                    break
-                self._R.add_vector(new_schema_vec)
+        if C.DO_PRUNE_SUBSUMED_SCHEMAS:
+            self._prune_subsumed_schemas()
 
         self._dump_params()
+        self._solve_log.flush()
         if C.VISUALIZE_SCHEMAS:
             W_pos, W_neg, R = self.get_params()
             self._visualizer.visualize_schemas(W_pos, W_neg, R)
+
+
+# ------------- PARALLEL LEARNING ------------- #
+
+def _share_batch(batch):
+    """
+    Copy all parts of batch into single shared memory block
+    :returns (shared memory, layout of parts needed to attach them)
+    """
+    n_bytes = sum(part.nbytes for part in batch)
+    shm = shared_memory.SharedMemory(create=True, size=max(n_bytes, 1))
+
+    layout = []
+    offset = 0
+    for part in batch:
+        shared_part = np.ndarray(part.shape, dtype=part.dtype, buffer=shm.buf, offset=offset)
+        shared_part[...] = part
+        layout.append((part.shape, part.dtype.str, offset))
+        offset += part.nbytes
+    return shm, layout
+
+
+def _attach_batch(shm, layout):
+    parts = [np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+             for shape, dtype, offset in layout]
+    return GreedySchemaLearner.Batch(*parts)
+
+
+def _learning_worker_loop(worker_idx, n_threads, constants, tasks, results):
+    """
+    Learner of worker process keeps MipModels of jobs it ran between tasks
+    constants: values of Constants in learner's process
+    """
+    for name, value in constants.items():
+        setattr(C, name, value)
+    # replay is passed by tasks, directory of learner's process is not opened
+    C.REPLAY_DIR = None
+    learner = GreedySchemaLearner(n_learning_threads=n_threads)
+
+    while True:
+        shm_name, layout, schema_type, attr_idx, *job_state = tasks.get()
+
+        shm = shared_memory.SharedMemory(name=shm_name)
+        replay_batch = _attach_batch(shm, layout)
+        try:
+            result = learner._run_learning_job(replay_batch, schema_type, attr_idx, *job_state)
+        except BaseException as e:
+            # traceback is kept in message, original exception may be not picklable
+            results.put((worker_idx, RuntimeError('Learning job ({}, {}) failed:\n{}'.format(
+                schema_type, attr_idx, traceback.format_exc()))))
+            if not isinstance(e, Exception):
+                raise
+            continue
+        finally:
+            del replay_batch
+            shm.close()
+        results.put((worker_idx, result))
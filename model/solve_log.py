@@ -0,0 +1,136 @@
+import csv
+import os
+import time
+
+import numpy as np
+
+from model.constants import Constants as C
+from model import bit_utils
+
+
+class SolveLog:
+    """
+    Append-only csv log with record per solver run.
+    Record is written once it is known, whether schema learned by the solve
+    survived next deletion of incorrect schemas. Schema removed in any way before it is not survived.
+    Records of different runs appended to the same file are told apart by run_id.
+    """
+    FIELDS = ('run_id', 'learn_call', 'schema_type', 'attr_idx', 'phase', 'replay_size', 'n_constraints',
+              'n_vars', 'n_fixed_vars', 'status', 'objective', 'build_time', 'solve_time', 'survived')
+
+    def __init__(self, path=C.SOLVE_LOG_PATH):
+        self._path = path
+        self._run_id = '{}-{}'.format(time.strftime('%Y%m%d-%H%M%S'), os.getpid())
+        self._is_header_checked = False
+
+        # records ready to be written
+        self._complete = []
+        # records of schema being learned
+        self._unassigned = []
+        # (schema_type, attr_idx) -> list of (packed schema, record) waiting for next deletion
+        self._pending = {}
+
+    @property
+    def run_id(self):
+        return self._run_id
+
+    def add_solve(self, **fields):
+        self._unassigned.append(fields)
+
+    def assign_schema(self, schema_type, attr_idx, schema_vec):
+        """
+        Solves since previous assignment have produced schema_vec
+        """
+        key = bit_utils.pack_rows(schema_vec[np.newaxis, :]).tobytes()
+        pending = self._pending.setdefault((schema_type, attr_idx), [])
+        pending.extend((key, record) for record in self._unassigned)
+        self._unassigned = []
+
+    def discard_unassigned(self):
+        """
+        Solves since previous assignment have produced no schema
+        """
+        for record in self._unassigned:
+            self._complete.append(dict(record, survived=''))
+        self._unassigned = []
+
+    def report_deletion(self, schema_type, attr_idx, deleted_schema_words):
+        """
+        deleted_schema_words: packed schemas just removed from the set
+        """
+        pending = self._pending.get((schema_type, attr_idx))
+        if not pending:
+            return
+
+        deleted_keys = {row.tobytes() for row in deleted_schema_words}
+        for key, record in pending:
+            if key in deleted_keys:
+                self._complete.append(dict(record, survived=0))
+        pending[:] = [(key, record) for key, record in pending if key not in deleted_keys]
+
+    def report_survival(self, schema_type, attr_idx):
+        """
+        Schemas of the set, which are not deleted by now, have survived deletion of incorrect schemas
+        """
+        for _, record in self._pending.pop((schema_type, attr_idx), []):
+            self._complete.append(dict(record, survived=1))
+
+    def export(self):
+        """
+        Hands records over to another instance (see merge), e.g. from learning worker to main process
+        """
+        self.discard_unassigned()
+        state = (self._complete, self._pending)
+        self._complete = []
+        self._pending = {}
+        return state
+
+    def merge(self, state):
+        complete, pending = state
+        self._complete.extend(complete)
+        for schema_set, records in pending.items():
+            self._pending.setdefault(schema_set, []).extend(records)
+
+    def close(self):
+        """
+        Survival of schemas waiting for deletion stays unknown
+        """
+        self.discard_unassigned()
+        for records in self._pending.values():
+            self._complete.extend(dict(record, survived='') for _, record in records)
+        self._pending = {}
+        self.flush()
+
+    def flush(self):
+        if self._path is None or not self._complete:
+            self._complete = []
+            return
+
+        dir_name = os.path.dirname(self._path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        if not self._is_header_checked:
+            self._move_outdated_log()
+            self._is_header_checked = True
+
+        is_new = not os.path.exists(self._path) or not os.path.getsize(self._path)
+        with open(self._path, 'a', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=self.FIELDS)
+            if is_new:
+                writer.writeheader()
+            writer.writerows(dict(record, run_id=self._run_id) for record in self._complete)
+        self._complete = []
+
+    def _move_outdated_log(self):
+        """
+        Log with other fields is moved aside, so that new records are not appended under its header
+        """
+        if not os.path.exists(self._path):
+            return
+
+        with open(self._path, newline='') as file:
+            header = next(csv.reader(file), None)
+        if header is not None and tuple(header) != self.FIELDS:
+            outdated_path = self._path + '.old'
+            os.replace(self._path, outdated_path)
+            print('Solve log with outdated fields is moved to {}'.format(outdated_path))
@@ -13,22 +13,69 @@ from model.inference import SchemaNetwork
 from model.visualizer import Visualizer
 from model.constants import Constants as C
 from model.schema_learner import GreedySchemaLearner
+from model.async_learner import AsyncSchemaLearner
+from model.checkpoint import ParamsCheckpoint
+from model import bit_utils
 from model.shaper import Shaper
 from testing.testing import HardcodedDeltaSchemaVectors
 
 
+class StaticSampleFilter:
+    """
+    Instantiate once per run.
+    Drops static samples (unchanged neighborhood, zero targets and zero reward) that are
+    exact copies of static samples passed earlier, so learner gets the same set of constraints.
+    """
+    def __init__(self):
+        # packed static sample -> number of its occurrences
+        self._counts = {}
+
+        self._n_samples_seen = 0
+        self._n_samples_passed = 0
+
+    def filter_batch(self, batch):
+        frame_vec_size = C.M * (C.NEIGHBORS_NUM + 1)
+        frames = batch.x[:, :C.FRAME_STACK_SIZE * frame_vec_size].reshape(
+            -1, C.FRAME_STACK_SIZE, frame_vec_size)
+
+        is_changed = (frames != frames[:, :1, :]).any(axis=(1, 2))
+        has_target = batch.y_creation.any(axis=1) | batch.y_destruction.any(axis=1)
+        static_indices = np.flatnonzero(~(is_changed | has_target | batch.r))
+
+        mask = np.ones(len(batch.x), dtype=bool)
+        for idx, row in zip(static_indices, bit_utils.pack_rows(batch.x[static_indices])):
+            key = row.tobytes()
+            count = self._counts.get(key, 0)
+            mask[idx] = (count == 0)
+            self._counts[key] = count + 1
+
+        self._n_samples_seen += mask.size
+        self._n_samples_passed += np.count_nonzero(mask)
+
+        return GreedySchemaLearner.Batch(*[part[mask] for part in batch])
+
+    def report(self):
+        print('Passed to learner {} of {} samples, {} unique static samples seen.'.format(
+            self._n_samples_passed, self._n_samples_seen, len(self._counts)))
+
+
 class LearningHandler:
     """
     Instantiate every episode
     """
-    def __init__(self, learner, shaper, n_max_steps):
+    def __init__(self, learner, shaper, n_max_steps, sample_filter=None):
         self._learner = learner
         self._shaper = shaper
         self._n_max_steps = n_max_steps
+        self._sample_filter = sample_filter
 
         self._observations = deque(maxlen=C.LEARNING_BATCH_SIZE)
         self._actions_taken = deque(maxlen=C.LEARNING_BATCH_SIZE)
 
+        # since last learning
+        self._n_mispredictions = 0
+        self._n_steps_without_learning = 0
+
     def _make_batch(self, reward):
         frame_stack = [self._observations[idx] for idx in range(C.FRAME_STACK_SIZE)]
         action = self._actions_taken[C.FRAME_STACK_SIZE - 1]
@@ -56,15 +103,55 @@ class LearningHandler:
 
         if len(self._observations) >= C.LEARNING_BATCH_SIZE:
             batch = self._make_batch(reward)
+            if self._sample_filter is not None:
+                batch = self._sample_filter.filter_batch(batch)
+
+            if C.LEARNING_TRIGGER == 'error':
+                self._n_mispredictions += self._learner.count_mispredictions(batch)
+            self._n_steps_without_learning += 1
 
             self._learner.set_curr_iter(curr_iter)
             self._learner.take_batch(batch)
 
-            if curr_step % C.LEARNING_PERIOD == 0 or curr_step == self._n_max_steps - 1:
-                self._learner.learn()
+            if self._is_learning_triggered(curr_step):
+                self._report_filtering()
+                self._run_learning()
+
+    def _is_learning_triggered(self, curr_step):
+        if C.LEARNING_TRIGGER == 'periodic':
+            return curr_step % C.LEARNING_PERIOD == 0 or curr_step == self._n_max_steps - 1
+        elif C.LEARNING_TRIGGER == 'error':
+            if curr_step == self._n_max_steps - 1:
+                return self._n_mispredictions > 0
+            if self._n_steps_without_learning < C.LEARNING_PERIOD:
+                return False
+            return (self._n_mispredictions >= C.LEARNING_ERROR_THRESHOLD
+                    or self._n_steps_without_learning >= C.MAX_LEARNING_PERIOD)
+        else:
+            assert False
+
+    def _run_learning(self):
+        if C.LEARNING_TRIGGER == 'error':
+            print('Learning on {} mispredicted samples of last {} steps.'.format(
+                self._n_mispredictions, self._n_steps_without_learning))
 
-    def flush(self):
         self._learner.learn()
+        self._n_mispredictions = 0
+        self._n_steps_without_learning = 0
+
+    def _report_filtering(self):
+        if self._sample_filter is not None:
+            self._sample_filter.report()
+
+    def flush(self):
+        """
+        Samples taken since last learning are left in learner's buffer, if current schemas predict all of them
+        """
+        if C.LEARNING_TRIGGER == 'error' and not self._n_mispredictions:
+            return
+
+        self._report_filtering()
+        self._run_learning()
 
 
 class PlanningHandler:
@@ -180,7 +267,13 @@ class Runner:
                            }[env_type]
 
         self._env_params = env_params
-        self._env_params.update({'report_nzis_as_entities': 'all'})
+        self._env_params.update({'report_nzis_as_entities': 'all',
+                                 'return_state_as_entity_matrix': True,
+                                 'report_debug_info': False})
+
+        # observations come directly from the engine instead of EntityExtractor
+        assert self._env_class.ENTITY_COLUMNS == (C.BALL_IDX, C.PADDLE_IDX, C.WALL_IDX,
+                                                  C.BRICK_IDX, C.VOID_IDX)
 
         assert n_max_iters is None or n_max_episodes is None
         self._n_max_steps = n_max_steps
@@ -194,17 +287,23 @@ class Runner:
 
     @staticmethod
     def _load_dumped_params():
-        dir_name = './dump'
-
         W_pos, W_neg, R = [], [], []
         names = ['w_pos', 'w_neg', 'r']
         matrix_counts = [C.N_PREDICTABLE_ATTRIBUTES, C.N_PREDICTABLE_ATTRIBUTES, 1]
+        matrix_names = [[name + '_{}'.format(idx) for idx in range(n_matrices)]
+                        for name, n_matrices in zip(names, matrix_counts)]
 
-        for params, name, n_matrices in zip((W_pos, W_neg, R), names, matrix_counts):
-            for idx in range(n_matrices):
-                file_name = name + '_{}.npy'.format(idx)
-                path = os.path.join(dir_name, file_name)
-                matrix = np.load(path, allow_pickle=False)
+        checkpoint = ParamsCheckpoint()
+        if checkpoint.get_versions():
+            named_matrices = checkpoint.load()
+        else:
+            # dump of older version, it is superseded by checkpoint of the next learn()
+            named_matrices = checkpoint.load_legacy(sum(matrix_names, []))
+            print('Loaded legacy params dump.')
+
+        for params, param_names in zip((W_pos, W_neg, R), matrix_names):
+            for name in param_names:
+                matrix = named_matrices[name]
                 assert matrix.dtype == bool
                 params.append(matrix)
 
@@ -232,28 +331,31 @@ class Runner:
         shaper = Shaper()
         visualizer = Visualizer(None, None, None)
 
-        learner = GreedySchemaLearner()
+        if C.USE_ASYNC_LEARNING:
+            learner = AsyncSchemaLearner()
+        else:
+            learner = GreedySchemaLearner()
         if C.DO_PRELOAD_DUMP_PARAMS:
             W_pos, W_neg, R = self._load_dumped_params()
             learner.set_params(W_pos, W_neg, R)
         planner = SchemaNetwork()
+        sample_filter = StaticSampleFilter() if C.DO_FILTER_STATIC_SAMPLES else None
 
         curr_iter = 0
 
         for episode_idx in range(self._n_max_episodes):
-            env.reset()
+            obs = env.reset()
             reward = 0
             episode_reward = 0
             step_idx = 0
 
-            learning_handler = LearningHandler(learner, shaper, self._n_max_steps)
+            learning_handler = LearningHandler(learner, shaper, self._n_max_steps, sample_filter)
             planning_handler = PlanningHandler(planner, env)
 
             for step_idx in range(self._n_max_steps):
                 if curr_iter % self._print_freq == 0:
                     print('\ncurr_iter: {}'.format(curr_iter))
 
-                obs = EntityExtractor.extract(env)
                 if C.VISUALIZE_STATE:
                     visualizer.set_iter(curr_iter)
                     visualizer.visualize_env_state(obs)
@@ -294,6 +396,8 @@ class Runner:
             if curr_iter >= self._n_max_iters:
                 break
 
+        learner.close()
+
 
 class Logger:
     def __init__(self):
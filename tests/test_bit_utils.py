@@ -0,0 +1,85 @@
+import unittest
+
+import numpy as np
+
+from model import bit_utils
+from model.bit_utils import *
+
+
+def _dense_activations(x, schemas):
+    """
+    missing[i, j]: number of bits of schema j absent in sample i
+    """
+    return (schemas[np.newaxis, :, :] & ~x[:, np.newaxis, :]).sum(axis=2)
+
+
+class TestBitUtils(unittest.TestCase):
+    def setUp(self):
+        # samples span several words, chunks hold few of them
+        self.n_bits = 253
+        self.chunk_size = bit_utils.CHUNK_SIZE
+        bit_utils.CHUNK_SIZE = 64
+
+        rng = np.random.RandomState(0)
+        self.x = rng.rand(50, self.n_bits) < 0.9
+
+        # sparse schemas, ones taken from samples and ones missing single bit of sample at word boundaries
+        schemas = [rng.rand(self.n_bits) < 0.02 for _ in range(10)]
+        for sample_idx, bit in ((0, 0), (1, 63), (2, 64), (3, 127), (4, 252)):
+            self.x[sample_idx, bit] = False
+            schema = self.x[sample_idx] & (rng.rand(self.n_bits) < 0.05)
+            schemas.append(schema.copy())
+            schema[bit] = True
+            schemas.append(schema)
+        self.schemas = np.array(schemas)
+
+    def tearDown(self):
+        bit_utils.CHUNK_SIZE = self.chunk_size
+
+    def test_pack_rows(self):
+        words = pack_rows(self.x)
+        self.assertEqual(words.dtype, np.uint64)
+        self.assertEqual(words.shape, (len(self.x), 4))
+        self.assertTrue(np.array_equal(unpack_rows(words, self.n_bits), self.x))
+
+        # padding bits are zero
+        padded = unpack_rows(words, 4 * WORD_N_BITS)
+        self.assertFalse(padded[:, self.n_bits:].any())
+
+    def test_activations(self):
+        missing = _dense_activations(self.x, self.schemas)
+        x_words, schema_words = pack_rows(self.x), pack_rows(self.schemas)
+
+        activations = find_activations(x_words, schema_words)
+        self.assertTrue(activations.any())
+        self.assertTrue(np.array_equal(activations, missing == 0))
+        self.assertTrue(np.array_equal(find_any_activation(x_words, schema_words), (missing == 0).any(axis=1)))
+
+        is_near_activated = find_near_activations(x_words, schema_words)
+        self.assertTrue(is_near_activated[:5].all())
+        self.assertTrue(np.array_equal(is_near_activated, (missing == 1).any(axis=1)))
+
+    def test_no_schemas(self):
+        x_words = pack_rows(self.x)
+        schema_words = pack_rows(np.zeros((0, self.n_bits), dtype=bool))
+
+        self.assertEqual(find_activations(x_words, schema_words).shape, (len(self.x), 0))
+        self.assertFalse(find_any_activation(x_words, schema_words).any())
+        self.assertFalse(find_near_activations(x_words, schema_words).any())
+
+    def test_find_supersets(self):
+        rows = np.concatenate((self.schemas, self.schemas[[2, 0]], self.schemas[[1]] | self.schemas[[3]]))
+        # is_subset[i, k]: bits of row k are subset of bits of row i
+        is_subset = _dense_activations(rows, rows) == 0
+        np.fill_diagonal(is_subset, False)
+        is_duplicate = is_subset & is_subset.T
+        answer = (is_subset & ~is_duplicate).any(axis=1) | np.tril(is_duplicate, k=-1).any(axis=1)
+
+        is_superset = find_supersets(pack_rows(rows))
+        self.assertTrue(np.array_equal(is_superset, answer))
+        self.assertTrue(is_superset[-3:].all())
+        self.assertFalse(is_superset[[0, 2]].any())
+
+    def test_count_zero_bits(self):
+        n_zero_bits = count_zero_bits(pack_rows(self.x), self.n_bits)
+        self.assertTrue(np.array_equal(n_zero_bits, (~self.x).sum(axis=0)))
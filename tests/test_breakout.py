@@ -0,0 +1,273 @@
+import hashlib
+import random
+import unittest
+
+import numpy as np
+
+from environment.schema_games.breakout.core import BreakoutEngine
+from environment.schema_games.breakout import games
+from environment.schema_games.breakout.games import StandardBreakout, RandomTargetBreakout
+from environment.schema_games.breakout.vector import VectorBreakout
+from model.entity_extractor import EntityExtractor
+
+
+class TestVectorBreakout(unittest.TestCase):
+    def setUp(self):
+        random.seed(0)
+        np.random.seed(0)
+        self.n_games = 3
+        self.params = {'report_nzis_as_entities': 'all',
+                       'return_state_as_entity_matrix': True,
+                       'report_debug_info': False}
+
+    def test_matches_standard_breakout(self):
+        vec = VectorBreakout(self.n_games, seed=0)
+        envs = [StandardBreakout(**self.params) for _ in range(self.n_games)]
+        matrices = np.stack([env.reset() for env in envs])
+
+        vec.load_games(envs)
+        self.assertTrue(np.array_equal(vec.get_entity_matrices(), matrices))
+
+        rng = np.random.RandomState(0)
+        n_brick_hits = 0
+        for step_idx in range(300):
+            actions = rng.randint(len(BreakoutEngine.ACTIONS), size=self.n_games)
+            results = [env.step(action) for env, action in zip(envs, actions)]
+            matrices, rewards, dones = vec.step(actions)
+
+            for game_idx, (env, (matrix, reward, done, _)) in enumerate(zip(envs, results)):
+                self.assertEqual(rewards[game_idx], reward)
+                self.assertEqual(dones[game_idx], done)
+                n_brick_hits += reward > 0
+
+                if reward < 0 or done:
+                    # balls respawn randomly, continue from the engine game
+                    if done:
+                        env.reset()
+                    vec.load_games([env], indices=[game_idx])
+                else:
+                    self.assertTrue(np.array_equal(matrices[game_idx], matrix))
+
+        self.assertGreater(n_brick_hits, 0)
+
+    def test_reset(self):
+        vec = VectorBreakout(self.n_games, seed=0)
+        matrices = vec.reset()
+        self.assertEqual(matrices.shape, (self.n_games, vec.width * vec.height,
+                                          len(BreakoutEngine.ENTITY_COLUMNS)))
+
+        n_balls = matrices[:, :, BreakoutEngine.BALL_COLUMN].sum(axis=1)
+        self.assertTrue(np.all(n_balls == 1))
+        self.assertTrue(np.all(vec.bricks_alive))
+        self.assertTrue(np.all(vec.lives == vec.num_lives))
+
+        # entities of a row are exclusive with void
+        n_entities = matrices.sum(axis=2)
+        self.assertTrue(np.all(n_entities >= 1))
+        self.assertFalse(np.any(matrices[:, :, BreakoutEngine.VOID_COLUMN] & (n_entities > 1)))
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        random.seed(0)
+        np.random.seed(0)
+
+    def _play(self, env, actions):
+        trajectory = []
+        for action in actions:
+            obs, reward, done, _ = env.step(action)
+            trajectory.append((obs, reward, done))
+            if done:
+                env.reset()
+        return trajectory
+
+    def _check_restore(self, env, n_warmup=50, n_steps=300):
+        env.reset()
+        rng = np.random.RandomState(0)
+        self._play(env, rng.randint(len(BreakoutEngine.ACTIONS), size=n_warmup))
+
+        snapshot = env.snapshot()
+        actions = rng.randint(len(BreakoutEngine.ACTIONS), size=n_steps)
+        expected = self._play(env, actions)
+        self.assertTrue(any(reward != 0 for _, reward, _ in expected))
+
+        env.restore(snapshot)
+        occupancy = env.occupancy.copy()
+        env.build_occupancy_grid()
+        self.assertTrue(np.array_equal(env.occupancy, occupancy))
+
+        for (obs, reward, done), (exp_obs, exp_reward, exp_done) in \
+                zip(self._play(env, actions), expected):
+            self.assertTrue(np.array_equal(obs, exp_obs))
+            self.assertEqual(reward, exp_reward)
+            self.assertEqual(done, exp_done)
+
+    def test_restore_entity_matrix(self):
+        env = StandardBreakout(report_nzis_as_entities='all',
+                               return_state_as_entity_matrix=True,
+                               report_debug_info=False)
+        self._check_restore(env)
+
+    def test_restore_random_target(self):
+        env = RandomTargetBreakout(return_state_as_image=True)
+        self._check_restore(env)
+
+
+# (game class name, its params, seed); default obstacle heights make reset hang
+VARIANTS = [('StandardBreakout', {}, 0),
+            ('MovingObstaclesBreakout', {'obstacles_heights': (10, 24, 30)}, 1),
+            ('RandomTargetBreakout', {}, 2),
+            ('JugglingBreakout', {}, 3),
+            ('OffsetPaddleBreakout', {}, 4),
+            ('MiddleWallBreakout', {}, 5),
+            ('StandardBreakout', {'num_balls': 2}, 6)]
+
+
+def _make_env(name, params, seed, **kwargs):
+    random.seed(seed)
+    np.random.seed(seed)
+    env_params = {'report_nzis_as_entities': 'all',
+                  'return_state_as_entity_matrix': True,
+                  'report_debug_info': False}
+    env_params.update(params)
+    env_params.update(kwargs)
+    return getattr(games, name)(**env_params)
+
+
+class TestOccupancyGrid(unittest.TestCase):
+    def _assert_grid_consistent(self, env):
+        tangible = [obj for obj in env.walls + env.bricks + env.miscellaneous + [env.paddle] if obj.visible]
+        object_nzis = [np.array(obj.offset_nzis).reshape(-1, 2) for obj in tangible]
+        xs, ys = np.concatenate(object_nzis).T
+        object_ids = np.repeat([obj.object_id for obj in tangible], [len(nzis) for nzis in object_nzis])
+
+        n_occupants = np.zeros((env.width, env.height), dtype=int)
+        np.add.at(n_occupants, (xs, ys), 1)
+        self.assertTrue(np.array_equal(env.n_occupants, n_occupants))
+
+        # pixels covered by single object hold its id
+        occupancy = np.full((env.width, env.height), env.EMPTY_CELL)
+        occupancy[xs, ys] = object_ids
+        is_single = n_occupants == 1
+        self.assertTrue(np.array_equal(env.occupancy[is_single], occupancy[is_single]))
+        self.assertTrue(np.all(env.occupancy[n_occupants == 0] == env.EMPTY_CELL))
+
+        # all objects covering shared pixels are looked up
+        is_shared = n_occupants[xs, ys] > 1
+        shared_occupants = {}
+        for x, y, object_id in zip(xs[is_shared].tolist(), ys[is_shared].tolist(), object_ids[is_shared].tolist()):
+            shared_occupants.setdefault((x, y), set()).add(object_id)
+        for position, ids in shared_occupants.items():
+            self.assertEqual({obj.object_id for obj in env.get_occupants(position)}, ids)
+
+    def test_matches_objects(self):
+        for name, params, seed in VARIANTS[:3]:
+            env = _make_env(name, params, seed)
+            env.reset()
+            self._assert_grid_consistent(env)
+
+            n_rebuilds = 0
+            for step_idx in range(300):
+                bricks = env.bricks
+                _, _, done, _ = env.step(np.random.randint(len(BreakoutEngine.ACTIONS)))
+                n_rebuilds += env.bricks is not bricks
+                self._assert_grid_consistent(env)
+                if done:
+                    env.reset()
+                    self._assert_grid_consistent(env)
+
+            # ResetterBrick replaces all bricks at once
+            if name == 'RandomTargetBreakout':
+                self.assertGreater(n_rebuilds, 0)
+
+
+    def test_shared_pixels(self):
+        env = _make_env('StandardBreakout', {}, 0)
+        env.reset()
+
+        # border walls meet at corners
+        corner = tuple(int(c) for c in np.argwhere(env.n_occupants > 1)[0])
+        first, second = env.get_occupants(corner)
+        self.assertEqual({first, second}, {wall for wall in env.walls if corner in wall.offset_nzis})
+        self.assertFalse(env.is_free_for(first, [corner]))
+        self.assertFalse(env.is_free_for(env.paddle, [corner]))
+
+        # corner is handed over to remaining wall and back
+        env.update_occupancy(first, in_game=False)
+        self.assertEqual(env.get_occupants(corner), [second])
+        self.assertTrue(env.is_free_for(second, [corner]))
+        self.assertFalse(env.is_free_for(first, [corner]))
+
+        env.update_occupancy(first)
+        self.assertEqual(set(env.get_occupants(corner)), {first, second})
+        self.assertFalse(env.is_free_for(second, [corner]))
+
+        # pixels out of the screen are free
+        self.assertEqual(env.get_occupants((-1, 0)), [])
+        self.assertTrue(env.is_free_for(env.paddle, env.paddle.offset_nzis + [(-1, 0), (env.width, 0)]))
+
+
+class TestEntityMatrix(unittest.TestCase):
+    def test_matches_extractor(self):
+        variants = [('StandardBreakout', {'report_nzis_as_entities': 'none'}, 0)] + VARIANTS[1:3] + VARIANTS[-1:]
+        for name, params, seed in variants:
+            env = _make_env(name, params, seed)
+            obs = env.reset()
+            self.assertTrue(np.array_equal(obs, EntityExtractor.extract(env)), msg=name)
+
+            n_rewards = 0
+            for step_idx in range(150):
+                obs, reward, done, _ = env.step(np.random.randint(len(BreakoutEngine.ACTIONS)))
+                self.assertTrue(np.array_equal(obs, EntityExtractor.extract(env)), msg=name)
+                n_rewards += reward != 0
+                if done:
+                    obs = env.reset()
+                    self.assertTrue(np.array_equal(obs, EntityExtractor.extract(env)), msg=name)
+            self.assertGreater(n_rewards, 0, msg=name)
+
+
+    def test_debug_info(self):
+        trajectories = []
+        for is_reported in (True, False):
+            env = _make_env('StandardBreakout', {}, 0, report_debug_info=is_reported)
+            env.reset()
+            trajectories.append([env.step(np.random.randint(len(BreakoutEngine.ACTIONS))) for _ in range(100)])
+
+        # skipped entity states do not change the game
+        for (obs, reward, done, info), (other_obs, other_reward, other_done, other_info) in zip(*trajectories):
+            self.assertTrue(info['entity_states'])
+            self.assertEqual(other_info, {})
+            self.assertTrue(np.array_equal(obs, other_obs))
+            self.assertEqual((reward, done), (other_reward, other_done))
+
+
+class TestTrajectories(unittest.TestCase):
+    # hashes of trajectories played by the engine before the occupancy grid and entity matrix were added
+    TRAJECTORY_HASHES = ['f0f0e52308bcfe3b9bfda148d1689b61',
+                         '2e252c5f07947e205a5b682748b58063',
+                         '222148cb44c16ee7dbf384995492408a',
+                         '9ab59256d40f56ba65d0b9477f7ed299',
+                         '8b7192970c98bf26c9debc1ed3a5644e',
+                         'fc1a3d73faf18baf106def8c551a2423',
+                         '504b3a2c255cd612eddf9b99c11b8ddd']
+
+    @staticmethod
+    def _hash_trajectory(env, n_steps=500):
+        digest = hashlib.md5()
+        env.reset()
+        for step_idx in range(n_steps):
+            _, reward, done, _ = env.step(np.random.randint(len(BreakoutEngine.ACTIONS)))
+            digest.update(repr((
+                [tuple(int(c) for c in ball.position) for ball in env.balls],
+                tuple(int(c) for c in env.paddle.position), tuple(int(c) for c in env.paddle.shape),
+                [tuple(int(c) for c in brick.position) for brick in env.bricks],
+                [tuple(int(c) for c in obj.position) for obj in env.miscellaneous],
+                float(reward), bool(done))).encode())
+            if done:
+                env.reset()
+        return digest.hexdigest()
+
+    def test_same_as_before(self):
+        for (name, params, seed), trajectory_hash in zip(VARIANTS, self.TRAJECTORY_HASHES):
+            env = _make_env(name, params, seed)
+            self.assertEqual(self._hash_trajectory(env), trajectory_hash, msg=name)
@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from model.checkpoint import *
+from model.schema_learner import ParamMatrix
+from model.constants import Constants as C
+
+
+def _make_params(vectors):
+    params = ParamMatrix()
+    for vec in vectors:
+        params.add_vector(np.array(vec, dtype=bool))
+    return params
+
+
+class TestParamsCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.vec_size = C.SCHEMA_VEC_SIZE
+        self.samples = np.eye(self.vec_size, dtype=bool)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as dir_name:
+            checkpoint = ParamsCheckpoint(dir_name, n_kept_versions=2)
+            named_params = {'w': _make_params(self.samples[:2]), 'r': _make_params([])}
+            self.assertEqual(checkpoint.save(named_params), 1)
+
+            named_matrices = ParamsCheckpoint(dir_name).load()
+            self.assertTrue(np.array_equal(named_matrices['w'], self.samples[:2].T))
+            self.assertEqual(named_matrices['r'].shape, (self.vec_size, 0))
+
+    def test_unchanged_matrices_reused(self):
+        with tempfile.TemporaryDirectory() as dir_name:
+            checkpoint = ParamsCheckpoint(dir_name, n_kept_versions=2)
+            named_params = {'w': _make_params(self.samples[:1]), 'r': _make_params(self.samples[1:2])}
+            checkpoint.save(named_params)
+
+            named_params['w'].add_vector(self.samples[2])
+            checkpoint.save(named_params)
+            self.assertEqual(sorted(os.listdir(dir_name)),
+                             ['params_1.json', 'params_2.json', 'r_1.npy', 'w_1.npy', 'w_2.npy'])
+
+            # only last versions and files referenced by them are kept
+            named_params['r'].add_vector(self.samples[2])
+            checkpoint.save(named_params)
+            self.assertEqual(sorted(os.listdir(dir_name)),
+                             ['params_2.json', 'params_3.json', 'r_1.npy', 'r_3.npy', 'w_2.npy'])
+
+            self.assertTrue(np.array_equal(checkpoint.load(2)['w'], self.samples[[0, 2]].T))
+            self.assertTrue(np.array_equal(checkpoint.load(2)['r'], self.samples[[1]].T))
+            self.assertTrue(np.array_equal(checkpoint.load()['r'], self.samples[[1, 2]].T))
+
+    def test_interrupted_save(self):
+        with tempfile.TemporaryDirectory() as dir_name:
+            checkpoint = ParamsCheckpoint(dir_name)
+            checkpoint.save({'w': _make_params(self.samples[:1])})
+
+            # manifest of next version was not renamed
+            with open(os.path.join(dir_name, 'params_2.json.tmp'), 'w') as file:
+                file.write('{')
+
+            checkpoint = ParamsCheckpoint(dir_name)
+            self.assertEqual(checkpoint.get_versions(), [1])
+            self.assertTrue(np.array_equal(checkpoint.load()['w'], self.samples[:1].T))
+            self.assertEqual(checkpoint.save({'w': _make_params(self.samples[1:2])}), 2)
+
+
+    def test_foreign_files_kept(self):
+        with tempfile.TemporaryDirectory() as dir_name:
+            # legacy dump and user's file look like matrix files, temporary file left by interrupted save
+            legacy_matrix = self.samples[:2].T.copy()
+            np.save(os.path.join(dir_name, 'w_0.npy'), legacy_matrix, allow_pickle=False)
+            np.save(os.path.join(dir_name, 'notes.npy'), np.zeros(1), allow_pickle=False)
+            for file_name in ('w_7.npy.tmp', 'notes.tmp'):
+                open(os.path.join(dir_name, file_name), 'w').close()
+
+            checkpoint = ParamsCheckpoint(dir_name, n_kept_versions=1)
+            self.assertEqual(checkpoint.get_versions(), [])
+            named_matrices = checkpoint.load_legacy(['w_0'])
+            self.assertTrue(np.array_equal(named_matrices['w_0'], legacy_matrix))
+
+            named_params = {'w': _make_params(self.samples[:1])}
+            checkpoint.save(named_params)
+            named_params['w'].add_vector(self.samples[1])
+            checkpoint.save(named_params)
+            self.assertEqual(sorted(os.listdir(dir_name)),
+                             ['notes.npy', 'notes.tmp', 'params_2.json', 'w_0.npy', 'w_2.npy'])
+
+            with self.assertRaisesRegex(AssertionError, 'no params checkpoints or legacy dumps'):
+                checkpoint.load_legacy(['r_0'])
+
+    def test_dir_from_constants(self):
+        with tempfile.TemporaryDirectory() as dir_name:
+            checkpoint_dir = C.CHECKPOINT_DIR
+            C.CHECKPOINT_DIR = dir_name
+            try:
+                ParamsCheckpoint().save({'w': _make_params(self.samples[:1])})
+            finally:
+                C.CHECKPOINT_DIR = checkpoint_dir
+            self.assertEqual(sorted(os.listdir(dir_name)), ['params_1.json', 'w_1.npy'])
@@ -0,0 +1,156 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from model.replay_buffer import *
+from model.bit_utils import unpack_rows
+from model.constants import Constants as C
+
+
+def _gen_batch(x, r):
+    x = np.array(x, dtype=bool)
+    y = np.zeros((len(x), C.N_PREDICTABLE_ATTRIBUTES), dtype=bool)
+    return Batch(x, y, y.copy(), np.array(r, dtype=bool))
+
+
+class TestReplayBuffer(unittest.TestCase):
+    def setUp(self):
+        self.vec_size = C.SCHEMA_VEC_SIZE
+        self.samples = np.eye(self.vec_size, dtype=bool)
+
+    def test_deduplication(self):
+        replay = ReplayBuffer()
+        new_batch, renewed = replay.add(_gen_batch(self.samples[[0, 1, 0]], [1, 1, 1]))
+        self.assertEqual(len(replay), 2)
+        self.assertEqual(len(new_batch.x), 2)
+        self.assertEqual(renewed.size, 0)
+
+        new_batch, renewed = replay.add(_gen_batch(self.samples[[1, 2]], [1, 1]))
+        self.assertEqual(len(replay), 3)
+        self.assertTrue(np.array_equal(new_batch.x, self.samples[[2]]))
+        self.assertTrue(np.array_equal(unpack_rows(replay.get_batch().x, self.vec_size), self.samples[[0, 1, 2]]))
+        self.assertIn(self.samples[2], replay)
+
+    def test_reward_nullification(self):
+        replay = ReplayBuffer()
+        replay.add(_gen_batch(self.samples[[0, 1]], [1, 1]))
+
+        new_batch, renewed = replay.add(_gen_batch(self.samples[[1, 2, 2]], [0, 1, 0]))
+        self.assertTrue(np.array_equal(renewed, [1]))
+        self.assertTrue(np.array_equal(new_batch.r, [False]))
+        self.assertTrue(np.array_equal(replay.get_batch().r, [True, False, False]))
+
+        # zero reward is never reverted
+        new_batch, renewed = replay.add(_gen_batch(self.samples[[1]], [1]))
+        self.assertEqual(renewed.size, 0)
+        self.assertFalse(replay.get_batch().r[1])
+
+    def test_growth(self):
+        class SmallReplayBuffer(ReplayBuffer):
+            INITIAL_CAPACITY = 2
+
+        replay = SmallReplayBuffer()
+        for idx in range(self.vec_size):
+            replay.add(_gen_batch(self.samples[[idx]], [1]))
+        self.assertEqual(len(replay), self.vec_size)
+        self.assertTrue(np.array_equal(unpack_rows(replay.get_batch().x, self.vec_size), self.samples))
+
+    def test_compact(self):
+        replay = ReplayBuffer()
+        replay.add(_gen_batch(self.samples[[0, 1, 2]], [1, 1, 1]))
+
+        replay.compact(np.array([True, False, True]))
+        self.assertEqual(len(replay), 2)
+        self.assertTrue(np.array_equal(unpack_rows(replay.get_batch().x, self.vec_size), self.samples[[0, 2]]))
+        self.assertNotIn(self.samples[1], replay)
+
+        # evicted sample is appended again, seen ones keep their new indices
+        new_batch, renewed = replay.add(_gen_batch(self.samples[[1, 2]], [1, 0]))
+        self.assertEqual(len(new_batch.x), 1)
+        self.assertTrue(np.array_equal(renewed, [1]))
+        self.assertTrue(np.array_equal(replay.get_batch().r, [True, False, True]))
+
+    def test_persistence(self):
+        class SmallReplayBuffer(ReplayBuffer):
+            INITIAL_CAPACITY = 2
+
+        with tempfile.TemporaryDirectory() as dir_name:
+            replay = SmallReplayBuffer(dir_name)
+            replay.add(_gen_batch(self.samples[[0, 1, 2]], [1, 1, 0]))
+            del replay
+
+            replay = SmallReplayBuffer(dir_name)
+            self.assertEqual(len(replay), 3)
+            self.assertIn(self.samples[1], replay)
+
+            new_batch, renewed = replay.add(_gen_batch(self.samples[[0, 1]], [0, 1]))
+            self.assertEqual(len(new_batch.x), 0)
+            self.assertTrue(np.array_equal(renewed, [0]))
+
+            shared_replay = ReplayBuffer(dir_name, read_only=True)
+            self.assertTrue(np.array_equal(shared_replay.get_batch().r, [False, True, False]))
+            self.assertTrue(np.array_equal(unpack_rows(shared_replay.get_batch().x, self.vec_size),
+                                           self.samples[[0, 1, 2]]))
+
+    def test_compaction_crash(self):
+        class CrashingReplayBuffer(ReplayBuffer):
+            def _write_meta(self):
+                if self._generation:
+                    raise RuntimeError('crash')
+                super(CrashingReplayBuffer, self)._write_meta()
+
+        with tempfile.TemporaryDirectory() as dir_name:
+            replay = CrashingReplayBuffer(dir_name)
+            replay.add(_gen_batch(self.samples[[0, 1, 2]], [1, 1, 0]))
+            with self.assertRaises(RuntimeError):
+                replay.compact(np.array([False, True, True]))
+            del replay
+
+            # interrupted compaction leaves replay as it was
+            replay = ReplayBuffer(dir_name)
+            self.assertEqual(len(replay), 3)
+            self.assertTrue(np.array_equal(unpack_rows(replay.get_batch().x, self.vec_size),
+                                           self.samples[[0, 1, 2]]))
+            self.assertEqual(sorted(os.listdir(dir_name)),
+                             sorted([name + '.dat' for name in ReplayBuffer.PART_NAMES] + ['meta.json']))
+
+            replay.compact(np.array([False, True, True]))
+            replay.add(_gen_batch(self.samples[[0]], [1]))
+            del replay
+
+            replay = ReplayBuffer(dir_name)
+            self.assertEqual(len(replay), 3)
+            self.assertTrue(np.array_equal(unpack_rows(replay.get_batch().x, self.vec_size),
+                                           self.samples[[1, 2, 0]]))
+            self.assertTrue(np.array_equal(replay.get_batch().r, [True, False, True]))
+            self.assertEqual(sorted(os.listdir(dir_name)),
+                             sorted([name + '.1.dat' for name in ReplayBuffer.PART_NAMES] + ['meta.json']))
+
+
+class TestSampleBuffer(unittest.TestCase):
+    def setUp(self):
+        self.vec_size = C.SCHEMA_VEC_SIZE
+        self.samples = np.eye(self.vec_size, dtype=bool)
+
+    def test_flush(self):
+        class SmallSampleBuffer(SampleBuffer):
+            INITIAL_CAPACITY = 2
+
+        buff = SmallSampleBuffer()
+        buff.add(_gen_batch(self.samples[[0, 1]], [1, 1]))
+        buff.add(_gen_batch(self.samples[[1, 2]], [0, 0]))
+        buff.add(_gen_batch(self.samples[[0]], [1]))
+        self.assertEqual(len(buff), 5)
+
+        batch = buff.flush()
+        self.assertEqual(len(buff), 0)
+        self.assertTrue(np.array_equal(batch.x, self.samples[[0, 1, 2]]))
+        self.assertTrue(np.array_equal(batch.r, [True, False, False]))
+
+        # storage is reused
+        buff.add(_gen_batch(self.samples[[2]], [1]))
+        batch = buff.flush()
+        self.assertTrue(np.array_equal(batch.x, self.samples[[2]]))
+        self.assertTrue(np.array_equal(batch.r, [True]))
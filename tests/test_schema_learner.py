@@ -1,12 +1,31 @@
+import csv
+import os
+import tempfile
 import unittest
 
 import numpy as np
 
 from model.schema_learner import *
+from model.bit_utils import pack_rows, unpack_rows
+from model.solve_log import SolveLog
 from model.constants import Constants as C
 
 C.SCHEMA_VEC_SIZE = 3
 C.N_PREDICTABLE_ATTRIBUTES = 1
+C.SOLVE_LOG_PATH = None
+
+_checkpoint_dir = None
+
+
+def setUpModule():
+    # learners save params checkpoints on every learn()
+    global _checkpoint_dir
+    _checkpoint_dir = tempfile.TemporaryDirectory()
+    C.CHECKPOINT_DIR = _checkpoint_dir.name
+
+
+def tearDownModule():
+    _checkpoint_dir.cleanup()
 
 
 class TestPurgeMatrixColumns(unittest.TestCase):
@@ -142,3 +161,523 @@ class TestLearn(unittest.TestCase):
 
 
 
+
+
+def _gen_toy_batches():
+    x = np.array([[0, 0, 0],
+                  [0, 0, 1],
+                  [0, 1, 0],
+                  [1, 0, 0],
+                  [0, 1, 1],
+                  [1, 1, 0],
+                  [1, 0, 1]]).astype(bool)
+    y = np.array([0, 0, 0, 0, 0, 0, 1]).astype(bool).reshape(-1, 1)
+    r = np.array([0, 0, 0, 0, 1, 1, 0]).astype(bool)
+    return [GreedySchemaLearner.Batch(x[i:i+1], y[i:i+1], ~y[i:i+1], r[i:i+1])
+            for i in range(len(x))]
+
+
+def _predict(x, matrix):
+    return (~(~x @ matrix)).any(axis=1)
+
+
+class TestParallelLearn(unittest.TestCase):
+    def test_same_as_sequential(self):
+        batches = _gen_toy_batches()
+        results = []
+        n_learning_processes = C.N_LEARNING_PROCESSES
+        try:
+            for use_parallel_learning in (False, True):
+                C.USE_PARALLEL_LEARNING = use_parallel_learning
+                C.N_LEARNING_PROCESSES = 2
+
+                learner = GreedySchemaLearner()
+                for batch in batches:
+                    learner.take_batch(batch)
+                learner.learn()
+                learner.close()
+                results.append(learner.get_params())
+        finally:
+            C.USE_PARALLEL_LEARNING = False
+            C.N_LEARNING_PROCESSES = n_learning_processes
+
+        x = np.concatenate([batch.x for batch in batches])
+        y = np.concatenate([batch.y_creation for batch in batches])
+        r = np.concatenate([batch.r for batch in batches])
+
+        (seq_W_pos, seq_W_neg, seq_R), (par_W_pos, par_W_neg, par_R) = results
+        self.assertTrue(np.array_equal(_predict(x, seq_W_pos[0]), y[:, 0]))
+        self.assertTrue(np.array_equal(_predict(x, seq_R[0]), r))
+        for seq_params, par_params in ((seq_W_pos, par_W_pos), (seq_W_neg, par_W_neg), (seq_R, par_R)):
+            for seq_matrix, par_matrix in zip(seq_params, par_params):
+                self.assertTrue(np.array_equal(_predict(x, seq_matrix), _predict(x, par_matrix)))
+
+    def test_incremental_constraints(self):
+        def make_batch(sample, reward):
+            x = np.array([sample], dtype=bool)
+            y = np.zeros((1, 1), dtype=bool)
+            return GreedySchemaLearner.Batch(x, y, y, np.array([reward], dtype=bool))
+
+        n_learning_processes = C.N_LEARNING_PROCESSES
+        capacity = C.REPLAY_CAPACITY
+        C.USE_PARALLEL_LEARNING = True
+        C.N_LEARNING_PROCESSES = 2
+        try:
+            learner = GreedySchemaLearner()
+            for sample, reward in (([0, 1, 1], True), ([0, 0, 0], False), ([1, 0, 0], False)):
+                learner.take_batch(make_batch(sample, reward))
+            learner.learn()
+            self.assertIn((learner.REWARD_T, None), learner._job_owners)
+
+            # workers get only new samples, nullified reward and eviction
+            C.REPLAY_CAPACITY = 4
+            for sample, reward in (([0, 1, 1], False), ([1, 1, 0], True), ([0, 1, 0], False), ([1, 0, 1], False)):
+                learner.take_batch(make_batch(sample, reward))
+            learner.learn()
+            self.assertEqual(learner._n_dropped_replay_changes, 2)
+            self.assertFalse(learner._replay_changes)
+            learner.close()
+        finally:
+            C.USE_PARALLEL_LEARNING = False
+            C.N_LEARNING_PROCESSES = n_learning_processes
+            C.REPLAY_CAPACITY = capacity
+
+        replay_batch = learner._get_replay_batch()
+        x = unpack_rows(replay_batch.x, C.SCHEMA_VEC_SIZE)
+        W_pos, W_neg, R = learner.get_params()
+        self.assertEqual(len(x), 3)
+        self.assertTrue(np.array_equal(_predict(x, R[0]), replay_batch.r))
+
+    def test_worker_failure(self):
+        batches = _gen_toy_batches()
+        n_learning_processes = C.N_LEARNING_PROCESSES
+        C.USE_PARALLEL_LEARNING = True
+        C.N_LEARNING_PROCESSES = 2
+        try:
+            learner = GreedySchemaLearner()
+            for batch in batches[:4]:
+                learner.take_batch(batch)
+            learner.learn()
+
+            # schema sets are learned sequentially when process is gone
+            process, _ = learner._workers[0]
+            process.terminate()
+            process.join()
+            for batch in batches[4:]:
+                learner.take_batch(batch)
+            learner.learn()
+            self.assertIsNone(learner._workers)
+            learner.close()
+        finally:
+            C.USE_PARALLEL_LEARNING = False
+            C.N_LEARNING_PROCESSES = n_learning_processes
+
+        x = np.concatenate([batch.x for batch in batches])
+        y = np.concatenate([batch.y_creation for batch in batches])
+        r = np.concatenate([batch.r for batch in batches])
+        W_pos, W_neg, R = learner.get_params()
+        self.assertTrue(np.array_equal(_predict(x, W_pos[0]), y[:, 0]))
+        self.assertTrue(np.array_equal(_predict(x, R[0]), r))
+
+
+class TestAsyncLearn(unittest.TestCase):
+    def test_snapshot(self):
+        from model.async_learner import AsyncSchemaLearner
+
+        learner = AsyncSchemaLearner()
+        self.assertEqual(learner.params_version, 0)
+
+        batches = _gen_toy_batches()
+        for batch in batches:
+            learner.take_batch(batch)
+        learner.learn()
+        learner.close()
+        self.assertEqual(learner.params_version, 1)
+
+        x = np.concatenate([batch.x for batch in batches])
+        y = np.concatenate([batch.y_creation for batch in batches])
+
+        W_pos, W_neg, R = learner.get_params()
+        self.assertTrue(np.array_equal(_predict(x, W_pos[0]), y[:, 0]))
+
+        # predicts by snapshot the same way as learner it was taken from
+        sync_learner = GreedySchemaLearner()
+        sync_learner.set_params(W_pos, W_neg, R)
+        all_samples = GreedySchemaLearner.Batch(*[np.concatenate(parts) for parts in zip(*batches)])
+        self.assertEqual(learner.count_mispredictions(all_samples), sync_learner.count_mispredictions(all_samples))
+
+    def test_failure(self):
+        from model.async_learner import AsyncSchemaLearner
+
+        learner = AsyncSchemaLearner()
+        # params of wrong size are rejected by background process
+        matrix = np.ones((C.SCHEMA_VEC_SIZE + 1, 1), dtype=bool)
+        learner.set_params([matrix], [matrix], [matrix])
+        learner._worker.join(timeout=30)
+        self.assertFalse(learner._worker.is_alive())
+
+        with self.assertRaisesRegex(RuntimeError, 'Learning process failed'):
+            learner.get_params()
+        with self.assertRaisesRegex(RuntimeError, 'Learning process failed'):
+            learner.take_batch(_gen_toy_batches()[0])
+        with self.assertRaisesRegex(RuntimeError, 'Learning process failed'):
+            learner.learn()
+
+
+class TestCoverage(unittest.TestCase):
+    def _assert_coverage_consistent(self, learner):
+        x = unpack_rows(learner._replay.get_batch().x, C.SCHEMA_VEC_SIZE)
+        for (schema_type, attr_idx), coverage in learner._coverage.items():
+            matrix = learner._get_param_matrix(schema_type, attr_idx).get_matrix()
+            self.assertTrue(np.array_equal(coverage, _predict(x, matrix)[:len(coverage)]))
+
+    def test_incremental_updates(self):
+        def make_batch(sample, reward):
+            x = np.array([sample], dtype=bool)
+            y = np.zeros((1, 1), dtype=bool)
+            return GreedySchemaLearner.Batch(x, y, y, np.array([reward], dtype=bool))
+
+        learner = GreedySchemaLearner()
+        learner.take_batch(make_batch([0, 1, 1], True))
+        learner.take_batch(make_batch([0, 0, 0], False))
+        learner.learn()
+        self.assertEqual(learner.get_params()[2][0].shape[1], 1)
+        self._assert_coverage_consistent(learner)
+
+        # simplest reward schema has single bit set, so one of these samples contradicts it
+        learner.take_batch(make_batch([0, 1, 0], False))
+        learner.take_batch(make_batch([0, 0, 1], False))
+        learner.learn()
+        self._assert_coverage_consistent(learner)
+
+
+class TestParamMatrix(unittest.TestCase):
+    def test_slots(self):
+        vectors = np.array([[0, 0, 1],
+                            [0, 1, 0],
+                            [0, 1, 1],
+                            [1, 0, 0],
+                            [1, 0, 1]]).astype(bool)
+
+        params = ParamMatrix()
+        params.FRAGMENTATION_THRESHOLD = 0.5
+        for vec in vectors:
+            params.add_vector(vec)
+        self.assertTrue(np.array_equal(params.get_matrix(), vectors.T))
+
+        # purged slot is reused by next vector
+        params.purge_vectors(np.array([1]))
+        self.assertTrue(np.array_equal(params.get_matrix(), vectors[[0, 2, 3, 4]].T))
+        params.add_vector(np.array([1, 1, 0], dtype=bool))
+        self.assertTrue(np.array_equal(params.get_matrix()[:, 1], [1, 1, 0]))
+        self.assertEqual(params._n_used_slots, 5)
+
+        # fragmentation beyond threshold triggers compaction
+        params.purge_vectors(np.array([0, 2, 4]))
+        self.assertEqual(params._n_used_slots, 2)
+        self.assertTrue(np.array_equal(params.get_matrix(), np.array([[1, 1, 0],
+                                                                      [1, 0, 0]], dtype=bool).T))
+        self.assertTrue(np.array_equal(params.get_packed(), pack_rows(params.get_matrix().T)))
+
+        params.purge_vectors(np.array([0, 1]))
+        self.assertEqual(params.get_matrix().shape, (C.SCHEMA_VEC_SIZE, 0))
+        self.assertTrue(params.mult_me.all())
+
+
+class TestPruneSubsumedSchemas(unittest.TestCase):
+    def test_prune(self):
+        vectors = np.array([[1, 1, 0],
+                            [0, 1, 0],
+                            [0, 1, 1],
+                            [1, 0, 0],
+                            [1, 0, 0],
+                            [1, 0, 1]]).astype(bool)
+
+        learner = GreedySchemaLearner()
+        for vec in vectors:
+            learner._R.add_vector(vec)
+
+        self.assertEqual(learner._prune_subsumed_schemas(), 4)
+        self.assertTrue(np.array_equal(learner._R.get_matrix(), vectors[[1, 3]].T))
+
+
+class TestReplayEviction(unittest.TestCase):
+    def test_essential_samples_kept(self):
+        def make_batch(sample, reward):
+            x = np.array([sample], dtype=bool)
+            y = np.zeros((1, 1), dtype=bool)
+            return GreedySchemaLearner.Batch(x, y, y, np.array([reward], dtype=bool))
+
+        learner = GreedySchemaLearner()
+        learner._R.add_vector(np.array([0, 1, 1], dtype=bool))
+        # near negatives of the schema, positive covered by it, far negative, uncovered positive
+        for sample, reward in (([0, 1, 0], False), ([0, 0, 1], False), ([0, 1, 1], True),
+                               ([0, 0, 0], False), ([1, 0, 0], True)):
+            learner.take_batch(make_batch(sample, reward))
+        learner._add_to_replay_and_constraints_buff(learner._get_buff_batch())
+
+        capacity = C.REPLAY_CAPACITY
+        C.REPLAY_CAPACITY = 4
+        try:
+            learner._evict_replay_samples()
+        finally:
+            C.REPLAY_CAPACITY = capacity
+
+        x = unpack_rows(learner._replay.get_batch().x, C.SCHEMA_VEC_SIZE)
+        self.assertTrue(np.array_equal(x, np.array([[0, 1, 0],
+                                                    [0, 0, 1],
+                                                    [1, 0, 0]], dtype=bool)))
+        self.assertEqual(len(learner._reward_mip_model._constraints_buff), 3)
+        self.assertTrue(np.array_equal(learner._coverage[(learner.REWARD_T, None)], [False, False, False]))
+
+
+class TestReplayRestoration(unittest.TestCase):
+    def test_resume(self):
+        batches = _gen_toy_batches()
+        with tempfile.TemporaryDirectory() as dir_name:
+            learner = GreedySchemaLearner(replay_dir=dir_name)
+            for batch in batches:
+                learner.take_batch(batch)
+            learner.learn()
+            del learner
+
+            learner = GreedySchemaLearner(replay_dir=dir_name)
+            self.assertEqual(len(learner._reward_mip_model._constraints_buff), len(batches))
+            learner.learn()
+
+        x = np.concatenate([batch.x for batch in batches])
+        r = np.concatenate([batch.r for batch in batches])
+        W_pos, W_neg, R = learner.get_params()
+        self.assertTrue(np.array_equal(_predict(x, R[0]), r))
+
+
+    def test_dir_from_constants(self):
+        with tempfile.TemporaryDirectory() as dir_name:
+            replay_dir = C.REPLAY_DIR
+            C.REPLAY_DIR = dir_name
+            try:
+                learner = GreedySchemaLearner()
+                learner.take_batch(_gen_toy_batches()[0])
+                learner.learn()
+            finally:
+                C.REPLAY_DIR = replay_dir
+            self.assertIn(ReplayBuffer.META_FILE_NAME, os.listdir(dir_name))
+
+
+class TestMipStart(unittest.TestCase):
+    def test_deleted_schema_narrowing(self):
+        learner = GreedySchemaLearner()
+        seed_words = pack_rows(np.array([[1, 1, 1]], dtype=bool))[0]
+        negatives = pack_rows(np.array([[0, 1, 1]], dtype=bool))
+        deleted_schemas = np.array([[0, 1, 0]], dtype=bool).T
+        objective_coefficients = np.ones(C.SCHEMA_VEC_SIZE)
+
+        start = learner._get_mip_start(seed_words, negatives, deleted_schemas, objective_coefficients)
+        self.assertTrue(np.array_equal(start, [1, 1, 0]))
+
+        # no schema activated by seed can exclude negative containing it
+        negatives = pack_rows(np.array([[1, 1, 1]], dtype=bool))
+        self.assertIsNone(learner._get_mip_start(seed_words, negatives, deleted_schemas, objective_coefficients))
+
+
+class TestSeedQuarantine(unittest.TestCase):
+    def test_contradicting_seed(self):
+        def make_batch(sample, reward):
+            x = np.array([sample], dtype=bool)
+            y = np.zeros((1, 1), dtype=bool)
+            return GreedySchemaLearner.Batch(x, y, y, np.array([reward], dtype=bool))
+
+        learner = GreedySchemaLearner()
+        # positive sample is contained in negative one
+        learner.take_batch(make_batch([0, 1, 0], True))
+        learner.take_batch(make_batch([1, 1, 0], False))
+
+        for _ in range(2):
+            learner.learn()
+            n_failures, retry_from = learner._get_seed_failures(learner.REWARD_T, None, 2)
+            self.assertTrue(np.array_equal(n_failures, [1, 0]))
+            self.assertGreater(retry_from[0], learner._n_learn_calls)
+            self.assertEqual(learner.get_params()[2][0].shape[1], 0)
+
+
+class TestJointLearn(unittest.TestCase):
+    def test_toy(self):
+        C.LEARNING_MODE = 'joint'
+        try:
+            learner = GreedySchemaLearner()
+            batches = _gen_toy_batches()
+            for batch in batches:
+                learner.take_batch(batch)
+            learner.learn()
+        finally:
+            C.LEARNING_MODE = 'greedy'
+
+        x = np.concatenate([batch.x for batch in batches])
+        y = np.concatenate([batch.y_creation for batch in batches])
+        r = np.concatenate([batch.r for batch in batches])
+
+        W_pos, W_neg, R = learner.get_params()
+        self.assertTrue(np.array_equal(_predict(x, W_pos[0]), y[:, 0]))
+        self.assertTrue(np.array_equal(_predict(x, R[0]), r))
+
+
+class TestLearningBudget(unittest.TestCase):
+    def test_carry_over(self):
+        learner = GreedySchemaLearner()
+        batches = _gen_toy_batches()
+        for batch in batches:
+            learner.take_batch(batch)
+
+        C.LEARNING_TIME_BUDGET = 0
+        try:
+            learner.learn()
+        finally:
+            C.LEARNING_TIME_BUDGET = 300
+
+        W_pos, W_neg, R = learner.get_params()
+        self.assertEqual(W_pos[0].shape[1] + R[0].shape[1], 0)
+        self.assertTrue({(learner.CREATION_T, 0), (learner.REWARD_T, None)} <= learner._unfinished_jobs)
+
+        # unfinished schema sets are continued first
+        replay_batch = learner._get_replay_batch()
+        learner._unfinished_jobs = {(learner.REWARD_T, None)}
+        schedule = learner._schedule_jobs(replay_batch, learner._gen_learning_jobs())
+        self.assertEqual(schedule[0][:2], (learner.REWARD_T, None))
+        self.assertAlmostEqual(sum(job[2] for job in schedule), C.LEARNING_TIME_BUDGET)
+
+        learner.learn()
+        self.assertFalse(learner._unfinished_jobs)
+
+        x = np.concatenate([batch.x for batch in batches])
+        y = np.concatenate([batch.y_creation for batch in batches])
+        r = np.concatenate([batch.r for batch in batches])
+
+        W_pos, W_neg, R = learner.get_params()
+        self.assertTrue(np.array_equal(_predict(x, W_pos[0]), y[:, 0]))
+        self.assertTrue(np.array_equal(_predict(x, R[0]), r))
+
+    def test_simplify_without_solution(self):
+        class NoSolutionModel:
+            MAX_OPT_SECONDS = 1
+
+            def optimize(self, *args, **kwargs):
+                return None
+
+        learner = GreedySchemaLearner()
+        schema_vector = np.array([1., 0., 1.])
+        result = learner._simplify_schema(np.zeros(2, dtype=bool), schema_vector, NoSolutionModel())
+        self.assertTrue(np.array_equal(result, schema_vector))
+
+
+class TestCountMispredictions(unittest.TestCase):
+    def test_before_and_after_learning(self):
+        learner = GreedySchemaLearner()
+        # destruction targets of toy samples contradict each other, so they are not learnable
+        batches = [batch._replace(y_destruction=np.zeros_like(batch.y_destruction))
+                   for batch in _gen_toy_batches()]
+        all_samples = GreedySchemaLearner.Batch(*[np.concatenate(parts) for parts in zip(*batches)])
+
+        n_positives = np.count_nonzero(all_samples.y_creation[:, 0] | all_samples.r)
+        self.assertEqual(learner.count_mispredictions(all_samples), n_positives)
+
+        for batch in batches:
+            learner.take_batch(batch)
+        learner.learn()
+        self.assertEqual(learner.count_mispredictions(all_samples), 0)
+
+
+class TestDeleteIncorrectSchemas(unittest.TestCase):
+    def test_stacked(self):
+        learner = GreedySchemaLearner()
+        x = np.array([[1, 0, 0],
+                      [0, 1, 1]], dtype=bool)
+        y_creation = np.array([[1], [0]], dtype=bool)
+        y_destruction = np.array([[0], [1]], dtype=bool)
+        r = np.array([1, 1], dtype=bool)
+
+        # first schema of each set fires on first sample, second one on both
+        matrix = np.array([[1, 0],
+                           [0, 0],
+                           [0, 0]], dtype=bool)
+        learner.set_params([matrix], [matrix], [matrix])
+        learner._delete_incorrect_schemas(GreedySchemaLearner.Batch(x, y_creation, y_destruction, r))
+
+        W_pos, W_neg, R = learner.get_params()
+        self.assertTrue(np.array_equal(W_pos[0], matrix[:, :1]))
+        self.assertEqual(W_neg[0].shape[1], 0)
+        self.assertTrue(np.array_equal(R[0], matrix))
+
+
+class TestSolveLog(unittest.TestCase):
+    def test_survival(self):
+        with tempfile.TemporaryDirectory() as dir_name:
+            path = os.path.join(dir_name, 'solves.csv')
+            learner = GreedySchemaLearner()
+            learner._solve_log = SolveLog(path)
+
+            batches = _gen_toy_batches()
+            for batch in batches:
+                learner.take_batch(batch)
+            learner.learn()
+            self.assertFalse(os.path.exists(path))
+
+            # reward schemas fire on this sample, but reward is zero
+            ones = np.ones((1, 3), dtype=bool)
+            learner.take_batch(GreedySchemaLearner.Batch(ones, ones[:, :1], ones[:, :1], np.zeros(1, dtype=bool)))
+            learner.learn()
+
+            with open(path) as file:
+                records = list(csv.DictReader(file))
+
+        self.assertTrue(records)
+        for record in records:
+            self.assertEqual(record['run_id'], learner._solve_log.run_id)
+            self.assertEqual(record['learn_call'], '1')
+            if record['schema_type'] == str(learner.REWARD_T):
+                self.assertEqual(record['survived'], '0')
+            elif record['phase'] == 'simplify':
+                self.assertEqual(record['survived'], '1')
+
+    def test_removed_schemas(self):
+        with tempfile.TemporaryDirectory() as dir_name:
+            path = os.path.join(dir_name, 'solves.csv')
+            learner = GreedySchemaLearner()
+            learner._solve_log = SolveLog(path)
+
+            # second schema is subsumed by the first one, third one is replaced
+            schemas = np.array([[1, 0, 0], [1, 1, 0], [0, 0, 1]], dtype=bool)
+            for phase, schema_vec in zip(('pruned-kept', 'pruned', 'replaced'), schemas):
+                learner._solve_log.add_solve(phase=phase)
+                learner._get_param_matrix(learner.REWARD_T, None).add_vector(schema_vec)
+                learner._solve_log.assign_schema(learner.REWARD_T, None, schema_vec)
+
+            learner._prune_subsumed_schemas()
+            learner._replace_schemas(learner.REWARD_T, None, schemas[:1].T)
+            learner._solve_log.close()
+
+            with open(path) as file:
+                records = {record['phase']: record for record in csv.DictReader(file)}
+
+        self.assertEqual(records['pruned']['survived'], '0')
+        self.assertEqual(records['replaced']['survived'], '0')
+        # survival is unknown until next deletion of incorrect schemas
+        self.assertEqual(records['pruned-kept']['survived'], '')
+
+    def test_outdated_log(self):
+        with tempfile.TemporaryDirectory() as dir_name:
+            path = os.path.join(dir_name, 'solves.csv')
+            with open(path, 'w') as file:
+                file.write('learn_call,phase\n1,cluster\n')
+
+            solve_log = SolveLog(path)
+            solve_log.add_solve(learn_call=1, phase='cluster')
+            solve_log.close()
+
+            with open(path + '.old') as file:
+                self.assertEqual(file.readline().strip(), 'learn_call,phase')
+            with open(path) as file:
+                records = list(csv.DictReader(file))
+
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['run_id'], solve_log.run_id)
+        self.assertEqual(records[0]['phase'], 'cluster')